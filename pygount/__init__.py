@@ -6,7 +6,7 @@ Pygount counts lines of source code using pygments lexers.
 # All rights reserved. Distributed under the BSD License.
 from importlib.metadata import version
 
-from .analysis import DuplicatePool, SourceAnalysis, SourceScanner, SourceState, encoding_for
+from .analysis import DuplicatePool, MaxFileSizes, SourceAnalysis, SourceScanner, SourceState, encoding_for
 from .common import Error, OptionError
 from .summary import LanguageSummary, ProjectSummary
 
@@ -16,6 +16,7 @@ __all__ = [
     "DuplicatePool",
     "Error",
     "LanguageSummary",
+    "MaxFileSizes",
     "OptionError",
     "ProjectSummary",
     "SourceAnalysis",
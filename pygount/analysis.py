@@ -6,29 +6,51 @@ Functions to analyze source code and count lines in it.
 # All rights reserved. Distributed under the BSD License.
 import codecs
 import collections
+import contextlib
+import dataclasses
+import functools
 import glob
 import hashlib
+import heapq
 import itertools
 import logging
 import os
 import re
+import signal
+import sys
+import threading
 from collections.abc import Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
-from io import SEEK_CUR, BufferedIOBase, IOBase, RawIOBase, TextIOBase
+from io import SEEK_CUR, BufferedIOBase, BytesIO, IOBase, RawIOBase, TextIOBase
 from re import Pattern
 from typing import Optional, Union
 
+import git
 import pygments.lexer
 import pygments.lexers
 import pygments.token
 import pygments.util
 
+import pygount.chunks
 import pygount.common
+import pygount.lexer_index
 import pygount.lexers
+import pygount.scanners
+import pygount.timing
 import pygount.xmldialect
 from pygount.common import mapped_repr
-from pygount.git_storage import GitStorage, git_remote_url_and_revision_if_any
+from pygount.git_storage import (
+    GitStorage,
+    close_git_repos,
+    git_blob_data,
+    git_dir_for,
+    git_remote_url_and_revision_if_any,
+    git_tree_entries,
+    git_work_tree_paths,
+    unmodified_blob_ids,
+)
 
 GIT_REPO_REGEX = re.compile(r"^(https?://|git@)")
 
@@ -55,6 +77,45 @@ TokenType = type(pygments.token.Token)
 
 _BASE_LANGUAGE_REGEX = re.compile(r"^(?P<base_language>[^+]+)\+[^+].*$")
 
+#: Algorithms to hash files when looking for duplicates.
+VALID_HASH_ALGORITHMS = ("blake2b", "sha256")
+
+#: Default algorithm to hash files when looking for duplicates.
+DEFAULT_HASH_ALGORITHM = "blake2b"
+
+#: Engines to classify the lines of source code: "pygments" lexes all languages with pygments; "fast" uses the
+#: scanners of :py:mod:`pygount.scanners` for the languages they support and pygments for all others.
+VALID_ENGINES = ("pygments", "fast")
+
+#: Default engine to classify the lines of source code.
+DEFAULT_ENGINE = "pygments"
+
+#: Modes to count lines: "code" tells code, documentation, empty and string lines apart; "lines" only counts
+#: physical and empty lines without lexing, resulting in :py:attr:`SourceState.counted` with all non-empty lines
+#: counted as code.
+VALID_COUNT_MODES = ("code", "lines")
+
+#: Default mode to count lines.
+DEFAULT_COUNT_MODE = "code"
+
+#: Whether :py:func:`_lexing_time_limit()` can interrupt lexing on this platform.
+_HAS_LEXING_TIME_LIMIT = hasattr(signal, "setitimer")
+
+#: Lines that contain nothing but white space.
+_EMPTY_LINE_BYTES_REGEX = re.compile(rb"^[ \t\f\v]*$", re.MULTILINE)
+
+#: Number of bytes at the start and the end of a file to hash before hashing all of it to find duplicates.
+DUPLICATE_SAMPLE_SIZE = 64 * 1024
+
+#: Number of bytes to read at once when hashing a file.
+_HASH_BUFFER_SIZE = 1024 * 1024
+
+#: Maximum number of folders to scan in advance while the files of previous folders are still processed.
+_MAX_PREFETCHED_FOLDER_COUNT = 1024
+
+#: Number of bytes at the start of a file to check whether it is binary.
+PROBE_HEAD_SIZE = 8192
+
 #: BOMs to indicate that a file is a text file even if it contains zero bytes.
 _TEXT_BOMS = (codecs.BOM_UTF16_BE, codecs.BOM_UTF16_LE, codecs.BOM_UTF32_BE, codecs.BOM_UTF32_LE, codecs.BOM_UTF8)
 
@@ -76,9 +137,12 @@ class SourceState(Enum):
     error = 5
     #: source code has been generated
     generated = 6
-    # TODO: 'huge' = auto()  # source code exceeds size limit
     #: pygments does not offer any lexer to analyze the source
     unknown = 7
+    #: only the lines have been counted, see :py:data:`VALID_COUNT_MODES`
+    counted = 8
+    #: source code exceeds the size limit, see :py:class:`MaxFileSizes`
+    huge = 9
 
 
 #: Default patterns for regular expressions to detect generated code.
@@ -93,6 +157,23 @@ DEFAULT_GENERATED_PATTERNS_TEXT = pygount.common.REGEX_PATTERN_PREFIX + ", ".joi
     ]
 )
 
+_DEFAULT_GENERATED_REGEXES = pygount.common.regexes_from(DEFAULT_GENERATED_PATTERNS_TEXT)
+
+#: Number of lines at the start of source code that are checked for generated code.
+_GENERATED_LINE_COUNT = 15
+
+#: Inline flags at the start of a regular expression that apply to all of it.
+_GLOBAL_REGEX_FLAGS_REGEX = re.compile(r"^(?:\(\?[aiLmsux]+\))+")
+
+#: Flags that can be limited to a part of a regular expression.
+_SCOPED_REGEX_FLAGS = (
+    ("a", re.ASCII),
+    ("i", re.IGNORECASE),
+    ("m", re.MULTILINE),
+    ("s", re.DOTALL),
+    ("x", re.VERBOSE),
+)
+
 #: Default glob patterns for file names not to analyze.
 DEFAULT_NAME_PATTERNS_TO_SKIP_TEXT = ", ".join([".*", "*~"])
 
@@ -184,6 +265,98 @@ class PathData:
     source_path: str
     group: str
     tmp_dir: Optional[str] = None
+    #: If set, read the source code from the git blob ``blob_id`` in this repository instead of ``source_path``.
+    git_dir: Optional[str] = None
+    #: The ID of the git blob with the same content, if known.
+    blob_id: Optional[str] = None
+    #: The size in bytes, if already known.
+    size: Optional[int] = None
+    #: The result of ``os.stat()`` from scanning for files, if any.
+    stat_result: Optional[os.stat_result] = dataclasses.field(default=None, compare=False)
+
+    @property
+    def content_id(self) -> Optional[bytes]:
+        """
+        An ID for the content to pass to :py:meth:`DuplicatePool.duplicate_path()`, if known.
+        """
+        return bytes.fromhex(self.blob_id) if self.blob_id is not None else None
+
+
+@dataclass(frozen=True)
+class MaxFileSizes:
+    """
+    Maximum sizes of files to analyze. Larger files have the state
+    :py:attr:`SourceState.huge`, which only requires their size, so they are
+    not read at all. A size of 0 means no limit.
+    """
+
+    #: Maximum size in bytes of files in languages without a specific limit.
+    default: int = 0
+    #: Maximum size in bytes for specific languages, using the lower case name of their lexer.
+    language_to_size_map: dict[str, int] = dataclasses.field(default_factory=dict)
+
+    @staticmethod
+    def from_text(text: str) -> "MaxFileSizes":
+        """
+        The :py:class:`MaxFileSizes` described by ``text``, for example
+        "10M, json=1M, sql=0" for a limit of 10 MiB for all languages except
+        JSON with 1 MiB and SQL without a limit.
+        """
+        default = 0
+        language_to_size_map = {}
+        for item in text.split(","):
+            language, equals, size_text = item.rpartition("=")
+            size = pygount.common.size_from(size_text)
+            if equals:
+                language = language.strip().lower()
+                if language == "":
+                    raise ValueError(f"language must be specified before '=' but is missing: {item!r}")
+                language_to_size_map[language] = size
+            else:
+                default = size
+        return MaxFileSizes(default, language_to_size_map)
+
+    def max_size(self, source_path: str) -> int:
+        """
+        Maximum size of ``source_path`` in bytes, or 0 for no limit. If the
+        name of ``source_path`` matches several languages, the largest limit
+        of them applies, because its content is not known yet.
+        """
+        if len(self.language_to_size_map) == 0:
+            return self.default
+        sizes = [
+            self.language_to_size_map.get(language.lower(), self.default)
+            for language in pygount.lexer_index.lexer_index().languages(source_path)
+        ]
+        if len(sizes) == 0:
+            return self.default
+        return 0 if 0 in sizes else max(sizes)
+
+    def huge_message(self, source_path: str, source_size: int) -> Optional[str]:
+        """
+        A message why ``source_path`` is too large to analyze considering its
+        ``source_size``, or ``None`` if it is not.
+        """
+        max_size = self.max_size(source_path)
+        if max_size == 0 or source_size <= max_size:
+            return None
+        return f"size of {source_size} bytes exceeds maximum of {max_size} bytes"
+
+
+def huge_source_analysis(path_data: PathData, max_file_sizes: Optional[MaxFileSizes]) -> Optional["SourceAnalysis"]:
+    """
+    The analysis with :py:attr:`SourceState.huge` for ``path_data`` if its
+    size is already known and exceeds ``max_file_sizes``, otherwise ``None``.
+    """
+    result = None
+    if max_file_sizes is not None and path_data.size is not None:
+        huge_message = max_file_sizes.huge_message(path_data.source_path, path_data.size)
+        if huge_message is not None:
+            _log.info("%s: is huge because its %s", path_data.source_path, huge_message)
+            result = SourceAnalysis.from_state(
+                path_data.source_path, path_data.group, SourceState.huge, huge_message, path_data.tmp_dir
+            )
+    return result
 
 
 def is_markup_file(source_path: str) -> bool:
@@ -193,44 +366,256 @@ def is_markup_file(source_path: str) -> bool:
 class DuplicatePool:
     """
     A pool that collects information about potential duplicate files.
+
+    Files can have a precomputed content ID, for example their git blob ID,
+    which allows to detect duplicates without reading them. Only if files of
+    the same size lack such an ID, they are compared by hashing. To avoid
+    reading large files completely, first only a sample of their start and
+    end is hashed, and only if these samples are the same, the whole content.
+
+    If all paths are known in advance, :py:meth:`prepare()` finds all
+    duplicates at once and hashes files in parallel.
+
+    :param hash_algorithm: the algorithm to hash the content, one of
+      :py:data:`VALID_HASH_ALGORITHMS`
     """
 
-    def __init__(self):
-        self._size_to_paths_map = {}
+    def __init__(self, hash_algorithm: str = DEFAULT_HASH_ALGORITHM):
+        assert hash_algorithm in VALID_HASH_ALGORITHMS, f"hash_algorithm={hash_algorithm!r}"
+        self._hash_algorithm = hash_algorithm
+        #: Buffers to read files to hash into, so they have to be allocated only once per thread.
+        self._thread_local = threading.local()
+        #: Results of :py:meth:`duplicate_path()` computed in advance by :py:meth:`prepare()`.
+        self._path_to_prepared_duplicate_path_map = {}
+        #: For each size whether all paths of this size so far have a content ID.
+        self._size_to_has_only_content_ids_map = {}
+        #: For each size the paths whose sample hash has not been computed yet.
+        self._size_to_unsampled_paths_map = {}
+        #: For each size and sample hash the paths whose hash has not been computed yet.
+        self._size_and_sample_hash_to_unhashed_paths_map = {}
+        self._size_and_content_id_to_path_map = {}
+        self._size_and_sample_hash_to_path_map = {}
         self._size_and_hash_to_path_map = {}
+        self._path_to_sample_hash_map = {}
+        self._path_to_hash_map = {}
+
+    @property
+    def hash_algorithm(self) -> str:
+        return self._hash_algorithm
+
+    @property
+    def _buffer(self) -> bytearray:
+        result = getattr(self._thread_local, "buffer", None)
+        if result is None:
+            result = bytearray(_HASH_BUFFER_SIZE)
+            self._thread_local.buffer = result
+        return result
 
     @staticmethod
-    def _hash_for(path_to_hash):
-        buffer_size = 1024 * 1024
-        sha256_hash = hashlib.sha256()
-        with open(path_to_hash, "rb", buffer_size) as file_to_hash:
-            data = file_to_hash.read(buffer_size)
-            while len(data) >= 1:
-                sha256_hash.update(data)
-                data = file_to_hash.read(buffer_size)
-        return sha256_hash.digest()
-
-    def duplicate_path(self, source_path: str) -> Optional[str]:
+    def hash_for(
+        path_to_hash: str, hash_algorithm: str = DEFAULT_HASH_ALGORITHM, buffer: Optional[bytearray] = None
+    ) -> bytes:
+        """
+        Hash of the content of ``path_to_hash``.
+
+        :param buffer: a buffer to read the file into, which can be reused for
+          multiple calls to avoid allocating memory for each chunk read
+        """
+        if buffer is None:
+            buffer = bytearray(_HASH_BUFFER_SIZE)
+        content_hash = hashlib.new(hash_algorithm)
+        with open(path_to_hash, "rb", buffering=0) as file_to_hash, memoryview(buffer) as buffer_view:
+            chunk_size = file_to_hash.readinto(buffer_view)
+            while chunk_size >= 1:
+                with buffer_view[:chunk_size] as chunk_view:
+                    content_hash.update(chunk_view)
+                chunk_size = file_to_hash.readinto(buffer_view)
+        return content_hash.digest()
+
+    def _sample_hash_for(self, source_path: str, source_size: int, data: Optional[bytes]) -> bytes:
+        """
+        Hash of the first and last :py:data:`DUPLICATE_SAMPLE_SIZE` bytes of
+        ``source_path``, which for small files is the hash of the whole content.
+        """
+        if data is not None:
+            sample = (
+                data
+                if source_size <= 2 * DUPLICATE_SAMPLE_SIZE
+                else data[:DUPLICATE_SAMPLE_SIZE] + data[-DUPLICATE_SAMPLE_SIZE:]
+            )
+            result = hashlib.new(self._hash_algorithm, sample).digest()
+        elif source_size <= 2 * DUPLICATE_SAMPLE_SIZE:
+            result = self.content_hash(source_path)
+        else:
+            sample_hash = hashlib.new(self._hash_algorithm)
+            with open(source_path, "rb", buffering=0) as file_to_sample, memoryview(self._buffer) as buffer_view:
+                for sample_offset in (0, source_size - DUPLICATE_SAMPLE_SIZE):
+                    file_to_sample.seek(sample_offset)
+                    sample_size = 0
+                    while sample_size < DUPLICATE_SAMPLE_SIZE:
+                        with buffer_view[sample_size:DUPLICATE_SAMPLE_SIZE] as remaining_view:
+                            chunk_size = file_to_sample.readinto(remaining_view)
+                        if chunk_size == 0:
+                            break
+                        sample_size += chunk_size
+                    with buffer_view[:sample_size] as sample_view:
+                        sample_hash.update(sample_view)
+            result = sample_hash.digest()
+        return result
+
+    def content_hash(self, source_path: str, data: Optional[bytes] = None) -> bytes:
+        """
+        Same as :py:meth:`hash_for()` but remembers the result, so each path
+        is hashed at most once.
+
+        :param data: the content of ``source_path`` if it has already been read
+        """
+        result = self._path_to_hash_map.get(source_path)
+        if result is None:
+            result = (
+                DuplicatePool.hash_for(source_path, self._hash_algorithm, self._buffer)
+                if data is None
+                else hashlib.new(self._hash_algorithm, data).digest()
+            )
+            self._path_to_hash_map[source_path] = result
+        return result
+
+    def _sample_hash(self, source_path: str, source_size: int, data: Optional[bytes] = None) -> bytes:
+        result = self._path_to_sample_hash_map.get(source_path)
+        if result is None:
+            result = self._sample_hash_for(source_path, source_size, data)
+            self._remember_sample_hash(source_path, source_size, result)
+        return result
+
+    def _remember_sample_hash(self, source_path: str, source_size: int, sample_hash: bytes):
+        self._path_to_sample_hash_map[source_path] = sample_hash
+        if source_size <= 2 * DUPLICATE_SAMPLE_SIZE:
+            # The sample covers the whole content.
+            self._path_to_hash_map[source_path] = sample_hash
+
+    def _duplicate_path_with_same_sample(
+        self, source_path: str, source_size: int, data: Optional[bytes] = None
+    ) -> Optional[str]:
+        sample_hash = self._sample_hash(source_path, source_size, data)
+        if source_size <= 2 * DUPLICATE_SAMPLE_SIZE:
+            result = self._size_and_sample_hash_to_path_map.get((source_size, sample_hash))
+            self._size_and_sample_hash_to_path_map[(source_size, sample_hash)] = source_path
+        else:
+            unhashed_paths = self._size_and_sample_hash_to_unhashed_paths_map.get((source_size, sample_hash))
+            if unhashed_paths is None:
+                self._size_and_sample_hash_to_unhashed_paths_map[(source_size, sample_hash)] = [source_path]
+                result = None
+            else:
+                # Retrofit the previous paths with the same sample and their hash.
+                for unhashed_path in unhashed_paths:
+                    self._size_and_hash_to_path_map[(source_size, self.content_hash(unhashed_path))] = unhashed_path
+                unhashed_paths.clear()
+                source_hash = self.content_hash(source_path, data)
+                result = self._size_and_hash_to_path_map.get((source_size, source_hash))
+                self._size_and_hash_to_path_map[(source_size, source_hash)] = source_path
+        return result
+
+    @pygount.timing.timed(pygount.timing.Phase.duplicate_hashing)
+    def duplicate_path(
+        self,
+        source_path: str,
+        source_size: Optional[int] = None,
+        content_id: Optional[bytes] = None,
+        data: Optional[bytes] = None,
+    ) -> Optional[str]:
         """
         Path to a duplicate for ``source_path`` or ``None`` if no duplicate exists.
 
         Internally information is stored to identify possible future duplicates of
         ``source_path``.
+
+        :param source_size: the size of ``source_path`` if already known
+        :param content_id: an ID that is the same for all files with the same
+          content, for example a git blob ID, or ``None`` if ``source_path``
+          has to be hashed to compare it with other files of the same size
+        :param data: the content of ``source_path`` if it has already been read
+        """
+        try:
+            result = self._path_to_prepared_duplicate_path_map.pop(source_path)
+        except KeyError:
+            if source_size is None:
+                source_size = os.path.getsize(source_path)
+            result = self._unprepared_duplicate_path(source_path, source_size, content_id, data)
+        return result
+
+    @pygount.timing.timed(pygount.timing.Phase.duplicate_hashing)
+    def prepare(self, path_datas: Sequence[PathData], max_workers: Optional[int] = None):
         """
+        Find the duplicates for all ``path_datas`` in advance, so that
+        :py:meth:`duplicate_path()` only has to look them up later. Only
+        files with the same size as others are hashed, using ``max_workers``
+        threads in parallel.
+        """
+        paths_sizes_and_content_ids = [
+            (
+                path_data.source_path,
+                path_data.size if path_data.size is not None else os.path.getsize(path_data.source_path),
+                path_data.content_id,
+            )
+            for path_data in path_datas
+        ]
+        size_to_paths_and_content_ids_map = collections.defaultdict(list)
+        for source_path, source_size, content_id in paths_sizes_and_content_ids:
+            size_to_paths_and_content_ids_map[source_size].append((source_path, content_id))
+        paths_and_sizes_to_sample = [
+            (source_path, source_size)
+            for source_size, paths_and_content_ids in size_to_paths_and_content_ids_map.items()
+            if len(paths_and_content_ids) >= 2 and any(content_id is None for _, content_id in paths_and_content_ids)
+            for source_path, _ in paths_and_content_ids
+        ]
+        with ThreadPoolExecutor(max_workers) as executor:
+            # NOTE: hashlib releases the GIL, so threads can hash in parallel.
+            sample_hashes = executor.map(
+                lambda path_and_size: self._sample_hash_for(*path_and_size, None), paths_and_sizes_to_sample
+            )
+            size_and_sample_hash_to_paths_map = collections.defaultdict(list)
+            for (source_path, source_size), sample_hash in zip(paths_and_sizes_to_sample, sample_hashes):
+                self._remember_sample_hash(source_path, source_size, sample_hash)
+                if source_size > 2 * DUPLICATE_SAMPLE_SIZE:
+                    size_and_sample_hash_to_paths_map[(source_size, sample_hash)].append(source_path)
+            paths_to_hash = [
+                source_path
+                for paths_with_same_sample in size_and_sample_hash_to_paths_map.values()
+                if len(paths_with_same_sample) >= 2
+                for source_path in paths_with_same_sample
+            ]
+            content_hashes = executor.map(
+                lambda source_path: DuplicatePool.hash_for(source_path, self._hash_algorithm, self._buffer),
+                paths_to_hash,
+            )
+            for source_path, content_hash in zip(paths_to_hash, content_hashes):
+                self._path_to_hash_map[source_path] = content_hash
+        # With all hashes known, finding the duplicates does not require reading any more files.
+        for source_path, source_size, content_id in paths_sizes_and_content_ids:
+            self._path_to_prepared_duplicate_path_map[source_path] = self._unprepared_duplicate_path(
+                source_path, source_size, content_id
+            )
+
+    def _unprepared_duplicate_path(
+        self, source_path: str, source_size: int, content_id: Optional[bytes] = None, data: Optional[bytes] = None
+    ) -> Optional[str]:
         result = None
-        source_size = os.path.getsize(source_path)
-        paths_with_same_size = self._size_to_paths_map.get(source_size)
-        if paths_with_same_size is None:
-            self._size_to_paths_map[source_size] = [source_path]
+        has_only_content_ids = self._size_to_has_only_content_ids_map.get(source_size)
+        if has_only_content_ids is None:
+            self._size_to_has_only_content_ids_map[source_size] = content_id is not None
+            self._size_to_unsampled_paths_map[source_size] = [source_path]
+            if content_id is not None:
+                self._size_and_content_id_to_path_map[(source_size, content_id)] = source_path
+        elif has_only_content_ids and content_id is not None:
+            result = self._size_and_content_id_to_path_map.get((source_size, content_id))
+            self._size_and_content_id_to_path_map[(source_size, content_id)] = source_path
+            self._size_to_unsampled_paths_map[source_size].append(source_path)
         else:
-            source_hash = DuplicatePool._hash_for(source_path)
-            if len(paths_with_same_size) == 1:
-                # Retrofit the initial path with the same size and its hash.
-                initial_path_with_same_size = paths_with_same_size[0]
-                initial_hash = DuplicatePool._hash_for(initial_path_with_same_size)
-                self._size_and_hash_to_path_map[(source_size, initial_hash)] = initial_path_with_same_size
-            result = self._size_and_hash_to_path_map.get((source_size, source_hash))
-            self._size_and_hash_to_path_map[(source_size, source_hash)] = source_path
+            self._size_to_has_only_content_ids_map[source_size] = False
+            # Retrofit the previous paths with the same size and their sample hash.
+            for unsampled_path in self._size_to_unsampled_paths_map.pop(source_size, []):
+                self._duplicate_path_with_same_sample(unsampled_path, source_size)
+            result = self._duplicate_path_with_same_sample(source_path, source_size, data)
         return result
 
 
@@ -253,6 +638,7 @@ class SourceAnalysis:
         string: int,
         state: SourceState,
         state_info: Optional[str] = None,
+        is_approximate: bool = False,
     ):
         SourceAnalysis._check_state_info(state, state_info)
         self._path = path
@@ -264,6 +650,7 @@ class SourceAnalysis:
         self._string = string
         self._state = state
         self._state_info = state_info
+        self._is_approximate = is_approximate
 
     @staticmethod
     def from_state(
@@ -300,7 +687,12 @@ class SourceAnalysis:
             f"state_info must be be None or str but is: {state_info!r}"
         )
 
-        states_that_require_state_info = [SourceState.duplicate, SourceState.error, SourceState.generated]
+        states_that_require_state_info = [
+            SourceState.duplicate,
+            SourceState.error,
+            SourceState.generated,
+            SourceState.huge,
+        ]
         assert (state in states_that_require_state_info) == (state_info is not None), (
             f"state={state} and state_info={state_info} "
             f"but state_info must be specified for the following states: {states_that_require_state_info}"
@@ -317,6 +709,12 @@ class SourceAnalysis:
         file_handle: Optional[IOBase] = None,
         merge_embedded_language: bool = False,
         tmp_dir: Optional[str] = None,
+        disambiguation_size: int = pygount.lexer_index.DEFAULT_DISAMBIGUATION_SIZE,
+        engine: str = DEFAULT_ENGINE,
+        count_mode: str = DEFAULT_COUNT_MODE,
+        chunk_size: int = pygount.chunks.DEFAULT_CHUNK_SIZE,
+        max_file_sizes: Optional[MaxFileSizes] = None,
+        lexing_budget: float = 0,
     ) -> "SourceAnalysis":
         """
         Factory method to create a :py:class:`SourceAnalysis` by analyzing
@@ -340,94 +738,296 @@ class SourceAnalysis:
           "JavaScript".
         :param tmp_dir: If a temporary directory was created, strip it from the path name. This happens
           right now only for git repositories.
+        :param disambiguation_size: number of characters at the start of the source code to analyze if
+          several lexers match its name, see :py:meth:`pygount.lexer_index.LexerIndex.guess_lexer_for_filename`.
+        :param engine: engine to classify lines, one of :py:data:`VALID_ENGINES`.
+        :param count_mode: mode to count lines, one of :py:data:`VALID_COUNT_MODES`. With "lines", only the
+          start of the source code is decoded to find its language and the lines are counted in its raw data.
+        :param chunk_size: number of bytes above which a file is read, decoded and lexed in chunks of this size
+          so memory stays bounded, provided its lexer supports this, see :py:func:`pygount.chunks.is_chunkable`.
+        :param max_file_sizes: :py:class:`MaxFileSizes` above which files are not read but result in
+          :py:attr:`SourceState.huge`, or ``None`` to analyze files of any size.
+        :param lexing_budget: milliseconds per KiB of source code to lex it with its pygments lexer, or 0 for no
+          limit. If lexing takes longer, the source code is counted again using a
+          :py:func:`pygount.lexers.minimalistic_lexer`, and :py:attr:`is_approximate` is ``True``.
         """
         assert encoding is not None
+        assert engine in VALID_ENGINES, f"engine={engine!r}"
+        assert count_mode in VALID_COUNT_MODES, f"count_mode={count_mode!r}"
+        assert chunk_size >= 1
+        is_counting_lines = count_mode == "lines"
+        is_chunked = False
+        is_approximate = False
 
         result = None
         lexer = None
         source_code = None
+        source_data = None
+        source_size = None
+        data_to_count = None
+        #: Encoding to restart with if decoding chunks fails with the current one.
+        restart_encoding = None
+        actual_generated_regexes = generated_regexes if generated_regexes is not None else _DEFAULT_GENERATED_REGEXES
+        has_checked_generated = len(actual_generated_regexes) == 0
         if file_handle is None:
-            source_size = os.path.getsize(source_path)
-            if source_size == 0:
-                _log.info("%s: is empty", source_path)
-                result = SourceAnalysis.from_state(source_path, group, SourceState.empty)
-            elif is_binary_file(source_path):
-                _log.info("%s: is binary", source_path)
-                result = SourceAnalysis.from_state(source_path, group, SourceState.binary)
-            elif not has_lexer(source_path):
-                _log.info("%s: unknown language", source_path)
-                result = SourceAnalysis.from_state(source_path, group, SourceState.unknown)
+            with FileProbe(source_path) as file_probe:
+                source_size = file_probe.size
+                huge_message = max_file_sizes.huge_message(source_path, source_size) if max_file_sizes else None
+                if source_size == 0:
+                    _log.info("%s: is empty", source_path)
+                    result = SourceAnalysis.from_state(source_path, group, SourceState.empty)
+                elif huge_message is not None:
+                    _log.info("%s: is huge because its %s", source_path, huge_message)
+                    result = SourceAnalysis.from_state(source_path, group, SourceState.huge, huge_message, tmp_dir)
+                elif is_binary_data(file_probe.head()):
+                    _log.info("%s: is binary", source_path)
+                    result = SourceAnalysis.from_state(source_path, group, SourceState.binary)
+                elif not has_lexer(source_path):
+                    _log.info("%s: unknown language", source_path)
+                    result = SourceAnalysis.from_state(source_path, group, SourceState.unknown)
+                elif not has_checked_generated and encoding != "chardet":
+                    # Check for generated code using only the head, so generated files do not have to be read
+                    # entirely. Whether the whole file can be decoded using UTF-8 cannot be told from the head, so
+                    # without a BOM or an encoding declaration in the head, it is decoded as UTF-8 with characters
+                    # that cannot be decoded replaced. This is good enough to find the generated patterns.
+                    head = file_probe.head()
+                    head_encoding = (
+                        encoding_for(source_path, encoding, fallback_encoding or "utf-8", data=head)
+                        if encoding == "automatic"
+                        else encoding
+                    )
+                    try:
+                        head_lines = _head_lines(
+                            decoded_head_text(head, head_encoding, 0), len(head) == source_size, _GENERATED_LINE_COUNT
+                        )
+                    except LookupError:
+                        # Let the analysis report the unknown encoding.
+                        head_lines = None
+                    if head_lines is not None:
+                        has_checked_generated = True
+                        generated_message = _generated_message(head_lines, actual_generated_regexes)
+                        if generated_message is not None:
+                            _log.info("%s: is generated code because %s", source_path, generated_message)
+                            result = SourceAnalysis.from_state(
+                                source_path, group, SourceState.generated, generated_message
+                            )
+                if result is None:
+                    try:
+                        if not is_counting_lines and source_size > chunk_size:
+                            # Read only the head to find encoding and language, and the rest later in chunks.
+                            is_chunked = True
+                            source_data = file_probe.head(
+                                chunk_size
+                                if disambiguation_size == 0
+                                else min(chunk_size, max(PROBE_HEAD_SIZE, 4 * disambiguation_size))
+                            )
+                        else:
+                            source_data = file_probe.data()
+                    except OSError as error:
+                        _log.warning("cannot read %s: %s", source_path, error)
+                        result = SourceAnalysis.from_state(source_path, group, SourceState.error, str(error))
+            _log.debug("%s: probed with %d system calls", source_path, file_probe.system_call_count)
         if duplicate_pool is not None:
-            duplicate_path = duplicate_pool.duplicate_path(source_path)
+            duplicate_path = duplicate_pool.duplicate_path(
+                source_path, source_size, data=None if is_chunked else source_data
+            )
             if duplicate_path is not None:
                 _log.info("%s: is a duplicate of %s", source_path, duplicate_path)
                 result = SourceAnalysis.from_state(source_path, group, SourceState.duplicate, duplicate_path)
         if result is None:
             try:
                 if file_handle is None:
-                    if encoding in ("automatic", "chardet"):
-                        encoding = encoding_for(source_path, encoding, fallback_encoding)
-                    with open(source_path, encoding=encoding) as source_file:
-                        source_code = source_file.read()
+                    if is_chunked and encoding == "automatic" and fallback_encoding is None:
+                        # Whether the whole file can be decoded using UTF-8 is only known after reading all of it,
+                        # so without a BOM or an encoding declaration start with UTF-8 and restart if it fails.
+                        encoding = encoding_for(source_path, encoding, "utf-8", data=source_data)
+                        if encoding == "utf-8":
+                            restart_encoding = DEFAULT_FALLBACK_ENCODING
+                    elif encoding in ("automatic", "chardet"):
+                        encoding = encoding_for(source_path, encoding, fallback_encoding, data=source_data)
                 elif not isinstance(file_handle, TextIOBase):
                     if encoding in ("automatic", "chardet"):
                         encoding = encoding_for(source_path, encoding, fallback_encoding, file_handle=file_handle)
-                    source_code = file_handle.read().decode(encoding)
+                    source_data = file_handle.read()
+                    if not is_counting_lines:
+                        source_code = source_data.decode(encoding)
                 else:
                     source_code = file_handle.read()
+                    if is_counting_lines:
+                        source_data = source_code.encode("utf-8")
+                        encoding = "utf-8"
+                if is_counting_lines:
+                    data_to_count = ascii_compatible_data(source_data, encoding)
+                    if source_code is None:
+                        source_code = decoded_head_text(source_data, encoding, disambiguation_size)
+                elif is_chunked:
+                    source_code = decoded_head_text(source_data, encoding, 0)
+                    lexer = guess_lexer(source_path, source_code, disambiguation_size)
+                    if not pygount.chunks.is_chunkable(lexer):
+                        _log.debug("%s: cannot lex %s in chunks, reading it entirely", source_path, lexer.name)
+                        is_chunked = False
+                        with FileProbe(source_path) as file_probe:
+                            source_data = file_probe.data()
+                        if restart_encoding is not None:
+                            encoding = encoding_for(source_path, "automatic", fallback_encoding, data=source_data)
+                            restart_encoding = None
+                        source_code = decoded_text(source_data, encoding)
+                elif source_code is None:
+                    source_code = decoded_text(source_data, encoding)
             except (LookupError, OSError, UnicodeError) as error:
                 _log.warning("cannot read %s using encoding %s: %s", source_path, encoding, error)
                 result = SourceAnalysis.from_state(source_path, group, SourceState.error, str(error))
-            if result is None:
-                lexer = guess_lexer(source_path, source_code)
-                assert lexer is not None
-        actual_generated_regexes = (
-            generated_regexes
-            if generated_regexes is not None
-            else pygount.common.regexes_from(DEFAULT_GENERATED_PATTERNS_TEXT)
-        )
-        if (result is None) and (len(actual_generated_regexes) != 0):
-            number_line_and_regex = matching_number_line_and_regex(
-                pygount.common.lines(source_code), actual_generated_regexes
-            )
-            if number_line_and_regex is not None:
-                number, _, regex = number_line_and_regex
-                message = f"line {number} matches {regex}"
-                _log.info("%s: is generated code because %s", source_path, message)
-                result = SourceAnalysis.from_state(source_path, group, SourceState.generated, message)
+        if (result is None) and not has_checked_generated:
+            generated_message = _generated_message(pygount.common.lines(source_code), actual_generated_regexes)
+            if generated_message is not None:
+                _log.info("%s: is generated code because %s", source_path, generated_message)
+                result = SourceAnalysis.from_state(source_path, group, SourceState.generated, generated_message)
         if result is None:
-            assert lexer is not None
             assert source_code is not None
+            if lexer is None:
+                lexer = guess_lexer(source_path, source_code, disambiguation_size)
+            assert lexer is not None
             language = base_language(lexer.name) if merge_embedded_language else lexer.name
             if ("xml" in language.lower()) or (language == "Genshi"):
                 dialect = pygount.xmldialect.xml_dialect(source_path, source_code)
                 if dialect is not None:
                     language = dialect
-            _log.info("%s: analyze as %s using encoding %s", source_path, language, encoding)
-            mark_to_count_map = {"c": 0, "d": 0, "e": 0, "s": 0}
-            is_markup = is_markup_file(source_path)
-            for line_parts in _line_parts(lexer, source_code, is_markup=is_markup):
-                mark_to_increment = "e"
-                for mark_to_check in ("d", "s", "c"):
-                    if mark_to_check in line_parts:
-                        mark_to_increment = mark_to_check
-                mark_to_count_map[mark_to_increment] += 1
+            if is_counting_lines:
+                _log.info("%s: count lines as %s using encoding %s", source_path, language, encoding)
+                code_count, documentation_count, empty_count, string_count = _physical_line_counts(data_to_count)
+                state = SourceState.counted
+            else:
+                is_markup = is_markup_file(source_path)
+                cut_positions = []
+
+                def line_counts(lexer_to_count_with: pygments.lexer.Lexer) -> tuple[int, int, int, int]:
+                    nonlocal encoding, restart_encoding
+                    if is_chunked:
+                        cut_positions.clear()
+                        try:
+                            return _chunked_line_counts(
+                                source_path, lexer_to_count_with, encoding, chunk_size, is_markup, cut_positions
+                            )
+                        except UnicodeDecodeError as error:
+                            if restart_encoding is None:
+                                raise
+                            _log.info(
+                                "%s: cannot decode chunk using %s, restarting with %s: %s",
+                                source_path,
+                                encoding,
+                                restart_encoding,
+                                error,
+                            )
+                            encoding = restart_encoding
+                            restart_encoding = None
+                            return line_counts(lexer_to_count_with)
+                    return _line_counts(_line_marks(lexer_to_count_with, source_code, is_markup, engine))
+
+                _log.info(
+                    "%s: analyze as %s%s using encoding %s",
+                    source_path,
+                    language,
+                    " in chunks" if is_chunked else "",
+                    encoding,
+                )
+                source_byte_count = source_size if source_size is not None else len(source_code)
+                source_kib = max(1.0, source_byte_count / 1024)
+                tokenizing_timer = pygount.timing.PhaseTimer(pygount.timing.Phase.tokenizing)
+                try:
+                    with tokenizing_timer:
+                        try:
+                            with _lexing_time_limit(lexing_budget * source_kib / 1000):
+                                code_count, documentation_count, empty_count, string_count = line_counts(lexer)
+                        except _LexingTimeExceededError:
+                            _log.warning(
+                                "%s: lexing as %s exceeded %s ms per KiB, counting approximately",
+                                source_path,
+                                lexer.name,
+                                lexing_budget,
+                            )
+                            is_approximate = True
+                            code_count, documentation_count, empty_count, string_count = line_counts(
+                                pygount.lexers.minimalistic_lexer(lexer.name)
+                            )
+                    if len(cut_positions) >= 1:
+                        _log.warning(
+                            "%s: lexing as %s in chunks had to cut %d times within a token, counting approximately",
+                            source_path,
+                            lexer.name,
+                            len(cut_positions),
+                        )
+                        is_approximate = True
+                    pygount.timing.phase_statistics().add_tokenizing(
+                        language,
+                        tokenizing_timer.duration,
+                        source_byte_count,
+                        code_count + documentation_count + empty_count + string_count,
+                    )
+                except (OSError, UnicodeError) as error:
+                    _log.warning("cannot read %s using encoding %s: %s", source_path, encoding, error)
+                    result = SourceAnalysis.from_state(source_path, group, SourceState.error, str(error))
+                state = SourceState.analyzed
+        if result is None:
             reduced_path = source_path.split(tmp_dir)[-1].lstrip(os.sep) if tmp_dir else source_path
             result = SourceAnalysis(
                 path=reduced_path,
                 language=language,
                 group=group,
-                code=mark_to_count_map["c"],
-                documentation=mark_to_count_map["d"],
-                empty=mark_to_count_map["e"],
-                string=mark_to_count_map["s"],
-                state=SourceState.analyzed,
+                code=code_count,
+                documentation=documentation_count,
+                empty=empty_count,
+                string=string_count,
+                state=state,
                 state_info=None,
+                is_approximate=is_approximate,
             )
 
         assert result is not None
         return result
 
+    @staticmethod
+    def from_path_data(path_data: PathData, **analysis_options) -> "SourceAnalysis":
+        """
+        Factory method to create a :py:class:`SourceAnalysis` for ``path_data``,
+        which reads the source code from a git blob if ``path_data.git_dir`` is
+        set, and otherwise from the file.
+
+        :param analysis_options: further options passed to :py:meth:`from_file()`
+        """
+        result = huge_source_analysis(path_data, analysis_options.get("max_file_sizes"))
+        file_handle = None
+        if result is None and path_data.git_dir is not None:
+            source_path = path_data.source_path
+            group = path_data.group
+            # Check the same conditions in the same order as from_file() does for files.
+            if path_data.size == 0:
+                _log.info("%s: is empty", source_path)
+                result = SourceAnalysis.from_state(source_path, group, SourceState.empty)
+            else:
+                try:
+                    source_data = git_blob_data(path_data.git_dir, path_data.blob_id)
+                except (OSError, ValueError) as error:
+                    _log.warning("cannot read %s from git blob %s: %s", source_path, path_data.blob_id, error)
+                    result = SourceAnalysis.from_state(source_path, group, SourceState.error, str(error))
+                else:
+                    if is_binary_data(source_data):
+                        _log.info("%s: is binary", source_path)
+                        result = SourceAnalysis.from_state(source_path, group, SourceState.binary)
+                    elif not has_lexer(source_path):
+                        _log.info("%s: unknown language", source_path)
+                        result = SourceAnalysis.from_state(source_path, group, SourceState.unknown)
+                    else:
+                        file_handle = BytesIO(source_data)
+        if result is None:
+            result = SourceAnalysis.from_file(
+                path_data.source_path,
+                path_data.group,
+                file_handle=file_handle,
+                tmp_dir=path_data.tmp_dir,
+                **analysis_options,
+            )
+        return result
+
     @property
     def path(self) -> str:
         return self._path
@@ -511,12 +1111,20 @@ class SourceAnalysis:
         """
         return self._state_info
 
+    @property
+    def is_approximate(self) -> bool:
+        """
+        ``True`` if the counts are only approximate because lexing took too
+        long, see the ``lexing_budget`` of :py:meth:`from_file()`.
+        """
+        return self._is_approximate
+
     @property
     def is_countable(self) -> bool:
         """
         ``True`` if source counts can be counted towards a total.
         """
-        return self.state in (SourceState.analyzed, SourceState.duplicate)
+        return self.state in (SourceState.analyzed, SourceState.counted, SourceState.duplicate)
 
     def __repr__(self):
         name_to_value_map = {
@@ -525,7 +1133,7 @@ class SourceAnalysis:
             "group": repr(self.group),
             "state": self.state.name,
         }
-        if self.state == SourceState.analyzed:
+        if self.state in (SourceState.analyzed, SourceState.counted):
             name_to_value_map.update(
                 {
                     "code_count": self.code_count,
@@ -536,12 +1144,26 @@ class SourceAnalysis:
             )
         if self.state_info is not None:
             name_to_value_map["state_info"] = repr(self.state_info)
+        if self.is_approximate:
+            name_to_value_map["is_approximate"] = True
         return mapped_repr(self, name_to_value_map)
 
 
+def _path_data_sort_key(path_data: PathData) -> tuple[str, str]:
+    return path_data.source_path, path_data.group
+
+
 class SourceScanner:
     """
     Scanner for source code files matching certain conditions.
+
+    If ``git_ref`` is set, the source patterns must be git repositories, and
+    the files are read from the git tree at ``git_ref`` instead of a working
+    tree. Remote repositories are then cloned without a working tree.
+
+    If ``has_git_files`` is set, folders in git working trees are not walked.
+    Instead, git lists the files tracked by it and untracked files that are
+    not ignored.
     """
 
     def __init__(
@@ -550,8 +1172,12 @@ class SourceScanner:
         suffixes="*",
         folders_to_skip=None,
         name_to_skip=None,
+        git_ref: Optional[str] = None,
+        has_git_files: bool = False,
     ):
         self._source_patterns = source_patterns
+        self._git_ref = git_ref
+        self._has_git_files = has_git_files
         self._suffixes = pygount.common.regexes_from(suffixes)
         self._folder_regexps_to_skip = (
             folders_to_skip
@@ -564,8 +1190,16 @@ class SourceScanner:
             else pygount.common.regexes_from(DEFAULT_NAME_PATTERNS_TO_SKIP_TEXT)
         )
         self._git_storages = []
+        #: Root folders of git working trees and the blob IDs of their unmodified files.
+        self._work_tree_roots_and_blob_ids = []
+        self._scan_executor = None
+        self._prefetch_semaphore = None
+        self._folder_matcher_to_skip = None
+        self._name_matcher_to_skip = None
+        self._suffix_matcher = None
 
     def close(self):
+        close_git_repos()
         for git_storage in self._git_storages:
             git_storage.close()
 
@@ -604,25 +1238,167 @@ class SourceScanner:
 
     def _is_path_to_skip(self, name, is_folder) -> bool:
         assert os.sep not in name, f"name={name!r}"
-        regexps_to_skip = self._folder_regexps_to_skip if is_folder else self._name_regexps_to_skip
-        return any(path_name_to_skip_regex.match(name) is not None for path_name_to_skip_regex in regexps_to_skip)
+        matcher_to_skip = self._folder_matcher_to_skip if is_folder else self._name_matcher_to_skip
+        return matcher_to_skip.matches(name)
+
+    def _is_suffix_to_analyze(self, path) -> bool:
+        suffix = os.path.splitext(path)[1].lstrip(".")
+        result = self._suffix_matcher.matches(suffix)
+        if not result:
+            _log.info("skip due to suffix: %s", path)
+        return result
 
-    def _paths_and_group_to_analyze_in(self, folder, group, tmp_dir) -> PathData:
+    def _paths_and_group_to_analyze_in(self, folder, group, tmp_dir) -> Iterator[PathData]:
+        """
+        All files in ``folder`` and its sub folders in sorted order. While
+        they are yielded, other threads already scan the sub folders to come.
+        """
         assert folder is not None
         assert group is not None
 
-        for name in os.listdir(folder):
-            path = os.path.join(folder, name)
-            if not os.path.islink(path):
-                is_folder = os.path.isdir(path)
-                if self._is_path_to_skip(os.path.basename(path), is_folder):
-                    _log.debug("skip due to matching skip pattern: %s", path)
-                elif is_folder:
-                    yield from self._paths_and_group_to_analyze_in(path, group, tmp_dir)
-                else:
-                    yield PathData(source_path=path, group=group, tmp_dir=tmp_dir)
+        yield from self._sorted_paths_in(folder, None, group, tmp_dir)
+
+    def _sorted_paths_in(
+        self, folder: str, paths_and_folders_future: Optional[Future], group, tmp_dir
+    ) -> Iterator[PathData]:
+        if paths_and_folders_future is not None:
+            path_datas, sub_folders_and_futures = paths_and_folders_future.result()
+            self._prefetch_semaphore.release()
+        else:
+            path_datas, sub_folders_and_futures = self._paths_and_folders_in(folder, group, tmp_dir)
+        # NOTE: Sorting folders as if they end with a separator yields the files in the same order as sorting
+        #  all their paths, for example "some-name.txt" before "some/name.txt".
+        sort_keys_and_entries = [(path_data.source_path, path_data) for path_data in path_datas]
+        sort_keys_and_entries.extend(
+            (sub_folder_and_future[0] + os.sep, sub_folder_and_future)
+            for sub_folder_and_future in sub_folders_and_futures
+        )
+        sort_keys_and_entries.sort(key=lambda sort_key_and_entry: sort_key_and_entry[0])
+        for _, entry in sort_keys_and_entries:
+            if isinstance(entry, PathData):
+                yield entry
+            else:
+                sub_folder, sub_folder_future = entry
+                yield from self._sorted_paths_in(sub_folder, sub_folder_future, group, tmp_dir)
+
+    def _paths_and_folders_in(
+        self, folder, group, tmp_dir
+    ) -> tuple[list[PathData], list[tuple[str, Optional[Future]]]]:
+        """
+        The files directly in ``folder``, and its sub folders together with a
+        future for scanning them in advance, unless too many folders are
+        scanned in advance already.
+        """
+        path_datas = []
+        sub_folders_and_futures = []
+        with os.scandir(folder) as dir_entries:
+            for dir_entry in dir_entries:
+                # NOTE: The type of a DirEntry usually is known without calling stat().
+                if not dir_entry.is_symlink():
+                    is_folder = dir_entry.is_dir(follow_symlinks=False)
+                    if self._is_path_to_skip(dir_entry.name, is_folder):
+                        _log.debug("skip due to matching skip pattern: %s", dir_entry.path)
+                    elif is_folder:
+                        sub_folder_future = (
+                            self._scan_executor.submit(self._paths_and_folders_in, dir_entry.path, group, tmp_dir)
+                            if self._prefetch_semaphore.acquire(blocking=False)
+                            else None
+                        )
+                        sub_folders_and_futures.append((dir_entry.path, sub_folder_future))
+                    elif self._is_suffix_to_analyze(dir_entry.path):
+                        stat_result = dir_entry.stat(follow_symlinks=False)
+                        path_datas.append(
+                            PathData(
+                                source_path=dir_entry.path,
+                                group=group,
+                                tmp_dir=tmp_dir,
+                                size=stat_result.st_size,
+                                stat_result=stat_result,
+                            )
+                        )
+        return path_datas, sub_folders_and_futures
+
+    def _paths_and_group_to_analyze_in_git(self, folder, ref, tmp_dir=None) -> Iterator[PathData]:
+        group = os.path.basename(folder.rstrip(os.sep)) or folder
+        git_dir = git_dir_for(folder)
+        for git_tree_entry in git_tree_entries(folder, ref):
+            path = self._path_to_analyze_in_git(folder, git_tree_entry.relative_path)
+            if path is not None:
+                yield PathData(
+                    source_path=path,
+                    group=group,
+                    tmp_dir=tmp_dir,
+                    git_dir=git_dir,
+                    blob_id=git_tree_entry.blob_id,
+                    size=git_tree_entry.size,
+                )
+
+    def _path_to_analyze_in_git(self, folder: str, relative_path: str) -> Optional[str]:
+        """
+        The path to analyze for ``relative_path`` as listed by git for
+        ``folder``, or ``None`` if it should be skipped.
+        """
+        *folder_names, name = relative_path.split("/")
+        result = os.path.join(folder, *folder_names, name)
+        is_path_to_skip = self._is_path_to_skip(name, False) or any(
+            self._is_path_to_skip(folder_name, True) for folder_name in folder_names
+        )
+        if is_path_to_skip:
+            _log.debug("skip due to matching skip pattern: %s", result)
+            result = None
+        elif not self._is_suffix_to_analyze(result):
+            result = None
+        return result
+
+    def _paths_and_group_to_analyze_in_git_work_tree(self, folder, group, tmp_dir) -> Optional[list[PathData]]:
+        """
+        All files in ``folder`` as listed by git, or ``None`` if ``folder`` is
+        not part of a git working tree.
+        """
+        relative_paths = git_work_tree_paths(folder)
+        if relative_paths is None:
+            return None
+        result = []
+        for relative_path in relative_paths:
+            path = self._path_to_analyze_in_git(folder, relative_path)
+            if path is not None:
+                result.append(PathData(source_path=path, group=group, tmp_dir=tmp_dir))
+        result.sort(key=_path_data_sort_key)
+        return result
+
+    def _path_to_blob_id_map_for(self, folder: str) -> tuple[str, dict[str, str]]:
+        real_folder = os.path.realpath(folder)
+        for work_tree_root, path_to_blob_id_map in self._work_tree_roots_and_blob_ids:
+            if real_folder == work_tree_root or real_folder.startswith(work_tree_root + os.sep):
+                return work_tree_root, path_to_blob_id_map
+        work_tree_root_and_blob_ids = unmodified_blob_ids(real_folder)
+        if work_tree_root_and_blob_ids is None:
+            return real_folder, {}
+        self._work_tree_roots_and_blob_ids.append(work_tree_root_and_blob_ids)
+        return work_tree_root_and_blob_ids
+
+    def _with_blob_ids(self, path_datas: Iterator[PathData]) -> Iterator[PathData]:
+        """
+        ``path_datas`` with the git blob IDs of files tracked by git and
+        unmodified in their working tree, so duplicates can be detected
+        without reading them.
+        """
+        folder_to_relative_folder_and_blob_ids_map = {}
+        for path_data in path_datas:
+            folder, name = os.path.split(path_data.source_path)
+            relative_folder_and_blob_ids = folder_to_relative_folder_and_blob_ids_map.get(folder)
+            if relative_folder_and_blob_ids is None:
+                work_tree_root, path_to_blob_id_map = self._path_to_blob_id_map_for(folder or os.curdir)
+                relative_folder = os.path.relpath(os.path.realpath(folder or os.curdir), work_tree_root)
+                relative_folder = "" if relative_folder == os.curdir else relative_folder.replace(os.sep, "/") + "/"
+                relative_folder_and_blob_ids = (relative_folder, path_to_blob_id_map)
+                folder_to_relative_folder_and_blob_ids_map[folder] = relative_folder_and_blob_ids
+            relative_folder, path_to_blob_id_map = relative_folder_and_blob_ids
+            blob_id = path_to_blob_id_map.get(relative_folder + name)
+            yield path_data if blob_id is None else dataclasses.replace(path_data, blob_id=blob_id)
 
     def _paths_and_group_to_analyze(self, path_to_analyse_pattern, group=None, tmp_dir=None) -> Iterator[PathData]:
+        sorted_path_datas_to_merge = []
         for path_to_analyse in glob.glob(path_to_analyse_pattern):
             if os.path.islink(path_to_analyse):
                 _log.debug("skip link: %s", path_to_analyse)
@@ -638,66 +1414,172 @@ class SourceScanner:
                             if actual_group == "":
                                 # Compensate for trailing path separator.
                                 actual_group = os.path.basename(os.path.dirname(path_to_analyse))
-                        yield from self._paths_and_group_to_analyze_in(path_to_analyse_pattern, actual_group, tmp_dir)
-                    else:
+                        sorted_path_datas = (
+                            self._paths_and_group_to_analyze_in_git_work_tree(path_to_analyse, actual_group, tmp_dir)
+                            if self._has_git_files
+                            else None
+                        )
+                        if sorted_path_datas is None:
+                            if self._has_git_files:
+                                _log.info("scanning folder because it is not in a git work tree: %s", path_to_analyse)
+                            sorted_path_datas = self._paths_and_group_to_analyze_in(
+                                path_to_analyse_pattern, actual_group, tmp_dir
+                            )
+                        sorted_path_datas_to_merge.append(sorted_path_datas)
+                    elif self._is_suffix_to_analyze(path_to_analyse):
                         if actual_group is None:
                             actual_group = os.path.dirname(path_to_analyse)
                             if actual_group == "":
                                 actual_group = os.path.basename(os.path.dirname(os.path.abspath(path_to_analyse)))
-                        yield PathData(source_path=path_to_analyse, group=actual_group, tmp_dir=tmp_dir)
+                        sorted_path_datas_to_merge.append(
+                            [PathData(source_path=path_to_analyse, group=actual_group, tmp_dir=tmp_dir)]
+                        )
+        yield from heapq.merge(*sorted_path_datas_to_merge, key=_path_data_sort_key)
 
-    def _source_paths_and_groups_to_analyze(self, source_patterns_to_analyze) -> list[PathData]:
-        assert source_patterns_to_analyze is not None
-        result = []
-        # NOTE: We could avoid initializing `source_pattern_to_analyze` here by moving the `try` inside
-        #  the loop, but this would incor a performance overhead (ruff's PERF203).
-        source_pattern_to_analyze = None
+    def _sorted_paths_and_groups_to_analyze_for(self, source_pattern_to_analyze: str) -> Iterator[PathData]:
         try:
-            for source_pattern_to_analyze in source_patterns_to_analyze:
-                remote_url, revision = git_remote_url_and_revision_if_any(source_pattern_to_analyze)
-                if remote_url is not None:
+            remote_url, revision = git_remote_url_and_revision_if_any(source_pattern_to_analyze)
+            if remote_url is not None:
+                if self._git_ref is not None:
+                    if revision is not None:
+                        raise pygount.common.OptionError(
+                            f"git_ref {self._git_ref!r} cannot be combined with revision {revision!r} in URL"
+                        )
+                    git_storage = GitStorage(remote_url, self._git_ref, is_bare=True)
+                else:
                     git_storage = GitStorage(remote_url, revision)
-                    self._git_storages.append(git_storage)
-                    git_storage.extract()
-                    # TODO#113: Find a way to exclude the ugly temp folder from the source path.
-                    result.extend(
+                self._git_storages.append(git_storage)
+                git_storage.extract()
+                # TODO#113: Find a way to exclude the ugly temp folder from the source path.
+                if self._git_ref is not None:
+                    # The shallow clone only contains the requested revision.
+                    yield from sorted(
+                        self._paths_and_group_to_analyze_in_git(
+                            git_storage.temp_folder, "HEAD", tmp_dir=git_storage.temp_folder
+                        ),
+                        key=_path_data_sort_key,
+                    )
+                else:
+                    yield from self._with_blob_ids(
                         self._paths_and_group_to_analyze(git_storage.temp_folder, tmp_dir=git_storage.temp_folder)
                     )
+            else:
+                git_url_match = re.match(GIT_REPO_REGEX, source_pattern_to_analyze)
+                if git_url_match is not None:
+                    raise pygount.Error(
+                        'URL to git repository must end with ".git", for example '
+                        "git@github.com:roskakori/pygount.git or "
+                        "https://github.com/roskakori/pygount.git."
+                    )
+                if self._git_ref is not None:
+                    yield from sorted(
+                        self._paths_and_group_to_analyze_in_git(source_pattern_to_analyze, self._git_ref),
+                        key=_path_data_sort_key,
+                    )
                 else:
-                    git_url_match = re.match(GIT_REPO_REGEX, source_pattern_to_analyze)
-                    if git_url_match is not None:
-                        raise pygount.Error(
-                            'URL to git repository must end with ".git", for example '
-                            "git@github.com:roskakori/pygount.git or "
-                            "https://github.com/roskakori/pygount.git."
-                        )
-                    result.extend(self._paths_and_group_to_analyze(source_pattern_to_analyze))
+                    yield from self._with_blob_ids(self._paths_and_group_to_analyze(source_pattern_to_analyze))
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError) as error:
+            raise pygount.common.Error(
+                f'cannot read "{source_pattern_to_analyze}" as git repository: {error}'
+            ) from error
+        except git.GitCommandError as error:
+            raise pygount.common.Error(
+                f'cannot list files in git repository "{source_pattern_to_analyze}": {error.stderr.strip()}'
+            ) from error
         except OSError as error:
-            assert source_pattern_to_analyze is not None
             raise OSError(f'cannot scan "{source_pattern_to_analyze}" for source files: {error}') from error
-        result = sorted(set(result), key=lambda data: (data.source_path, data.group))
-        return result
+
+    def _source_paths_and_groups_to_analyze(self, source_patterns_to_analyze) -> Iterator[PathData]:
+        """
+        The files for all ``source_patterns_to_analyze`` sorted by path and
+        group and without duplicates. They are yielded while scanning is still
+        going on, so the analysis can start early.
+        """
+        assert source_patterns_to_analyze is not None
+        self._scan_executor = ThreadPoolExecutor()
+        self._prefetch_semaphore = threading.BoundedSemaphore(_MAX_PREFETCHED_FOLDER_COUNT)
+        self._folder_matcher_to_skip = pygount.common.NameMatcher(self.folder_regexps_to_skip)
+        self._name_matcher_to_skip = pygount.common.NameMatcher(self.name_regexps_to_skip)
+        self._suffix_matcher = pygount.common.NameMatcher(self.suffixes)
+        try:
+            # NOTE: Equal paths from overlapping source patterns are merged next to each other, so it suffices
+            #  to remember the ones with the same sort key as the current one.
+            sort_key_of_path_datas_seen = None
+            path_datas_seen = set()
+            for path_data in heapq.merge(
+                *[
+                    self._sorted_paths_and_groups_to_analyze_for(source_pattern_to_analyze)
+                    for source_pattern_to_analyze in source_patterns_to_analyze
+                ],
+                key=_path_data_sort_key,
+            ):
+                sort_key = _path_data_sort_key(path_data)
+                if sort_key != sort_key_of_path_datas_seen:
+                    sort_key_of_path_datas_seen = sort_key
+                    path_datas_seen.clear()
+                if path_data not in path_datas_seen:
+                    path_datas_seen.add(path_data)
+                    yield path_data
+        finally:
+            self._scan_executor.shutdown(cancel_futures=True)
 
     def source_paths(self) -> Iterator[PathData]:
         """
-        Paths to source code files matching all the conditions for this scanner.
+        Paths to source code files matching all the conditions for this
+        scanner, sorted by path and group. They are yielded while scanning is
+        still going on.
         """
-        source_paths_and_groups_to_analyze = self._source_paths_and_groups_to_analyze(self.source_patterns)
+        # NOTE: Files with suffixes not to analyze are already skipped while scanning.
+        yield from pygount.timing.timed_items(
+            pygount.timing.Phase.scanning, self._source_paths_and_groups_to_analyze(self.source_patterns)
+        )
 
-        for path_data in source_paths_and_groups_to_analyze:
-            suffix = os.path.splitext(path_data.source_path)[1].lstrip(".")
-            is_suffix_to_analyze = any(suffix_regexp.match(suffix) for suffix_regexp in self.suffixes)
-            if is_suffix_to_analyze:
-                yield path_data
-            else:
-                _log.info("skip due to suffix: %s", path_data.source_path)
 
+#: Number of lines to mark before counting them when analyzing in chunks.
+_LINE_MARK_PART_SIZE = 64 * 1024
+
+#: Bits in the marks of a line for the kinds of source code it contains.
+_CODE_MARK = pygount.scanners.CODE_MARK
+_DOCUMENTATION_MARK = pygount.scanners.DOCUMENTATION_MARK
+_STRING_MARK = pygount.scanners.STRING_MARK
+
+#: Number of possible combinations of marks in a line.
+_MARK_COMBINATION_COUNT = pygount.scanners.MARK_COMBINATION_COUNT
+
+_MARK_TO_LINE_PART_MAP = {_CODE_MARK: "c", _DOCUMENTATION_MARK: "d", _STRING_MARK: "s"}
+
+_MARK_TO_LINE_MARK_BYTES_MAP = {mark: bytes([mark]) for mark in range(_MARK_COMBINATION_COUNT)}
+
+#: Marks of the token types found so far, see :py:func:`_token_type_mark()`.
+_token_type_to_mark_map: dict[TokenType, int] = {}
 
 _LANGUAGE_TO_WHITE_WORDS_MAP = {"batchfile": {"@"}, "python": {"pass"}, "sql": {"begin", "end"}}
 for _language in _LANGUAGE_TO_WHITE_WORDS_MAP:
     assert _language.islower()
 
 
+@functools.lru_cache(maxsize=16)
+def _combined_regex(regexes: tuple[Pattern, ...]) -> Optional[Pattern]:
+    """
+    A single regular expression that matches where any of ``regexes``
+    matches, with the group ``_<index>`` telling which one of them matched
+    first, or ``None`` if they cannot be combined because they contain
+    groups of their own.
+    """
+    if any(regex.groups != 0 or not isinstance(regex.pattern, str) for regex in regexes):
+        return None
+    alternatives = []
+    for index, regex in enumerate(regexes):
+        flags = "".join(flag for flag, value in _SCOPED_REGEX_FLAGS if regex.flags & value)
+        pattern = _GLOBAL_REGEX_FLAGS_REGEX.sub("", regex.pattern)
+        alternatives.append(f"(?P<_{index}>(?{flags}:{pattern}))" if flags else f"(?P<_{index}>{pattern})")
+    try:
+        result = re.compile("|".join(alternatives))
+    except re.error:
+        result = None
+    return result
+
+
 def matching_number_line_and_regex(
     source_lines: Iterator[str], generated_regexes: Sequence[Pattern], max_line_count: int = 15
 ) -> Optional[tuple[int, str, Pattern]]:
@@ -712,16 +1594,46 @@ def matching_number_line_and_regex(
         source lines do not match any ``generated_regexes``.
     """
     initial_numbers_and_lines = enumerate(itertools.islice(source_lines, max_line_count))
-    matching_number_line_and_regexps = (
-        (number, line, matching_regex)
-        for number, line in initial_numbers_and_lines
-        for matching_regex in generated_regexes
-        if matching_regex.match(line)
-    )
-    possible_first_matching_number_line_and_regexp = list(itertools.islice(matching_number_line_and_regexps, 1))
-    result = (
-        possible_first_matching_number_line_and_regexp[0] if possible_first_matching_number_line_and_regexp else None
-    )
+    combined_regex = _combined_regex(tuple(generated_regexes))
+    if combined_regex is not None:
+        matching_number_line_and_regexps = (
+            (number, line, generated_regexes[int(match.lastgroup[1:])])
+            for number, line in initial_numbers_and_lines
+            if (match := combined_regex.match(line)) is not None
+        )
+    else:
+        matching_number_line_and_regexps = (
+            (number, line, matching_regex)
+            for number, line in initial_numbers_and_lines
+            for matching_regex in generated_regexes
+            if matching_regex.match(line)
+        )
+    return next(matching_number_line_and_regexps, None)
+
+
+def _generated_message(source_lines: Iterator[str], generated_regexes: Sequence[Pattern]) -> Optional[str]:
+    number_line_and_regex = matching_number_line_and_regex(source_lines, generated_regexes, _GENERATED_LINE_COUNT)
+    if number_line_and_regex is None:
+        return None
+    number, _, regex = number_line_and_regex
+    return f"line {number} matches {regex}"
+
+
+def _head_lines(head_text: str, is_entire_text: bool, line_count: int) -> Optional[list[str]]:
+    """
+    The first ``line_count`` lines in ``head_text`` like
+    :py:func:`pygount.common.lines` yields them, or ``None`` if
+    ``head_text`` is only the start of a text and contains fewer
+    complete lines.
+    """
+    result = head_text.split("\n", line_count)
+    if len(result) > line_count:
+        # The last part is the possibly incomplete rest.
+        result.pop()
+    elif not is_entire_text:
+        result = None
+    elif result[-1] == "":
+        result.pop()
     return result
 
 
@@ -744,18 +1656,6 @@ def white_code_words(language_id: str) -> set[str]:
     return _LANGUAGE_TO_WHITE_WORDS_MAP.get(language_id, set())
 
 
-def _delined_tokens(tokens: Iterator[tuple[TokenType, str]]) -> Iterator[TokenType]:
-    for token_type, token_text in tokens:
-        remaining_token_text = token_text
-        newline_index = remaining_token_text.find("\n")
-        while newline_index != -1:
-            yield token_type, remaining_token_text[: newline_index + 1]
-            remaining_token_text = remaining_token_text[newline_index + 1 :]
-            newline_index = remaining_token_text.find("\n")
-        if remaining_token_text != "":
-            yield token_type, remaining_token_text
-
-
 def _pythonized_comments(tokens: Iterator[tuple[TokenType, str]]) -> Iterator[TokenType]:
     """
     Similar to tokens but converts strings after a colon (`:`) to comments.
@@ -775,34 +1675,190 @@ def _pythonized_comments(tokens: Iterator[tuple[TokenType, str]]) -> Iterator[To
         yield result_token_type, result_token_text
 
 
-def _line_parts(lexer: pygments.lexer.Lexer, text: str, is_markup: bool = False) -> Iterator[set[str]]:
-    line_marks = set()
-    tokens = _delined_tokens(lexer.get_tokens(text))
-    if lexer.name == "Python":
-        tokens = _pythonized_comments(tokens)
-    language_id = lexer.name.lower()
-    white_text = " \f\n\r\t" + white_characters(language_id)
-    white_words = white_code_words(language_id)
-    for token_type, token_text in tokens:
+def _token_type_mark(token_type: TokenType) -> int:
+    """
+    The mark a token of ``token_type`` adds to the lines it spans, with 0 for
+    code, which only counts if the token text is not white.
+    """
+    result = _token_type_to_mark_map.get(token_type)
+    if result is None:
         # NOTE: Pygments treats preprocessor statements as special comments.
         is_actual_comment = token_type in pygments.token.Comment and token_type not in (
             pygments.token.Comment.Preproc,
             pygments.token.Comment.PreprocFile,
         )
         if is_actual_comment:
-            line_marks.add("d")  # 'documentation'
+            result = _DOCUMENTATION_MARK
         elif token_type in pygments.token.String:
-            line_marks.add("s")  # 'string'
+            result = _STRING_MARK
+        else:
+            result = 0
+        _token_type_to_mark_map[token_type] = result
+    return result
+
+
+def _line_marks(
+    lexer: pygments.lexer.Lexer, text: str, is_markup: bool = False, engine: str = DEFAULT_ENGINE
+) -> bytearray:
+    """
+    The marks of each line of ``text`` as combination of ``_CODE_MARK``,
+    ``_DOCUMENTATION_MARK`` and ``_STRING_MARK``. Instead of splitting tokens
+    into lines, each token marks the whole range of lines it spans, so long
+    tokens like docstrings only have to be processed once.
+
+    With ``engine="fast"``, a scanner from :py:mod:`pygount.scanners` computes
+    the same marks without lexing if it supports the language of ``lexer``.
+    """
+    language_id = lexer.name.lower()
+    white_text = " \f\n\r\t" + white_characters(language_id)
+    white_words = white_code_words(language_id)
+    if engine == "fast" and not is_markup:
+        result = pygount.scanners.line_marks(lexer, text, white_text, white_words)
+        if result is not None:
+            return result
+    return next(_token_line_marks(lexer, lexer.get_tokens(text), is_markup))
+
+
+def _token_line_marks(
+    lexer: pygments.lexer.Lexer,
+    tokens: Iterator[tuple[TokenType, str]],
+    is_markup: bool = False,
+    part_size: int = sys.maxsize,
+) -> Iterator[bytearray]:
+    """
+    The marks of each line ``tokens`` from ``lexer`` span, see
+    :py:func:`_line_marks()`, in parts of at least ``part_size`` lines
+    except for the last one.
+    """
+    language_id = lexer.name.lower()
+    white_text = " \f\n\r\t" + white_characters(language_id)
+    white_words = white_code_words(language_id)
+    if lexer.name == "Python":
+        tokens = _pythonized_comments(tokens)
+    code_mark = _DOCUMENTATION_MARK if is_markup else _CODE_MARK
+
+    def token_text_mark(token_text: str) -> int:
+        is_white_text = (token_text.strip() in white_words) or (token_text.rstrip(white_text) == "")
+        return 0 if is_white_text else code_mark
+
+    result = bytearray()
+    line_mark = 0
+    for token_type, token_text in tokens:
+        token_mark = _token_type_to_mark_map.get(token_type)
+        if token_mark is None:
+            token_mark = _token_type_mark(token_type)
+        newline_count = token_text.count("\n")
+        if token_mark == 0 and token_text.rstrip(white_text) != "":
+            if newline_count >= 1:
+                # Code spanning multiple lines, which each might be white on their own.
+                token_lines = token_text.split("\n")
+                result.append(line_mark | token_text_mark(token_lines[0]))
+                result.extend(token_text_mark(token_line) for token_line in token_lines[1:-1])
+                line_mark = token_text_mark(token_lines[-1])
+                continue
+            token_mark = token_text_mark(token_text)
+        if newline_count == 0:
+            line_mark |= token_mark
         else:
-            is_white_text = (token_text.strip() in white_words) or (token_text.rstrip(white_text) == "")
-            if not is_white_text:
-                line_mark = "d" if is_markup else "c"
-                line_marks.add(line_mark)
-        if token_text.endswith("\n"):
-            yield line_marks
-            line_marks = set()
-    if len(line_marks) >= 1:
-        yield line_marks
+            result.append(line_mark | token_mark)
+            if newline_count >= 2:
+                result.extend(_MARK_TO_LINE_MARK_BYTES_MAP[token_mark] * (newline_count - 1))
+            line_mark = 0 if token_text.endswith("\n") else token_mark
+            if len(result) >= part_size:
+                yield result
+                result = bytearray()
+    if line_mark != 0:
+        result.append(line_mark)
+    yield result
+
+
+class _LexingTimeExceededError(Exception):
+    pass
+
+
+def _raise_lexing_time_exceeded(signal_number, frame):
+    raise _LexingTimeExceededError
+
+
+@contextlib.contextmanager
+def _lexing_time_limit(seconds: float):
+    """
+    Raise :py:exc:`_LexingTimeExceededError` if the code within takes longer
+    than ``seconds``, even in the middle of matching a regular expression.
+    Without interval timers, or outside the main thread, where signals cannot
+    be handled, or if another handler for ``SIGALRM`` exists, the time is not
+    limited.
+    """
+    is_limited = (
+        seconds > 0
+        and _HAS_LEXING_TIME_LIMIT
+        and threading.current_thread() is threading.main_thread()
+        and signal.getsignal(signal.SIGALRM) in (signal.SIG_DFL, None)
+    )
+    if not is_limited:
+        yield
+        return
+    signal.signal(signal.SIGALRM, _raise_lexing_time_exceeded)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+
+
+def _chunked_line_counts(
+    source_path: str,
+    lexer: pygments.lexer.Lexer,
+    encoding: str,
+    chunk_size: int,
+    is_markup: bool = False,
+    cut_positions: Optional[list[int]] = None,
+) -> tuple[int, int, int, int]:
+    """
+    Same as ``_line_counts(_line_marks(lexer, text))`` for the text in
+    ``source_path``, but reading, decoding and lexing it in chunks of
+    ``chunk_size`` bytes, see :py:func:`pygount.chunks.chunked_tokens()`.
+
+    :param cut_positions: a list to append the positions to where the text
+      had to be cut because the lexer did not get back to its root state,
+      in which case the counts are only approximate
+    """
+    result = [0, 0, 0, 0]
+    with open(source_path, "rb") as source_file:
+        data_chunks = iter(functools.partial(source_file.read, chunk_size), b"")
+        tokens = pygount.chunks.chunked_tokens(
+            lexer,
+            pygount.chunks.decoded_chunks(data_chunks, encoding),
+            chunk_size // 4,
+            pygount.chunks.MAX_PENDING_CHUNK_COUNT * chunk_size,
+            cut_positions,
+        )
+        for line_marks in _token_line_marks(lexer, tokens, is_markup, _LINE_MARK_PART_SIZE):
+            for index, count in enumerate(_line_counts(line_marks)):
+                result[index] += count
+    return tuple(result)
+
+
+def _line_parts(lexer: pygments.lexer.Lexer, text: str, is_markup: bool = False) -> Iterator[set[str]]:
+    """
+    The marks of each line of ``text`` as set of "c" (code), "d"
+    (documentation) and "s" (string).
+    """
+    for line_mark in _line_marks(lexer, text, is_markup):
+        yield {line_part for mark, line_part in _MARK_TO_LINE_PART_MAP.items() if line_mark & mark}
+
+
+def _line_counts(line_marks: bytearray) -> tuple[int, int, int, int]:
+    """
+    The number of code, documentation, empty and string lines in
+    ``line_marks``. Lines containing code count as code, other lines with
+    strings count as string.
+    """
+    mark_counts = [line_marks.count(mark) for mark in range(_MARK_COMBINATION_COUNT)]
+    code_count = sum(mark_counts[mark] for mark in range(_MARK_COMBINATION_COUNT) if mark & _CODE_MARK)
+    string_count = mark_counts[_STRING_MARK] + mark_counts[_STRING_MARK | _DOCUMENTATION_MARK]
+    return code_count, mark_counts[_DOCUMENTATION_MARK], mark_counts[0], string_count
 
 
 def check_file_handle_is_seekable(file_handle: Optional[Union[BufferedIOBase, RawIOBase]], source_path: str):
@@ -810,14 +1866,17 @@ def check_file_handle_is_seekable(file_handle: Optional[Union[BufferedIOBase, Ra
         raise pygount.Error(f"cannot determine encoding: file handle must be seekable: {source_path}")
 
 
+@pygount.timing.timed(pygount.timing.Phase.encoding_detection)
 def encoding_for(
     source_path: str,
     encoding: str = "automatic",
     fallback_encoding: Optional[str] = None,
     file_handle: Optional[Union[BufferedIOBase, RawIOBase]] = None,
+    data: Optional[bytes] = None,
 ) -> str:
     """
-    The encoding used by the text file stored in ``source_path``.
+    The encoding used by the text file stored in ``source_path``, or in
+    ``data`` if the file has already been read.
 
     The algorithm used is:
 
@@ -835,7 +1894,9 @@ def encoding_for(
     assert encoding is not None
 
     if encoding == "automatic":
-        if file_handle is None:
+        if data is not None:
+            heading = bytes(data[:128])
+        elif file_handle is None:
             with open(source_path, "rb") as source_file:
                 heading = source_file.read(128)
         else:
@@ -862,7 +1923,9 @@ def encoding_for(
             'without chardet installed, encoding="chardet" must be rejected before calling encoding_for()'
         )
         _detector.reset()
-        if file_handle is None:
+        if data is not None:
+            lines = bytes(data).splitlines(keepends=True)
+        elif file_handle is None:
             with open(source_path, "rb") as source_file:
                 lines = source_file.readlines()
         else:
@@ -891,7 +1954,9 @@ def encoding_for(
         else:
             try:
                 # Attempt to read the file as UTF-8.
-                if file_handle is None:
+                if data is not None:
+                    data.decode("utf-8")
+                elif file_handle is None:
                     with open(source_path, encoding="utf-8") as source_file:
                         source_file.read()
                 else:
@@ -940,9 +2005,142 @@ def encoding_from_possible_xml_prolog(ascii_header: str) -> Optional[str]:
     return xml_prolog_match.group("encoding") if xml_prolog_match is not None else None
 
 
+def decoded_text(data: bytes, encoding: str) -> str:
+    """
+    The text in ``data`` decoded using ``encoding`` with newlines translated
+    to ``"\\n"``, same as when reading a file in text mode.
+    """
+    result = data.decode(encoding)
+    if "\r" in result:
+        result = result.replace("\r\n", "\n").replace("\r", "\n")
+    return result
+
+
+def decoded_head_text(data: bytes, encoding: str, size: int) -> str:
+    """
+    The text of at least the first ``size`` characters in ``data``, or all of
+    it if ``size`` is 0, decoded like :py:func:`decoded_text`. Characters
+    that cannot be decoded are replaced, because the head is only used to
+    guess the language.
+    """
+    # NOTE: No encoding takes more than 4 bytes for a character.
+    head_data = data if size == 0 else data[: 4 * size]
+    result = codecs.getincrementaldecoder(encoding)(errors="replace").decode(head_data)
+    if "\r" in result:
+        result = result.replace("\r\n", "\n").replace("\r", "\n")
+    return result
+
+
+def ascii_compatible_data(data: bytes, encoding: str) -> bytes:
+    """
+    The ``data`` with newlines translated to ``b"\\n"`` like
+    :py:func:`decoded_text` does, and recoded to UTF-8 if ``encoding``
+    represents white space and newlines differently than ASCII, for example
+    UTF-16, so lines can be counted without decoding.
+    """
+    if " \t\n\r".encode(encoding) == b" \t\n\r":
+        result = data[len(codecs.BOM_UTF8) :] if data.startswith(codecs.BOM_UTF8) else data
+        if b"\r" in result:
+            result = result.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    else:
+        result = decoded_text(data, encoding).lstrip("\ufeff").encode("utf-8")
+    return result
+
+
+def _physical_line_counts(data: bytes) -> tuple[int, int, int, int]:
+    """
+    The number of code, documentation, empty and string lines in ``data``
+    from :py:func:`ascii_compatible_data` similar to :py:func:`_line_counts`,
+    but without lexing, so all non-empty lines count as code.
+    """
+    if data == b"":
+        return 0, 0, 0, 0
+    is_ending_with_newline = data.endswith(b"\n")
+    line_count = data.count(b"\n") + (0 if is_ending_with_newline else 1)
+    empty_count = len(_EMPTY_LINE_BYTES_REGEX.findall(data))
+    if is_ending_with_newline:
+        # The position after the last newline matches too, but is not a line.
+        empty_count -= 1
+    return line_count - empty_count, 0, empty_count, 0
+
+
+class FileProbe:
+    """
+    A file that is opened once and read at most once into a single buffer,
+    which is then shared by all checks and the analysis, so that a file
+    requires as few system calls as possible. Initially only the first
+    :py:data:`PROBE_HEAD_SIZE` bytes are read, which is enough to detect
+    binary files, BOMs and magic comments. The rest is only read if the
+    whole :py:meth:`data()` is needed.
+    """
+
+    def __init__(self, source_path: str):
+        self._source_path = source_path
+        self._file = open(source_path, "rb", buffering=0)  # noqa: SIM115
+        #: Number of system calls used to access the file so far, including ``close()``.
+        self.system_call_count = 2
+        try:
+            self._size = os.fstat(self._file.fileno()).st_size
+        except OSError:
+            self.close()
+            raise
+        self._buffer = bytearray()
+        self._is_at_end = False
+
+    @property
+    def size(self) -> int:
+        """The size of the file in bytes when it was opened."""
+        return self._size
+
+    def _read_up_to(self, size_to_read: int):
+        if len(self._buffer) < size_to_read:
+            read_size = len(self._buffer)
+            buffer = bytearray(size_to_read)
+            buffer[:read_size] = self._buffer
+            with memoryview(buffer) as buffer_view:
+                while read_size < size_to_read and not self._is_at_end:
+                    with buffer_view[read_size:] as remaining_view:
+                        chunk_size = self._file.readinto(remaining_view)
+                    self.system_call_count += 1
+                    if chunk_size == 0:
+                        # The file has become smaller since it was opened.
+                        self._is_at_end = True
+                    read_size += chunk_size
+            del buffer[read_size:]
+            self._buffer = buffer
+
+    def head(self, size: int = PROBE_HEAD_SIZE) -> bytes:
+        """The first ``size`` bytes of the file."""
+        self._read_up_to(min(self._size, size))
+        return bytes(self._buffer[:size])
+
+    def data(self) -> bytearray:
+        """The whole content of the file."""
+        self._read_up_to(self._size)
+        return self._buffer
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self.system_call_count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
 def is_binary_file(source_path: str) -> bool:
     with open(source_path, "rb") as source_file:
-        initial_bytes = source_file.read(8192)
+        initial_bytes = source_file.read(PROBE_HEAD_SIZE)
+    return is_binary_data(initial_bytes)
+
+
+def is_binary_data(data: bytes) -> bool:
+    initial_bytes = data[:PROBE_HEAD_SIZE]
     return not any(initial_bytes.startswith(bom) for bom in _TEXT_BOMS) and b"\0" in initial_bytes
 
 
@@ -956,25 +2154,76 @@ def has_lexer(source_path: str) -> bool:
     the need for calling :py:func:`pygments.lexers.guess_lexer_for_filename()`
     which fully reads the source file.
     """
-    result = bool(pygments.lexers.find_lexer_class_for_filename(source_path))
+    result = pygount.lexer_index.lexer_index().has_lexer(source_path)
     if not result:
         suffix = os.path.splitext(os.path.basename(source_path))[1].lstrip(".")
         result = suffix in _SUFFIX_TO_FALLBACK_LEXER_MAP
     return result
 
 
-def guess_lexer(source_path: str, text: str) -> pygments.lexer.Lexer:
+@pygount.timing.timed(pygount.timing.Phase.lexer_guessing)
+def guess_lexer(
+    source_path: str, text: str, disambiguation_size: int = pygount.lexer_index.DEFAULT_DISAMBIGUATION_SIZE
+) -> pygments.lexer.Lexer:
     if is_plain_text(source_path):
-        result = pygount.lexers.PlainTextLexer()
+        result = pygount.lexer_index.lexer_pool().lexer(pygount.lexers.PlainTextLexer)
     else:
         try:
-            result = pygments.lexers.guess_lexer_for_filename(source_path, text)
+            result = pygount.lexer_index.lexer_index().guess_lexer_for_filename(source_path, text, disambiguation_size)
         except pygments.util.ClassNotFound:
             suffix = os.path.splitext(os.path.basename(source_path))[1].lstrip(".")
             result = _SUFFIX_TO_FALLBACK_LEXER_MAP.get(suffix)
     return result
 
 
+def disambiguate_in_advance(
+    path_data: PathData,
+    encoding: str = "automatic",
+    fallback_encoding: str = "cp1252",
+    disambiguation_size: int = pygount.lexer_index.DEFAULT_DISAMBIGUATION_SIZE,
+    max_file_sizes: Optional[MaxFileSizes] = None,
+) -> Optional[tuple[str, str]]:
+    """
+    The :py:meth:`pygount.lexer_index.LexerIndex.disambiguation_key()` for
+    ``path_data`` after choosing a lexer for it from the start of its
+    source code, unless a lexer has been chosen for its folder and suffix
+    before. Calling this for all paths in the order they are analyzed before
+    sending them to other processes ensures all processes use the same
+    lexers independent of which files each of them analyzes, provided the
+    lexers chosen are passed on with
+    :py:meth:`pygount.lexer_index.LexerIndex.add_decisions()`.
+
+    Returns ``None`` if only one lexer matches the name of ``path_data``,
+    lexers are not reused for other files because ``disambiguation_size``
+    is 0, or the start of its source code cannot be read.
+    """
+    index = pygount.lexer_index.lexer_index()
+    result = index.disambiguation_key(path_data.source_path) if disambiguation_size >= 1 else None
+    if (
+        result is not None
+        and not index.has_decision(result)
+        and not is_plain_text(path_data.source_path)
+        and huge_source_analysis(path_data, max_file_sizes) is None
+    ):
+        head_size = max(PROBE_HEAD_SIZE, 4 * disambiguation_size)
+        try:
+            if path_data.git_dir is not None:
+                head = git_blob_data(path_data.git_dir, path_data.blob_id)[:head_size]
+            else:
+                with FileProbe(path_data.source_path) as file_probe:
+                    head = file_probe.head(head_size)
+            if len(head) == 0 or is_binary_data(head):
+                result = None
+            else:
+                if encoding in ("automatic", "chardet"):
+                    encoding = encoding_for(path_data.source_path, encoding, fallback_encoding, data=head)
+                guess_lexer(path_data.source_path, decoded_head_text(head, encoding, disambiguation_size))
+        except (LookupError, OSError, ValueError) as error:
+            _log.debug("%s: cannot disambiguate lexer in advance: %s", path_data.source_path, error)
+            result = None
+    return result
+
+
 def base_language(language: str) -> str:
     base_language_match = _BASE_LANGUAGE_REGEX.match(language)
     return language if base_language_match is None else base_language_match.group("base_language")
@@ -0,0 +1,181 @@
+"""
+Incremental analysis that reuses a previous JSON result for files that did
+not change according to git.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import json
+import logging
+import os
+from collections.abc import Sequence
+from typing import Optional
+
+import git
+
+import pygount.common
+
+from .analysis import PathData, SourceAnalysis, SourceState
+from .git_storage import git_remote_url_and_revision_if_any
+
+#: Major version of the JSON format that can be used as baseline.
+_SUPPORTED_FORMAT_MAJOR_VERSION = "1"
+
+_log = logging.getLogger("pygount")
+
+
+def _path_key(path: str) -> str:
+    return os.path.normcase(os.path.realpath(path))
+
+
+def _existing_folder_for(source_pattern: str) -> str:
+    result = os.path.abspath(source_pattern)
+    while not os.path.isdir(result):
+        parent_folder = os.path.dirname(result)
+        if parent_folder == result:
+            break
+        result = parent_folder
+    return result
+
+
+def working_tree_folders(source_patterns: Sequence[str]) -> list[str]:
+    """
+    The distinct folders of the git working trees containing
+    ``source_patterns`` in the order of the patterns. Patterns for remote
+    repositories are skipped, because their files are never reused from a
+    baseline.
+    """
+    result = []
+    for source_pattern in source_patterns:
+        remote_url, _ = git_remote_url_and_revision_if_any(source_pattern)
+        if remote_url is None:
+            try:
+                repo = git.Repo(_existing_folder_for(source_pattern), search_parent_directories=True)
+            except git.InvalidGitRepositoryError as error:
+                raise pygount.common.Error(f"cannot find git repository for baseline: {error}") from error
+            try:
+                working_tree_folder = repo.working_tree_dir
+            finally:
+                repo.close()
+            if working_tree_folder not in result:
+                result.append(working_tree_folder)
+    return result
+
+
+def changed_paths(source_folder: str, since_ref: str) -> set[str]:
+    """
+    Keys (as computed by :py:func:`_path_key()`) for all paths in the git
+    working tree containing ``source_folder`` that were added, modified,
+    deleted or renamed since the git reference ``since_ref``, including
+    untracked files.
+    """
+    try:
+        repo = git.Repo(_existing_folder_for(source_folder), search_parent_directories=True)
+        try:
+            # With --no-renames, a renamed file shows up as deleted old path and added new path.
+            diff_output = repo.git.diff("--name-only", "--no-renames", "-z", since_ref, "--")
+            relative_paths = [path for path in diff_output.split("\0") if path != ""]
+            relative_paths.extend(repo.untracked_files)
+            result = {_path_key(os.path.join(repo.working_tree_dir, path)) for path in relative_paths}
+        finally:
+            repo.close()
+    except git.InvalidGitRepositoryError as error:
+        raise pygount.common.Error(f"cannot find git repository for baseline: {error}") from error
+    except git.GitCommandError as error:
+        raise pygount.common.Error(f"cannot find files changed since {since_ref}: {error.stderr.strip()}") from error
+    return result
+
+
+class Baseline:
+    """
+    Analyses from a previous JSON result written with ``--format=json``, which
+    can be reused for all files that git does not report as changed since
+    ``since_ref``.
+
+    Paths are compared after resolving them relative to the current folder,
+    so the baseline has to be created with the same source patterns from the
+    same folder to be of use. The source patterns may be in different git
+    repositories, each of which is compared with its own ``since_ref``. All other files are analyzed again, as are
+    files that were duplicates, could not be analyzed, were too huge to be
+    analyzed or were counted approximately in the baseline, because the size
+    limits or the speed of lexing might have changed.
+
+    If ``options_key`` is set and differs from the one of the baseline, see
+    :py:func:`pygount.cache.options_key()`, the baseline was created with
+    different versions or options, and no analyses are reused.
+    """
+
+    def __init__(
+        self,
+        baseline_path: str,
+        since_ref: str,
+        source_patterns: Sequence[str] = (os.curdir,),
+        options_key: Optional[str] = None,
+    ):
+        self._baseline_path = baseline_path
+        self._options_key = options_key
+        self._path_to_file_map = self._read_path_to_file_map()
+        self._changed_paths = set()
+        for working_tree_folder in working_tree_folders(source_patterns):
+            self._changed_paths.update(changed_paths(working_tree_folder, since_ref))
+        self._reused_count = 0
+        _log.info(
+            "baseline: %d files in %s, %d paths changed since %s",
+            len(self._path_to_file_map),
+            baseline_path,
+            len(self._changed_paths),
+            since_ref,
+        )
+
+    def _read_path_to_file_map(self) -> dict[str, dict]:
+        try:
+            with open(self._baseline_path, encoding="utf-8") as baseline_file:
+                baseline_map = json.load(baseline_file)
+        except ValueError as error:
+            raise pygount.common.Error(f"cannot read baseline {self._baseline_path}: {error}") from error
+        format_version = baseline_map.get("formatVersion", "") if isinstance(baseline_map, dict) else ""
+        if format_version.split(".")[0] != _SUPPORTED_FORMAT_MAJOR_VERSION:
+            raise pygount.common.Error(
+                f"baseline {self._baseline_path} must have been written with --format=json "
+                f"using format version {_SUPPORTED_FORMAT_MAJOR_VERSION}.x but has format version {format_version!r}"
+            )
+        if self._options_key is not None and baseline_map.get("optionsKey") != self._options_key:
+            _log.warning(
+                "baseline %s was written with different versions or options, analyzing all files again",
+                self._baseline_path,
+            )
+            return {}
+        return {_path_key(file_map["path"]): file_map for file_map in baseline_map["files"]}
+
+    @property
+    def reused_count(self) -> int:
+        """Number of analyses reused from the baseline so far."""
+        return self._reused_count
+
+    def source_analysis(self, path_data: PathData) -> Optional[SourceAnalysis]:
+        """
+        The analysis of ``path_data`` from the baseline, or ``None`` if it has
+        to be analyzed again.
+        """
+        result = None
+        if path_data.tmp_dir is None:
+            path_key = _path_key(path_data.source_path)
+            file_map = self._path_to_file_map.get(path_key)
+            if file_map is not None and path_key not in self._changed_paths:
+                state = SourceState[file_map["state"]]
+                if state not in (SourceState.duplicate, SourceState.error, SourceState.huge) and not file_map.get(
+                    "isApproximate", False
+                ):
+                    result = SourceAnalysis(
+                        path=path_data.source_path,
+                        language=file_map["language"],
+                        group=path_data.group,
+                        code=file_map["codeCount"],
+                        documentation=file_map["documentationCount"],
+                        empty=file_map["emptyCount"],
+                        string=file_map["sourceCount"] - file_map["codeCount"],
+                        state=state,
+                        state_info=file_map["stateInfo"],
+                    )
+                    self._reused_count += 1
+        return result
@@ -0,0 +1,495 @@
+"""
+Persistent cache for analyses of source code to speed up repeated runs.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from importlib.metadata import version
+from re import Pattern
+from typing import Optional
+
+import pygments
+
+import pygount.chunks
+import pygount.common
+import pygount.lexer_index
+
+from .analysis import DuplicatePool, MaxFileSizes, PathData, SourceAnalysis, SourceState
+
+#: Default maximum number of files for which the cache keeps analyses.
+DEFAULT_CACHE_SIZE = 1_000_000
+
+#: Name of the SQLite database within the cache folder.
+CACHE_DATABASE_NAME = "pygount-cache.sqlite"
+
+#: Cache analyses by path, size, modification time and inode of a file.
+CACHE_MODE_PATH = "path"
+
+#: Cache analyses by the content and name of a file, so they can be shared between machines.
+CACHE_MODE_CONTENT = "content"
+
+#: Valid values for option ``--cache-mode``.
+VALID_CACHE_MODES = (CACHE_MODE_PATH, CACHE_MODE_CONTENT)
+
+#: Version of the database schema; whenever it changes, existing caches are discarded.
+_SCHEMA_VERSION = 2
+
+#: Format identifier in the first line of a packed cache.
+_PACK_FORMAT = "pygount-content-cache"
+
+#: Version of the packed cache format.
+_PACK_VERSION = 1
+
+#: Files modified less than this number of nanoseconds before the start of the run are not
+#: cached because a later modification might not change the modification time.
+_RACY_MODIFICATION_DURATION_NS = 2_000_000_000
+
+#: Number of analyses to collect before writing them to the database.
+_PENDING_ROWS_TO_WRITE = 10_000
+
+#: Columns holding the analysis itself, which are the same for all caches.
+_ANALYSIS_COLUMNS = ("language", "code", "documentation", "empty", "string", "state", "state_info")
+
+_log = logging.getLogger("pygount")
+
+
+@dataclass(frozen=True)
+class CacheStatistics:
+    hit_count: int
+    miss_count: int
+    eviction_count: int
+
+
+def options_key(
+    encoding: str,
+    fallback_encoding: Optional[str],
+    generated_regexes: Optional[list[Pattern]],
+    merge_embedded_language: bool,
+    disambiguation_size: int = pygount.lexer_index.DEFAULT_DISAMBIGUATION_SIZE,
+    engine: str = "pygments",
+    count_mode: str = "code",
+    chunk_size: int = pygount.chunks.DEFAULT_CHUNK_SIZE,
+    max_file_sizes: Optional[MaxFileSizes] = None,
+    lexing_budget: float = 0,
+) -> str:
+    """
+    Key describing all the versions and options that affect the result of
+    :py:meth:`SourceAnalysis.from_file()`. Analyses computed with a different
+    key must not be reused.
+
+    The ``lexing_budget`` is not part of the key, because it only affects
+    approximate analyses, which are never cached.
+    """
+    key_parts = [
+        version("pygount"),
+        pygments.__version__,
+        encoding,
+        fallback_encoding,
+        None if generated_regexes is None else [[regex.pattern, regex.flags] for regex in generated_regexes],
+        merge_embedded_language,
+        disambiguation_size,
+        engine,
+        count_mode,
+        chunk_size,
+        None
+        if max_file_sizes is None
+        else [max_file_sizes.default, sorted(max_file_sizes.language_to_size_map.items())],
+    ]
+    return hashlib.sha256(json.dumps(key_parts).encode("utf-8")).hexdigest()
+
+
+def _file_identity(path_data: PathData) -> Optional[tuple[int, int, int]]:
+    """
+    The size, modification time in nanoseconds and inode of
+    ``path_data.source_path``, or ``None`` if it cannot be accessed. If
+    available, this uses the stat result from scanning for files.
+    """
+    source_stat = path_data.stat_result
+    if source_stat is None:
+        try:
+            source_stat = os.stat(path_data.source_path)
+        except OSError:
+            source_stat = None
+    return (source_stat.st_size, source_stat.st_mtime_ns, source_stat.st_ino) if source_stat is not None else None
+
+
+def _content_identity(path_data: PathData) -> Optional[tuple]:
+    """
+    Something that changes when the content of ``path_data`` changes, or
+    ``None`` if it cannot be accessed.
+    """
+    return (path_data.blob_id,) if path_data.git_dir is not None else _file_identity(path_data)
+
+
+def _analysis_row(source_analysis: SourceAnalysis) -> tuple:
+    return (
+        source_analysis.language,
+        source_analysis.code_count,
+        source_analysis.documentation_count,
+        source_analysis.empty_count,
+        source_analysis.string_count,
+        source_analysis.state.name,
+        source_analysis.state_info,
+    )
+
+
+def _source_analysis_from_row(path_data: PathData, row: tuple) -> SourceAnalysis:
+    language, code, documentation, empty, string, state, state_info = row
+    return SourceAnalysis(
+        path=path_data.source_path,
+        language=language,
+        group=path_data.group,
+        code=code,
+        documentation=documentation,
+        empty=empty,
+        string=string,
+        state=SourceState[state],
+        state_info=state_info,
+    )
+
+
+def _is_cacheable(path_data: PathData, source_analysis: Optional[SourceAnalysis] = None) -> bool:
+    # NOTE: Files in temporary folders, for example from cloned git repositories, never match
+    #  again. Errors might be temporary, for example if a file is locked. Duplicates depend on
+    #  other files. Approximate counts depend on how fast lexing was.
+    return path_data.tmp_dir is None and (
+        source_analysis is None
+        or (
+            source_analysis.state not in (SourceState.duplicate, SourceState.error)
+            and not source_analysis.is_approximate
+        )
+    )
+
+
+class BaseAnalysisCache(ABC):
+    """
+    Base for caches storing analyses in a table of a SQLite database within
+    ``cache_folder``. Once the table holds more than ``cache_size`` analyses,
+    the ones least recently used are evicted.
+    """
+
+    #: Name of the table, which is created in :py:meth:`_create_schema_if_necessary()`.
+    _table_name = None
+
+    #: Columns identifying a row, which are also its primary key.
+    _key_columns = ()
+
+    def __init__(self, cache_folder: str, options_key: str, cache_size: int = DEFAULT_CACHE_SIZE):
+        assert cache_size >= 1
+        os.makedirs(cache_folder, exist_ok=True)
+        self._database_path = os.path.join(cache_folder, CACHE_DATABASE_NAME)
+        self._options_key = options_key
+        self._cache_size = cache_size
+        self._started_at_ns = time.time_ns()
+        self._hit_count = 0
+        self._miss_count = 0
+        self._eviction_count = 0
+        self._pending_rows = []
+        self._used_keys = []
+        self._connection = sqlite3.connect(self._database_path)
+        self._create_schema_if_necessary()
+
+    def _create_schema_if_necessary(self):
+        (schema_version,) = self._connection.execute("pragma user_version").fetchone()
+        if schema_version != _SCHEMA_VERSION:
+            if schema_version != 0:
+                _log.info("discarding cache with outdated schema version %d: %s", schema_version, self._database_path)
+            self._connection.executescript(
+                f"""
+                drop table if exists analysis;
+                drop table if exists path_analysis;
+                create table path_analysis (
+                    options_key text not null,
+                    path text not null,
+                    size integer not null,
+                    modified_ns integer not null,
+                    inode integer not null,
+                    language text not null,
+                    code integer not null,
+                    documentation integer not null,
+                    empty integer not null,
+                    string integer not null,
+                    state text not null,
+                    state_info text,
+                    used_at integer not null,
+                    primary key (options_key, path)
+                );
+                create index path_analysis_used_at on path_analysis (used_at);
+                drop table if exists content_analysis;
+                create table content_analysis (
+                    content_key text not null primary key,
+                    language text not null,
+                    code integer not null,
+                    documentation integer not null,
+                    empty integer not null,
+                    string integer not null,
+                    state text not null,
+                    state_info text,
+                    used_at integer not null
+                );
+                create index content_analysis_used_at on content_analysis (used_at);
+                pragma user_version = {_SCHEMA_VERSION};
+                """
+            )
+
+    @abstractmethod
+    def source_analysis(self, path_data: PathData) -> Optional[SourceAnalysis]:
+        """
+        The cached analysis for ``path_data`` or ``None`` if there is none.
+        """
+
+    @abstractmethod
+    def add(self, path_data: PathData, source_analysis: SourceAnalysis):
+        """
+        Add ``source_analysis`` computed for ``path_data`` to the cache.
+        """
+
+    @property
+    def statistics(self) -> CacheStatistics:
+        return CacheStatistics(self._hit_count, self._miss_count, self._eviction_count)
+
+    def _key_condition(self) -> str:
+        return " and ".join(f"{key_column} = ?" for key_column in self._key_columns)
+
+    def _cached_row(self, key: tuple, extra_columns: tuple[str, ...] = ()) -> Optional[tuple]:
+        columns = ", ".join(extra_columns + _ANALYSIS_COLUMNS)
+        return self._connection.execute(
+            f"select {columns} from {self._table_name} where {self._key_condition()}",
+            key,
+        ).fetchone()
+
+    def _count_hit_or_miss(self, key: Optional[tuple], source_analysis: Optional[SourceAnalysis]):
+        if source_analysis is None:
+            self._miss_count += 1
+        else:
+            self._hit_count += 1
+            self._used_keys.append((self._started_at_ns, *key))
+
+    def _add_row(self, row: tuple):
+        self._pending_rows.append((*row, self._started_at_ns))
+        if len(self._pending_rows) >= _PENDING_ROWS_TO_WRITE:
+            self._write_pending_rows()
+
+    def _write_pending_rows(self):
+        with self._connection:
+            if len(self._pending_rows) >= 1:
+                value_placeholders = ", ".join(["?"] * len(self._pending_rows[0]))
+                self._connection.executemany(
+                    f"insert or replace into {self._table_name} values ({value_placeholders})",
+                    self._pending_rows,
+                )
+            self._connection.executemany(
+                f"update {self._table_name} set used_at = ? where {self._key_condition()}",
+                self._used_keys,
+            )
+        self._pending_rows.clear()
+        self._used_keys.clear()
+
+    def _evict_least_recently_used(self):
+        (entry_count,) = self._connection.execute(f"select count(1) from {self._table_name}").fetchone()
+        if entry_count > self._cache_size:
+            with self._connection:
+                self._eviction_count = self._connection.execute(
+                    f"delete from {self._table_name} where rowid in "
+                    f"(select rowid from {self._table_name} order by used_at limit ?)",
+                    (entry_count - self._cache_size,),
+                ).rowcount
+
+    def close(self):
+        if self._connection is not None:
+            try:
+                self._write_pending_rows()
+                self._evict_least_recently_used()
+                _log.info(
+                    "cache: %d hits, %d misses, %d evictions",
+                    self._hit_count,
+                    self._miss_count,
+                    self._eviction_count,
+                )
+            finally:
+                self._connection.close()
+                self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class AnalysisCache(BaseAnalysisCache):
+    """
+    Cache storing the results of :py:meth:`SourceAnalysis.from_file()`. Each
+    analysis is identified by its path and the ``options_key``, and is only
+    reused as long as the size, modification time and inode of the file
+    remain the same.
+    """
+
+    _table_name = "path_analysis"
+    _key_columns = ("options_key", "path")
+
+    def source_analysis(self, path_data: PathData) -> Optional[SourceAnalysis]:
+        """
+        The cached analysis for ``path_data`` or ``None`` if the cache holds no
+        analysis or the file has changed since.
+        """
+        result = None
+        key = None
+        # NOTE: Files read from git blobs have no modification time to detect changes.
+        if _is_cacheable(path_data) and path_data.git_dir is None:
+            key = (self._options_key, os.path.abspath(path_data.source_path))
+            row = self._cached_row(key, ("size", "modified_ns", "inode"))
+            if row is not None and _file_identity(path_data) == row[:3]:
+                result = _source_analysis_from_row(path_data, row[3:])
+        self._count_hit_or_miss(key, result)
+        return result
+
+    def add(self, path_data: PathData, source_analysis: SourceAnalysis):
+        """
+        Add ``source_analysis`` computed for ``path_data`` to the cache.
+        """
+        if _is_cacheable(path_data, source_analysis) and path_data.git_dir is None:
+            source_identity = _file_identity(path_data)
+            is_racy = source_identity is None or (
+                source_identity[1] >= self._started_at_ns - _RACY_MODIFICATION_DURATION_NS
+            )
+            if not is_racy:
+                self._add_row(
+                    (
+                        self._options_key,
+                        os.path.abspath(path_data.source_path),
+                        *source_identity,
+                        *_analysis_row(source_analysis),
+                    )
+                )
+
+
+class ContentAnalysisCache(BaseAnalysisCache):
+    """
+    Cache storing the results of :py:meth:`SourceAnalysis.from_file()`
+    identified by a hash of the content and the name of the file, and the
+    ``options_key``. Unlike :py:class:`AnalysisCache` this is independent of
+    where the file is stored, so the cache can be shared between machines
+    using :py:meth:`pack()` and :py:meth:`restore()`.
+
+    The file name is part of the key because together with the content it
+    determines the lexer used. To compute the hash of the content, the
+    ``duplicate_pool`` is used if available, so files are hashed only once.
+    Files with a known git blob ID use it instead.
+    """
+
+    _table_name = "content_analysis"
+    _key_columns = ("content_key",)
+
+    def __init__(
+        self,
+        cache_folder: str,
+        options_key: str,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        duplicate_pool: Optional[DuplicatePool] = None,
+    ):
+        super().__init__(cache_folder, options_key, cache_size)
+        self._duplicate_pool = duplicate_pool
+        #: Keys and identities of files looked up without success, which are later passed to :py:meth:`add()`.
+        self._path_to_missed_key_and_identity_map = {}
+
+    def _content_key(self, path_data: PathData) -> str:
+        source_path = path_data.source_path
+        if path_data.blob_id is not None:
+            content_hash = bytes.fromhex(path_data.blob_id)
+        elif self._duplicate_pool is not None:
+            content_hash = self._duplicate_pool.content_hash(source_path)
+        else:
+            content_hash = DuplicatePool.hash_for(source_path)
+        key_hash = hashlib.sha256(content_hash)
+        key_hash.update(b"\0")
+        key_hash.update(os.path.basename(source_path).encode("utf-8", errors="surrogateescape"))
+        key_hash.update(b"\0")
+        key_hash.update(self._options_key.encode("ascii"))
+        return key_hash.hexdigest()
+
+    def source_analysis(self, path_data: PathData) -> Optional[SourceAnalysis]:
+        """
+        The cached analysis for a file with the same name and content as
+        ``path_data``, or ``None`` if the cache holds no such analysis.
+        """
+        result = None
+        key = None
+        if _is_cacheable(path_data):
+            source_identity = _content_identity(path_data)
+            if source_identity is not None:
+                try:
+                    key = (self._content_key(path_data),)
+                except OSError:
+                    key = None
+            if key is not None:
+                row = self._cached_row(key)
+                if row is not None:
+                    result = _source_analysis_from_row(path_data, row)
+                else:
+                    self._path_to_missed_key_and_identity_map[path_data.source_path] = (key, source_identity)
+        self._count_hit_or_miss(key, result)
+        return result
+
+    def add(self, path_data: PathData, source_analysis: SourceAnalysis):
+        """
+        Add ``source_analysis`` computed for ``path_data`` to the cache,
+        provided it was looked up before using :py:meth:`source_analysis()`.
+        """
+        key_and_identity = self._path_to_missed_key_and_identity_map.pop(path_data.source_path, None)
+        if key_and_identity is not None and _is_cacheable(path_data, source_analysis):
+            key, source_identity = key_and_identity
+            # Only add the analysis if the file did not change after the key was computed.
+            if _content_identity(path_data) == source_identity:
+                self._add_row((*key, *_analysis_row(source_analysis)))
+
+    def pack(self, pack_path: str):
+        """
+        Write all cached analyses to a single compressed file at ``pack_path``
+        that can be passed to :py:meth:`restore()`, possibly on another machine.
+        """
+        self._write_pending_rows()
+        row_count = 0
+        with gzip.open(pack_path, "wt", encoding="utf-8") as pack_file:
+            json.dump({"format": _PACK_FORMAT, "version": _PACK_VERSION}, pack_file)
+            pack_file.write("\n")
+            for row in self._connection.execute(
+                f"select content_key, {', '.join(_ANALYSIS_COLUMNS)} from content_analysis order by used_at desc"
+            ):
+                json.dump(row, pack_file)
+                pack_file.write("\n")
+                row_count += 1
+        _log.info("packed %d cached analyses to %s", row_count, pack_path)
+
+    def restore(self, pack_path: str):
+        """
+        Add the cached analyses from a file previously created with
+        :py:meth:`pack()`. If ``pack_path`` does not exist, for example during
+        the first run on a CI runner, the cache remains unchanged.
+        """
+        if not os.path.exists(pack_path):
+            _log.warning("cannot restore cache because it does not exist yet: %s", pack_path)
+            return
+        row_count = 0
+        try:
+            with gzip.open(pack_path, "rt", encoding="utf-8") as pack_file:
+                header = json.loads(pack_file.readline())
+                if header != {"format": _PACK_FORMAT, "version": _PACK_VERSION}:
+                    raise pygount.common.Error(f"cannot restore cache from {pack_path}: unsupported format: {header}")
+                for line in pack_file:
+                    self._add_row(tuple(json.loads(line)))
+                    row_count += 1
+        except (OSError, ValueError) as error:
+            raise pygount.common.Error(f"cannot restore cache from {pack_path}: {error}") from error
+        self._write_pending_rows()
+        _log.info("restored %d cached analyses from %s", row_count, pack_path)
@@ -0,0 +1,359 @@
+"""
+Lexing of large source code in chunks, so that memory stays bounded
+independent of its size.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import codecs
+from collections.abc import Iterator
+from typing import Optional
+
+import pygments.lexer
+import pygments.lexers.c_cpp
+import pygments.token
+
+#: Number of bytes to read and decode at once.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+#: Lexers that only override ``get_tokens_unprocessed()`` to change the type
+#: of single tokens in ways that do not affect whether they are code,
+#: documentation or strings.
+_TOKEN_TYPE_CHANGING_LEXER_CLASSES = (pygments.lexers.c_cpp.CFamilyLexer,)
+
+#: Number of chunks of text a lexer may need to get back to its root state
+#: before :py:func:`chunked_tokens()` cuts the text and restarts there anyway.
+MAX_PENDING_CHUNK_COUNT = 4
+
+#: Number of characters before a restart position that are kept, so
+#: lookbehind assertions of regular expressions still see the same text.
+_RESTART_CONTEXT_SIZE = 256
+
+#: Marker for positions in :py:func:`_restartable_tokens()` where lexing can restart.
+_RESTART = None
+
+#: Marker for other line starts in :py:func:`_restartable_tokens()`.
+_LINE_START = False
+
+_ROOT_STATE_STACK = ("root",)
+
+
+def is_chunkable(lexer: pygments.lexer.Lexer) -> bool:
+    """
+    ``True`` if :py:func:`chunked_tokens()` yields the same tokens with
+    ``lexer`` as lexing all text at once would, as far as they matter for
+    counting lines.
+    """
+    lexer_class = type(lexer)
+    return (
+        isinstance(lexer, pygments.lexer.RegexLexer)
+        and not isinstance(lexer, pygments.lexer.ExtendedRegexLexer)
+        and (
+            lexer_class.get_tokens_unprocessed is pygments.lexer.RegexLexer.get_tokens_unprocessed
+            or issubclass(lexer_class, _TOKEN_TYPE_CHANGING_LEXER_CLASSES)
+        )
+        and not lexer.filters
+        and not lexer.stripall
+        and lexer.tabsize == 0
+    )
+
+
+def decoded_chunks(data_chunks: Iterator[bytes], encoding: str) -> Iterator[str]:
+    """
+    The text of ``data_chunks`` decoded incrementally using ``encoding``,
+    with newlines translated to ``"\\n"`` the same way as
+    :py:func:`pygount.analysis.decoded_text` does for the whole text.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    carriage_return = ""
+    for data_chunk in data_chunks:
+        text = carriage_return + decoder.decode(data_chunk)
+        # A "\r" at the end might be followed by a "\n" in the next chunk.
+        carriage_return = "\r" if text.endswith("\r") else ""
+        if carriage_return:
+            text = text[:-1]
+        yield _normalized_newlines(text)
+    yield _normalized_newlines(carriage_return + decoder.decode(b"", final=True))
+
+
+def _normalized_newlines(text: str) -> str:
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+
+def chunked_tokens(
+    lexer: pygments.lexer.Lexer,
+    texts: Iterator[str],
+    margin: int,
+    max_pending_size: Optional[int] = None,
+    cut_positions: Optional[list[int]] = None,
+) -> Iterator[tuple[pygments.token._TokenType, str]]:
+    """
+    The tokens of the text in ``texts`` the same as
+    ``lexer.get_tokens("".join(texts))`` would yield for a lexer where
+    :py:func:`is_chunkable()` is ``True``, but without joining all the text.
+
+    Each text is appended to the rest of the previous ones, which then is
+    lexed up to the last line start at least ``margin`` characters before its
+    end where the lexer is back in its root state. There, lexing the next
+    text can restart without having to know the text before it. The margin
+    ensures that tokens that could continue beyond the current text are
+    lexed again together with the next one, unless a single token is longer
+    than ``margin``.
+
+    If the lexer does not return to its root state for more than
+    ``max_pending_size`` characters, for example within a huge comment,
+    lexing restarts at the last line start before the margin in the state
+    the lexer is in there, which keeps memory and time bounded. If there is
+    no such line start because a single token is that long, the token is
+    cut at its last line start. To continue it, lexing restarts with the
+    text from the last restart position up to the first line start within
+    the token, followed by the text after the cut, without yielding the
+    tokens for the text already yielded. If that is not possible, lexing
+    restarts in the root state. Either way, the tokens after the cut are
+    only approximate.
+
+    :param max_pending_size: maximum number of characters to lex without
+      returning to the root state, or ``None`` for no limit
+    :param cut_positions: a list to append the position of each token cut
+      in the whole text to
+    """
+    assert is_chunkable(lexer), f"lexer={lexer!r}"
+    assert margin >= 1
+    assert max_pending_size is None or max_pending_size >= 1
+    pending_text = ""
+    pending_start = 0
+    pending_state_stack = _ROOT_STATE_STACK
+    #: Number of characters after ``pending_start`` whose tokens already have been yielded.
+    pending_skip_size = 0
+    #: Position of ``pending_text`` within the whole text.
+    pending_offset = 0
+    has_text = False
+    has_text_started = False
+    has_yielded_tokens = False
+    for chunk_text in texts:
+        text = chunk_text
+        if not has_text_started:
+            # Mimic removing the BOM and the leading newlines of the whole text.
+            if not has_text and text != "":
+                has_text = True
+                if text.startswith("\ufeff"):
+                    text = text[1:]
+            if lexer.stripnl:
+                text = text.lstrip("\n")
+            has_text_started = text != ""
+        pending_text += text
+        restart_limit = len(pending_text) - margin
+        if restart_limit <= pending_start + pending_skip_size:
+            continue
+        restart_position = pending_start
+        restart_state_stack = pending_state_stack
+        pending_tokens = []
+        has_restart_after_limit = False
+        for token_type, token_text in _tokens_after(
+            _restartable_tokens(lexer, pending_text, pending_start, pending_state_stack), pending_skip_size
+        ):
+            if token_type is _RESTART:
+                if token_text > restart_limit:
+                    has_restart_after_limit = True
+                    break
+                yield from pending_tokens
+                has_yielded_tokens = has_yielded_tokens or len(pending_tokens) != 0
+                pending_tokens.clear()
+                restart_position = token_text
+                restart_state_stack = _ROOT_STATE_STACK
+            else:
+                pending_tokens.append((token_type, token_text))
+        skip_size = pending_skip_size if restart_position == pending_start else 0
+        if (
+            max_pending_size is not None
+            and not has_restart_after_limit
+            and restart_limit - restart_position > max_pending_size
+        ):
+            tokens_to_cut, cut_position, cut_state_stack = _tokens_to_cut(
+                lexer, pending_text, restart_position, restart_state_stack, restart_limit
+            )
+            if tokens_to_cut is not None:
+                yield from _tokens_after(tokens_to_cut, skip_size)
+                restart_position = cut_position
+                restart_state_stack = cut_state_stack
+            else:
+                # A single token is longer than the maximum, so cut it at its last line start, if any.
+                cut_position = pending_text.rfind("\n", restart_position, restart_limit) + 1
+                if cut_position <= restart_position:
+                    cut_position = restart_limit
+                yield from _tokens_before(pending_tokens, cut_position - restart_position - skip_size)
+                if cut_positions is not None:
+                    cut_positions.append(pending_offset + cut_position)
+                token_start = _last_token_start(pending_tokens, restart_position + skip_size, cut_position)
+                if token_start == restart_position + skip_size:
+                    # The token continues the one lexed from the restart position in the previous chunk.
+                    token_start = restart_position
+                head_end = pending_text.find("\n", token_start, cut_position) + 1
+                if restart_position < head_end < cut_position and head_end - restart_position <= margin:
+                    context_start = max(0, restart_position - _RESTART_CONTEXT_SIZE)
+                    pending_text = pending_text[context_start:head_end] + pending_text[cut_position:]
+                    pending_start = restart_position - context_start
+                    pending_skip_size = head_end - restart_position
+                    pending_state_stack = restart_state_stack
+                    pending_offset += cut_position - (head_end - context_start)
+                    has_yielded_tokens = True
+                    continue
+                restart_position = cut_position
+                restart_state_stack = _ROOT_STATE_STACK
+            has_yielded_tokens = True
+        if restart_position != pending_start:
+            pending_skip_size = 0
+        pending_state_stack = restart_state_stack
+        context_start = max(0, restart_position - _RESTART_CONTEXT_SIZE)
+        pending_text = pending_text[context_start:]
+        pending_start = restart_position - context_start
+        pending_offset += context_start
+    if lexer.stripnl:
+        pending_text = pending_text.rstrip("\n")
+        if len(pending_text) <= pending_start + pending_skip_size and has_yielded_tokens:
+            # All remaining text are trailing newlines, which lexing the whole text would have removed.
+            return
+    if lexer.ensurenl and not pending_text.endswith("\n"):
+        pending_text += "\n"
+    for token_type, token_text in _tokens_after(
+        _restartable_tokens(lexer, pending_text, pending_start, pending_state_stack), pending_skip_size
+    ):
+        if token_type is not _RESTART:
+            yield token_type, token_text
+
+
+def _tokens_to_cut(
+    lexer: pygments.lexer.RegexLexer, text: str, start: int, state_stack: tuple[str, ...], limit: int
+) -> tuple[Optional[list[tuple[pygments.token._TokenType, str]]], int, tuple[str, ...]]:
+    """
+    The tokens of ``text`` from ``start`` up to the last line start before
+    ``limit``, that line start, and the state stack of the lexer there, so
+    lexing can continue from there. If there is no line start between two
+    tokens, the tokens are ``None``.
+    """
+    result = None
+    cut_position = start
+    cut_state_stack = state_stack
+    tokens = []
+    for token_type, token_text in _restartable_tokens(lexer, text, start, state_stack, has_line_starts=True):
+        if token_type is _RESTART or token_type is _LINE_START:
+            position, line_state_stack = token_text
+            if position > limit:
+                break
+            if position > cut_position:
+                result = list(tokens)
+                cut_position = position
+                cut_state_stack = line_state_stack
+        else:
+            tokens.append((token_type, token_text))
+    return result, cut_position, cut_state_stack
+
+
+def _tokens_before(
+    tokens: list[tuple[pygments.token._TokenType, str]], size: int
+) -> Iterator[tuple[pygments.token._TokenType, str]]:
+    """
+    The ``tokens`` within their first ``size`` characters, with a token
+    crossing this limit cut to fit.
+    """
+    for token_type, token_text in tokens:
+        if size <= 0:
+            break
+        yield token_type, token_text[:size]
+        size -= len(token_text)
+
+
+def _tokens_after(tokens: Iterator[tuple], size: int) -> Iterator[tuple]:
+    """
+    The ``tokens`` without their first ``size`` characters, with a token
+    crossing this limit cut to fit. Markers for positions pass unchanged.
+    """
+    for token_type, token_text in tokens:
+        if size <= 0 or token_type is _RESTART or token_type is _LINE_START:
+            yield token_type, token_text
+        else:
+            if len(token_text) > size:
+                yield token_type, token_text[size:]
+            size -= len(token_text)
+
+
+def _last_token_start(tokens: list[tuple[pygments.token._TokenType, str]], start: int, limit: int) -> int:
+    """
+    The position of the token in ``tokens`` starting at ``start`` that
+    contains ``limit`` or ends there.
+    """
+    result = start
+    for _, token_text in tokens:
+        end = result + len(token_text)
+        if end >= limit:
+            break
+        result = end
+    return result
+
+
+def _restartable_tokens(
+    lexer: pygments.lexer.RegexLexer,
+    text: str,
+    start: int,
+    state_stack: tuple[str, ...] = ("root",),
+    has_line_starts: bool = False,
+) -> Iterator[tuple]:
+    """
+    The tokens of ``text`` starting at ``start`` in the state
+    ``state_stack`` the same as
+    ``pygments.lexer.RegexLexer.get_tokens_unprocessed()`` yields them but
+    without their position. Additionally, ``(_RESTART, position)`` marks
+    each line start where the lexer is in its root state. With
+    ``has_line_starts``, ``(_LINE_START, (position, state_stack))`` also
+    marks all other line starts between two tokens.
+    """
+    position = start
+    token_definitions = lexer._tokens  # noqa: SLF001
+    state_stack = list(state_stack)
+    state_tokens = token_definitions[state_stack[-1]]
+    text_length = len(text)
+    while position < text_length:
+        for regex_match, action, new_state in state_tokens:
+            match = regex_match(text, position)
+            if match:
+                if action is not None:
+                    if type(action) is pygments.token._TokenType:  # noqa: SLF001
+                        yield action, match.group()
+                    else:
+                        for _, token_type, token_text in action(lexer, match):
+                            yield token_type, token_text
+                position = match.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == "#pop":
+                                if len(state_stack) > 1:
+                                    state_stack.pop()
+                            elif state == "#push":
+                                state_stack.append(state_stack[-1])
+                            else:
+                                state_stack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(state_stack):
+                            del state_stack[1:]
+                        else:
+                            del state_stack[new_state:]
+                    elif new_state == "#push":
+                        state_stack.append(state_stack[-1])
+                    else:
+                        raise AssertionError(f"wrong state definition: {new_state!r}")
+                    state_tokens = token_definitions[state_stack[-1]]
+                break
+        else:
+            if text[position] == "\n":
+                state_stack = ["root"]
+                state_tokens = token_definitions["root"]
+                yield pygments.token.Whitespace, "\n"
+            else:
+                yield pygments.token.Error, text[position]
+            position += 1
+        if position > start and text[position - 1] == "\n":
+            if len(state_stack) == 1:
+                yield _RESTART, position if not has_line_starts else (position, _ROOT_STATE_STACK)
+            elif has_line_starts:
+                yield _LINE_START, (position, tuple(state_stack))
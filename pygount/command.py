@@ -6,6 +6,7 @@ Command line interface for pygount.
 # All rights reserved. Distributed under the BSD License.
 import argparse
 import contextlib
+import dataclasses
 import logging
 import os
 import sys
@@ -14,7 +15,14 @@ from rich.progress import Progress
 
 import pygount
 import pygount.analysis
+import pygount.baseline
+import pygount.cache
+import pygount.chunks
 import pygount.common
+import pygount.git_storage
+import pygount.lexer_index
+import pygount.parallel
+import pygount.timing
 import pygount.write
 
 #: Valid formats for option --format.
@@ -26,22 +34,101 @@ _DEFAULT_OUTPUT = "STDOUT"
 _DEFAULT_SOURCE_PATTERNS = os.curdir
 _DEFAULT_SUFFIXES = "*"
 
+_HELP_BASELINE = """JSON result of a previous run written with --format=json;
+ reuse the analyses of all files that did not change since the git reference
+ specified with --since-ref; default: analyze all files"""
+
+_HELP_CACHE_DIR = """folder where to cache the analyses of source code, so that
+ files that did not change since the previous run do not have to be analyzed
+ again; default: do not cache"""
+
+_HELP_CACHE_MODE = '''how to identify files in the cache specified with
+ --cache-dir: "path" uses the path, size and modification time of a file;
+ "content" uses a hash of the content and the name of a file, so the cache can
+ be shared between machines that store the source code in different folders;
+ default: "%(default)s"'''
+
+_HELP_CACHE_PACK = """after the analysis, write the cache specified with
+ --cache-dir and --cache-mode=content to FILE, so it can be restored with
+ --cache-restore, possibly on another machine"""
+
+_HELP_CACHE_RESTORE = """before the analysis, add the analyses from FILE
+ written with --cache-pack to the cache specified with --cache-dir and
+ --cache-mode=content"""
+
+_HELP_CACHE_SIZE = """maximum number of files to keep in the cache specified
+ with --cache-dir; default: %(default)s"""
+
+_HELP_CHUNK_SIZE = """number of bytes above which a file is read, decoded and
+ lexed in chunks of this size, so the memory needed stays bounded even for huge
+ files; default: %(default)s"""
+
+_HELP_COUNT_MODE = '''what to count: "code" tells code, documentation, empty and
+ string lines apart; "lines" only counts non-empty and empty lines without
+ lexing, which is much faster; default: "%(default)s"'''
+
+_HELP_DISAMBIGUATION_SIZE = """number of characters at the start of a file to
+ analyze if the lexers of several languages match its name, for example *.h or
+ *.m; the language chosen is reused for further files with the same suffix in
+ the same folder; use 0 to analyze each entire file on its own, which is
+ slower; default: %(default)s"""
+
 _HELP_ENCODING = '''encoding to use when reading source code; use "automatic"
  to take BOMs, XML prolog and magic headers into account and fall back to
  UTF-8 or CP1252 if none fits; use "automatic;<fallback>" to specify a
  different fallback encoding than CP1252; use "chardet" to let the chardet
  package determine the encoding; default: "%(default)s"'''
 
+_HELP_ENGINE = '''engine to tell code, documentation, empty and string lines
+ apart: "pygments" lexes all files with pygments; "fast" uses dedicated
+ scanners for C, C#, C++, Go, Java, JavaScript, Python and TypeScript, which
+ yield the same counts as pygments, and pygments for all other languages;
+ default: "%(default)s"'''
+
 _HELP_EPILOG = """SHELL-PATTERN is a pattern using *, ? and ranges like [a-z]
  as placeholders. PATTERNS is a comma separated list of SHELL-PATTERN. The
  prefix [regex] indicated that the PATTERNS use regular expression syntax. If
  default values are available, [...] indicates that the PATTERNS extend the
  existing default values."""
 
+_HELP_FILE_MEMORY_LIMIT = """maximum memory a worker process may use while
+ analyzing a single file, for example "2G"; files needing more result in an
+ error and the worker is replaced; default: no limit"""
+
+_HELP_FILE_TIMEOUT = """maximum number of seconds to analyze a single file;
+ files taking longer result in an error and the worker analyzing them is
+ replaced; default: no limit"""
+
 _HELP_FORMAT = 'output format, one of: {}; default: "%(default)s"'.format(
     ", ".join(['"' + output_format + '"' for output_format in VALID_OUTPUT_FORMATS])
 )
 
+_HELP_GIT_FILES = """let git list the files in folders that are part of a git
+ working tree instead of scanning them; this only includes files tracked by
+ git and untracked files that are not ignored"""
+
+_HELP_GIT_REF = """read the source code directly from the git repositories
+ specified as SHELL-PATTERN at REF, for example a branch, tag or commit,
+ without the need for a working tree; remote repositories are cloned without a
+ working tree; default: read files from the file system"""
+
+_HELP_HASH_ALGORITHM = 'algorithm to hash files to detect duplicates, one of: {}; default: "%(default)s"'.format(
+    ", ".join(['"' + hash_algorithm + '"' for hash_algorithm in pygount.analysis.VALID_HASH_ALGORITHMS])
+)
+
+_HELP_JOBS = """number of processes to analyze source code in parallel; use 1
+ to analyze all files in the current process; default: number of usable CPUs"""
+
+_HELP_LEXING_BUDGET = """maximum milliseconds per KiB of source code to lex a
+ file; files taking longer are counted approximately using only the comment
+ syntax of their language; use 0 for no limit; default: %(default)s"""
+
+_HELP_MAX_FILE_SIZE = """maximum size of files to analyze; larger files are not
+ read at all but counted as huge; use "SIZE,LANGUAGE=SIZE,..." to specify
+ different sizes for some languages; a SIZE is a number of bytes optionally
+ followed by K, M or G, for example "10M,json=1M"; use 0 for no limit;
+ default: no limit"""
+
 _HELP_GENERATED = """comma separated list of regular expressions to detect
  generated code; default: %(default)s"""
 
@@ -56,6 +143,14 @@ _HELP_NAMES_TO_SKIP = """comma separated list of glob patterns for file names
  not to analyze. Use "..." as first entry to append patterns to the default
  patterns; default: %(default)s"""
 
+_HELP_SINCE_REF = """git reference, for example a branch, tag or commit, to
+ compare the working tree with to find the files changed since --baseline was
+ written"""
+
+_HELP_STREAM = """start analyzing files while still scanning for them instead of
+ first finding all files and their duplicates; this uses less memory for
+ large numbers of files but cannot show the total progress"""
+
 _HELP_SUFFIX = '''limit analysis on files matching any suffix in comma
  separated LIST; shell patterns are possible; example: "py,sql"; default:
  "%(default)s"'''
@@ -99,18 +194,157 @@ class Command:
 
     def __init__(self):
         self.set_encodings(_DEFAULT_ENCODING)
+        self._baseline = None
+        self._cache_dir = None
+        self._cache_mode = pygount.cache.CACHE_MODE_PATH
+        self._cache_pack = None
+        self._cache_restore = None
+        self._cache_size = pygount.cache.DEFAULT_CACHE_SIZE
+        self._chunk_size = pygount.chunks.DEFAULT_CHUNK_SIZE
+        self._count_mode = pygount.analysis.DEFAULT_COUNT_MODE
+        self._disambiguation_size = pygount.lexer_index.DEFAULT_DISAMBIGUATION_SIZE
+        self._engine = pygount.analysis.DEFAULT_ENGINE
+        self._file_memory_limit = None
+        self._file_timeout = None
         self._folders_to_skip = pygount.common.regexes_from(pygount.analysis.DEFAULT_FOLDER_PATTERNS_TO_SKIP_TEXT)
         self._generated_regexs = pygount.common.regexes_from(pygount.analysis.DEFAULT_GENERATED_PATTERNS_TEXT)
+        self._git_ref = None
         self._has_duplicates = False
+        self._has_git_files = False
+        self._hash_algorithm = pygount.analysis.DEFAULT_HASH_ALGORITHM
         self._has_summary = False
         self._has_to_merge_embedded_languages = False
+        self._is_streaming = False
         self._is_verbose = False
+        self._jobs = pygount.parallel.usable_cpu_count()
+        self._lexing_budget = 0
+        self._max_file_sizes = None
         self._names_to_skip = pygount.common.regexes_from(pygount.analysis.DEFAULT_NAME_PATTERNS_TO_SKIP_TEXT)
         self._output = _DEFAULT_OUTPUT
         self._output_format = _DEFAULT_OUTPUT_FORMAT
+        self._since_ref = None
         self._source_patterns = _DEFAULT_SOURCE_PATTERNS
         self._suffixes = pygount.common.regexes_from(_DEFAULT_SUFFIXES)
 
+    @property
+    def baseline(self):
+        return self._baseline
+
+    def set_baseline(self, baseline, source=None):
+        self._baseline = baseline
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def set_cache_dir(self, cache_dir, source=None):
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_mode(self):
+        return self._cache_mode
+
+    def set_cache_mode(self, cache_mode, source=None):
+        if cache_mode not in pygount.cache.VALID_CACHE_MODES:
+            raise pygount.common.OptionError(
+                f"cache mode is {cache_mode!r} but must be one of: {', '.join(pygount.cache.VALID_CACHE_MODES)}",
+                source,
+            )
+        self._cache_mode = cache_mode
+
+    @property
+    def cache_pack(self):
+        return self._cache_pack
+
+    def set_cache_pack(self, cache_pack, source=None):
+        self._cache_pack = cache_pack
+
+    @property
+    def cache_restore(self):
+        return self._cache_restore
+
+    def set_cache_restore(self, cache_restore, source=None):
+        self._cache_restore = cache_restore
+
+    @property
+    def cache_size(self):
+        return self._cache_size
+
+    def set_cache_size(self, cache_size, source=None):
+        if cache_size < 1:
+            raise pygount.common.OptionError(f"cache size is {cache_size} but must be at least 1", source)
+        self._cache_size = cache_size
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+    def set_chunk_size(self, chunk_size, source=None):
+        if chunk_size < 1:
+            raise pygount.common.OptionError(f"chunk size is {chunk_size} but must be at least 1", source)
+        self._chunk_size = chunk_size
+
+    @property
+    def count_mode(self):
+        return self._count_mode
+
+    def set_count_mode(self, count_mode, source=None):
+        if count_mode not in pygount.analysis.VALID_COUNT_MODES:
+            raise pygount.common.OptionError(
+                f"count mode is {count_mode!r} but must be one of: {', '.join(pygount.analysis.VALID_COUNT_MODES)}",
+                source,
+            )
+        self._count_mode = count_mode
+
+    @property
+    def disambiguation_size(self):
+        return self._disambiguation_size
+
+    def set_disambiguation_size(self, disambiguation_size, source=None):
+        if disambiguation_size < 0:
+            raise pygount.common.OptionError(
+                f"disambiguation size is {disambiguation_size} but must be at least 0", source
+            )
+        self._disambiguation_size = disambiguation_size
+
+    @property
+    def engine(self):
+        return self._engine
+
+    def set_engine(self, engine, source=None):
+        if engine not in pygount.analysis.VALID_ENGINES:
+            raise pygount.common.OptionError(
+                f"engine is {engine!r} but must be one of: {', '.join(pygount.analysis.VALID_ENGINES)}", source
+            )
+        self._engine = engine
+
+    @property
+    def file_memory_limit(self):
+        return self._file_memory_limit
+
+    def set_file_memory_limit(self, file_memory_limit_text, source=None):
+        if file_memory_limit_text is None:
+            self._file_memory_limit = None
+        else:
+            if not pygount.parallel.HAS_RESOURCE:  # pragma: no cover
+                raise pygount.common.OptionError("limiting memory is not supported on this platform", source)
+            try:
+                file_memory_limit = pygount.common.size_from(file_memory_limit_text)
+            except ValueError as error:
+                raise pygount.common.OptionError(f"file memory limit is invalid: {error}", source) from error
+            if file_memory_limit < 1:
+                raise pygount.common.OptionError("file memory limit must be at least 1 byte", source)
+            self._file_memory_limit = file_memory_limit
+
+    @property
+    def file_timeout(self):
+        return self._file_timeout
+
+    def set_file_timeout(self, file_timeout, source=None):
+        if file_timeout is not None and file_timeout <= 0:
+            raise pygount.common.OptionError(f"file timeout is {file_timeout} but must be greater than 0", source)
+        self._file_timeout = file_timeout
+
     def set_encodings(self, encoding, source=None):
         encoding_is_chardet = (encoding == "chardet") or (encoding.startswith("chardet;"))
         if encoding_is_chardet and not pygount.analysis.has_chardet:  # pragma: no cover
@@ -183,6 +417,64 @@ class Command:
     def set_is_verbose(self, is_verbose, source=None):
         self._is_verbose = bool(is_verbose)
 
+    @property
+    def has_git_files(self):
+        return self._has_git_files
+
+    def set_has_git_files(self, has_git_files, source=None):
+        self._has_git_files = bool(has_git_files)
+
+    @property
+    def git_ref(self):
+        return self._git_ref
+
+    def set_git_ref(self, git_ref, source=None):
+        self._git_ref = git_ref
+
+    @property
+    def hash_algorithm(self):
+        return self._hash_algorithm
+
+    def set_hash_algorithm(self, hash_algorithm, source=None):
+        if hash_algorithm not in pygount.analysis.VALID_HASH_ALGORITHMS:
+            raise pygount.common.OptionError(
+                f"hash algorithm is {hash_algorithm!r} but must be one of: "
+                f"{', '.join(pygount.analysis.VALID_HASH_ALGORITHMS)}",
+                source,
+            )
+        self._hash_algorithm = hash_algorithm
+
+    @property
+    def jobs(self):
+        return self._jobs
+
+    def set_jobs(self, jobs, source=None):
+        if jobs < 1:
+            raise pygount.common.OptionError(f"number of jobs is {jobs} but must be at least 1", source)
+        self._jobs = jobs
+
+    @property
+    def lexing_budget(self):
+        return self._lexing_budget
+
+    def set_lexing_budget(self, lexing_budget, source=None):
+        if lexing_budget < 0:
+            raise pygount.common.OptionError(f"lexing budget is {lexing_budget} but must be at least 0", source)
+        self._lexing_budget = lexing_budget
+
+    @property
+    def max_file_sizes(self):
+        return self._max_file_sizes
+
+    def set_max_file_sizes(self, max_file_sizes_text, source=None):
+        if max_file_sizes_text is None:
+            self._max_file_sizes = None
+        else:
+            try:
+                self._max_file_sizes = pygount.analysis.MaxFileSizes.from_text(max_file_sizes_text)
+            except ValueError as error:
+                raise pygount.common.OptionError(f"maximum file size is invalid: {error}", source) from error
+
     @property
     def names_to_skip(self):
         return self._names_to_skip
@@ -212,6 +504,13 @@ class Command:
             )
         self._output_format = output_format
 
+    @property
+    def is_streaming(self):
+        return self._is_streaming
+
+    def set_is_streaming(self, is_streaming, source=None):
+        self._is_streaming = bool(is_streaming)
+
     @property
     def source_patterns(self):
         return self._source_patterns
@@ -221,6 +520,13 @@ class Command:
         self._source_patterns = pygount.common.as_list(glob_patterns_or_text)
         assert len(self._source_patterns) >= 0
 
+    @property
+    def since_ref(self):
+        return self._since_ref
+
+    def set_since_ref(self, since_ref, source=None):
+        self._since_ref = since_ref
+
     @property
     def suffixes(self):
         return self._suffixes
@@ -231,8 +537,52 @@ class Command:
 
     def argument_parser(self):
         parser = argparse.ArgumentParser(description="count source lines of code", epilog=_HELP_EPILOG)
+        parser.add_argument("--baseline", metavar="FILE", help=_HELP_BASELINE)
+        parser.add_argument("--cache-dir", metavar="FOLDER", help=_HELP_CACHE_DIR)
+        parser.add_argument(
+            "--cache-mode",
+            metavar="MODE",
+            choices=pygount.cache.VALID_CACHE_MODES,
+            default=pygount.cache.CACHE_MODE_PATH,
+            help=_HELP_CACHE_MODE,
+        )
+        parser.add_argument("--cache-pack", metavar="FILE", help=_HELP_CACHE_PACK)
+        parser.add_argument("--cache-restore", metavar="FILE", help=_HELP_CACHE_RESTORE)
+        parser.add_argument(
+            "--cache-size", metavar="NUMBER", type=int, default=pygount.cache.DEFAULT_CACHE_SIZE, help=_HELP_CACHE_SIZE
+        )
+        parser.add_argument(
+            "--chunk-size",
+            metavar="NUMBER",
+            type=int,
+            default=pygount.chunks.DEFAULT_CHUNK_SIZE,
+            help=_HELP_CHUNK_SIZE,
+        )
+        parser.add_argument(
+            "--count-mode",
+            metavar="MODE",
+            choices=pygount.analysis.VALID_COUNT_MODES,
+            default=pygount.analysis.DEFAULT_COUNT_MODE,
+            help=_HELP_COUNT_MODE,
+        )
+        parser.add_argument(
+            "--disambiguation-size",
+            metavar="NUMBER",
+            type=int,
+            default=pygount.lexer_index.DEFAULT_DISAMBIGUATION_SIZE,
+            help=_HELP_DISAMBIGUATION_SIZE,
+        )
         parser.add_argument("--duplicates", "-d", action="store_true", help="analyze duplicate files")
         parser.add_argument("--encoding", "-e", default=_DEFAULT_ENCODING, help=_HELP_ENCODING)
+        parser.add_argument(
+            "--engine",
+            metavar="ENGINE",
+            choices=pygount.analysis.VALID_ENGINES,
+            default=pygount.analysis.DEFAULT_ENGINE,
+            help=_HELP_ENGINE,
+        )
+        parser.add_argument("--file-memory-limit", metavar="SIZE", help=_HELP_FILE_MEMORY_LIMIT)
+        parser.add_argument("--file-timeout", metavar="SECONDS", type=float, help=_HELP_FILE_TIMEOUT)
         parser.add_argument(
             "--folders-to-skip",
             "-F",
@@ -255,6 +605,25 @@ class Command:
             default=pygount.analysis.DEFAULT_GENERATED_PATTERNS_TEXT,
             help=_HELP_GENERATED,
         )
+        parser.add_argument("--git-files", action="store_true", help=_HELP_GIT_FILES)
+        parser.add_argument("--git-ref", metavar="REF", help=_HELP_GIT_REF)
+        parser.add_argument(
+            "--hash-algorithm",
+            metavar="ALGORITHM",
+            choices=pygount.analysis.VALID_HASH_ALGORITHMS,
+            default=pygount.analysis.DEFAULT_HASH_ALGORITHM,
+            help=_HELP_HASH_ALGORITHM,
+        )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            metavar="NUMBER",
+            type=int,
+            default=self.jobs,
+            help=_HELP_JOBS,
+        )
+        parser.add_argument("--lexing-budget", metavar="MILLISECONDS", type=float, default=0, help=_HELP_LEXING_BUDGET)
+        parser.add_argument("--max-file-size", metavar="SIZES", help=_HELP_MAX_FILE_SIZE)
         parser.add_argument(
             "--merge-embedded-languages",
             "-m",
@@ -275,6 +644,8 @@ class Command:
             default=_DEFAULT_OUTPUT,
             help='file to write results to; use "STDOUT" for standard output; default: "%(default)s"',
         )
+        parser.add_argument("--since-ref", metavar="REF", help=_HELP_SINCE_REF)
+        parser.add_argument("--stream", action="store_true", help=_HELP_STREAM)
         parser.add_argument("--suffix", "-s", metavar="PATTERNS", default=_DEFAULT_SUFFIXES, help=_HELP_SUFFIX)
         parser.add_argument(
             "source_patterns",
@@ -322,26 +693,158 @@ class Command:
         if arguments is None:  # pragma: no cover
             arguments = sys.argv[1:]
         args, default_encoding, fallback_encoding = self.parsed_args(arguments)
+        self.set_baseline(args.baseline, "option --baseline")
+        self.set_cache_dir(args.cache_dir, "option --cache-dir")
+        self.set_cache_mode(args.cache_mode, "option --cache-mode")
+        self.set_cache_pack(args.cache_pack, "option --cache-pack")
+        self.set_cache_restore(args.cache_restore, "option --cache-restore")
+        self.set_cache_size(args.cache_size, "option --cache-size")
+        self.set_chunk_size(args.chunk_size, "option --chunk-size")
+        self.set_count_mode(args.count_mode, "option --count-mode")
         self.set_default_encoding(default_encoding, "option --encoding")
+        self.set_disambiguation_size(args.disambiguation_size, "option --disambiguation-size")
+        self.set_engine(args.engine, "option --engine")
+        self.set_file_memory_limit(args.file_memory_limit, "option --file-memory-limit")
+        self.set_file_timeout(args.file_timeout, "option --file-timeout")
         self.set_fallback_encoding(fallback_encoding, "option --encoding")
         self.set_folders_to_skip(args.folders_to_skip, "option --folders-to-skip")
         self.set_generated_regexps(args.generated, "option --generated")
         self.set_has_duplicates(args.duplicates, "option --duplicates")
         self.set_has_to_merge_embedded_languages(args.merge_embedded_languages, "option --merge-embedded-languages")
         self.set_is_verbose(args.verbose, "option --verbose")
+        self.set_has_git_files(args.git_files, "option --git-files")
+        self.set_git_ref(args.git_ref, "option --git-ref")
+        self.set_hash_algorithm(args.hash_algorithm, "option --hash-algorithm")
+        self.set_jobs(args.jobs, "option --jobs")
+        self.set_lexing_budget(args.lexing_budget, "option --lexing-budget")
+        self.set_max_file_sizes(args.max_file_size, "option --max-file-size")
         self.set_names_to_skip(args.names_to_skip, "option --folders-to-skip")
         self.set_output(args.out, "option --out")
         self.set_output_format(args.format, "option --format")
+        self.set_since_ref(args.since_ref, "option --since-ref")
+        self.set_is_streaming(args.stream, "option --stream")
         self.set_source_patterns(args.source_patterns, "option PATTERNS")
         self.set_suffixes(args.suffix, "option --suffix")
 
+    def _check_baseline_options(self):
+        if (self.baseline is None) != (self.since_ref is None):
+            raise pygount.common.OptionError("options --baseline and --since-ref must be specified together")
+        if self.baseline is not None and self.git_ref is not None:
+            raise pygount.common.OptionError("option --baseline cannot be combined with option --git-ref")
+
+    def _check_git_files_options(self):
+        if self.has_git_files and self.git_ref is not None:
+            raise pygount.common.OptionError("option --git-files cannot be combined with option --git-ref")
+
+    def _check_git_ref_options(self):
+        if self.git_ref is not None:
+            for source_pattern in self.source_patterns:
+                _, revision = pygount.git_storage.git_remote_url_and_revision_if_any(source_pattern)
+                if revision is not None:
+                    raise pygount.common.OptionError(
+                        f"option --git-ref cannot be combined with revision {revision!r} in URL {source_pattern!r}"
+                    )
+
+    def _check_cache_options(self):
+        for name, value in (("--cache-pack", self.cache_pack), ("--cache-restore", self.cache_restore)):
+            if value is not None:
+                if self.cache_dir is None:
+                    raise pygount.common.OptionError(f"option {name} requires option --cache-dir")
+                if self.cache_mode != pygount.cache.CACHE_MODE_CONTENT:
+                    raise pygount.common.OptionError(
+                        f"option {name} requires option --cache-mode={pygount.cache.CACHE_MODE_CONTENT}"
+                    )
+
+    def _cache(self, duplicate_pool, options_key):
+        if self.cache_mode == pygount.cache.CACHE_MODE_CONTENT:
+            result = pygount.cache.ContentAnalysisCache(self.cache_dir, options_key, self.cache_size, duplicate_pool)
+            if self.cache_restore is not None:
+                result.restore(self.cache_restore)
+        else:
+            result = pygount.cache.AnalysisCache(self.cache_dir, options_key, self.cache_size)
+        return result
+
+    def _analysis_options(self):
+        return {
+            "encoding": self.default_encoding,
+            "fallback_encoding": self.fallback_encoding,
+            "generated_regexes": self._generated_regexs,
+            "merge_embedded_language": self.has_to_merge_embedded_languages,
+            "disambiguation_size": self.disambiguation_size,
+            "engine": self.engine,
+            "count_mode": self.count_mode,
+            "chunk_size": self.chunk_size,
+            "max_file_sizes": self.max_file_sizes,
+            "lexing_budget": self.lexing_budget,
+        }
+
+    def _source_analyses(self, source_paths_and_groups_to_analyze, duplicate_pool, cache, baseline, slow_files):
+        analysis_options = self._analysis_options()
+        if self.file_timeout is not None or self.file_memory_limit is not None:
+            yield from pygount.parallel.isolated_source_analyses(
+                source_paths_and_groups_to_analyze,
+                self.jobs,
+                self.file_timeout,
+                self.file_memory_limit,
+                duplicate_pool,
+                cache,
+                baseline,
+                slow_files,
+                **analysis_options,
+            )
+        elif self.jobs == 1:
+            for path_data in source_paths_and_groups_to_analyze:
+                # Choose lexers the same way as with several jobs, so the result does not depend on them.
+                pygount.parallel.disambiguated_in_advance(path_data, analysis_options)
+                source_analysis = pygount.parallel.precomputed_source_analysis(
+                    path_data, duplicate_pool, cache, baseline, self.max_file_sizes
+                )
+                if source_analysis is None:
+                    source_analysis = pygount.analysis.SourceAnalysis.from_path_data(path_data, **analysis_options)
+                    if cache is not None:
+                        cache.add(path_data, source_analysis)
+                yield source_analysis
+        else:
+            yield from pygount.parallel.source_analyses(
+                source_paths_and_groups_to_analyze, self.jobs, duplicate_pool, cache, baseline, **analysis_options
+            )
+
     def execute(self):
         _log.setLevel(logging.INFO if self.is_verbose else logging.WARNING)
+        self._check_baseline_options()
+        self._check_git_files_options()
+        self._check_git_ref_options()
+        self._check_cache_options()
+        if self.cache_dir is not None:
+            pygount.lexer_index.load_lexer_index(self.cache_dir)
+        disambiguation_statistics_before = dataclasses.replace(pygount.lexer_index.disambiguation_statistics())
+        phase_statistics_before = pygount.timing.phase_statistics().copy()
         with pygount.analysis.SourceScanner(
-            self.source_patterns, self.suffixes, self.folders_to_skip, self.names_to_skip
+            self.source_patterns,
+            self.suffixes,
+            self.folders_to_skip,
+            self.names_to_skip,
+            self.git_ref,
+            self.has_git_files,
         ) as source_scanner:
-            source_paths_and_groups_to_analyze = list(source_scanner.source_paths())
-            duplicate_pool = pygount.analysis.DuplicatePool() if not self.has_duplicates else None
+            source_paths_and_groups_to_analyze = (
+                source_scanner.source_paths() if self.is_streaming else list(source_scanner.source_paths())
+            )
+            options_key = pygount.cache.options_key(**self._analysis_options())
+            baseline = (
+                pygount.baseline.Baseline(self.baseline, self.since_ref, self.source_patterns, options_key)
+                if self.baseline is not None
+                else None
+            )
+            duplicate_pool = pygount.analysis.DuplicatePool(self.hash_algorithm) if not self.has_duplicates else None
+            if duplicate_pool is not None and not self.is_streaming:
+                duplicate_pool.prepare(
+                    [
+                        path_data
+                        for path_data in source_paths_and_groups_to_analyze
+                        if pygount.analysis.huge_source_analysis(path_data, self.max_file_sizes) is None
+                    ]
+                )
             writer_class = _OUTPUT_FORMAT_TO_WRITER_CLASS_MAP[self.output_format]
             is_stdout = self.output == "STDOUT"
             target_context_manager = (
@@ -349,27 +852,59 @@ class Command:
                 if is_stdout
                 else open(self.output, "w", encoding="utf-8", newline="")  # noqa: SIM115
             )
+            cache_context_manager = (
+                self._cache(duplicate_pool, options_key) if self.cache_dir is not None else contextlib.nullcontext()
+            )
             with (
                 target_context_manager as target_file,
                 writer_class(target_file) as writer,
+                cache_context_manager as cache,
                 Progress(disable=not writer.has_to_track_progress, transient=True) as progress,
             ):
+                writer.options_key = options_key
+                slow_files = []
                 try:
-                    for path_data in progress.track(source_paths_and_groups_to_analyze):
-                        writer.add(
-                            pygount.analysis.SourceAnalysis.from_file(
-                                path_data.source_path,
-                                path_data.group,
-                                self.default_encoding,
-                                self.fallback_encoding,
-                                generated_regexes=self._generated_regexs,
-                                duplicate_pool=duplicate_pool,
-                                merge_embedded_language=self.has_to_merge_embedded_languages,
-                                tmp_dir=path_data.tmp_dir,
-                            )
-                        )
+                    for source_analysis in progress.track(
+                        self._source_analyses(
+                            source_paths_and_groups_to_analyze, duplicate_pool, cache, baseline, slow_files
+                        ),
+                        total=None if self.is_streaming else len(source_paths_and_groups_to_analyze),
+                    ):
+                        with pygount.timing.PhaseTimer(pygount.timing.Phase.writing):
+                            writer.add(source_analysis)
                 finally:
                     progress.stop()
+                disambiguation_statistics = pygount.lexer_index.disambiguation_statistics().difference(
+                    disambiguation_statistics_before
+                )
+                _log.info(
+                    "lexer disambiguation: analyzed %d files, reused language for %d files in same folder",
+                    disambiguation_statistics.analyzed_count,
+                    disambiguation_statistics.reused_count,
+                )
+                if baseline is not None:
+                    _log.info("baseline: reused %d analyses", baseline.reused_count)
+                phase_statistics = pygount.timing.phase_statistics().difference(phase_statistics_before)
+                for phase in pygount.timing.Phase:
+                    _log.info("phase %s: %.3f seconds", phase.name.replace("_", " "), phase_statistics.duration(phase))
+                for language, tokenizing_statistics in sorted(
+                    phase_statistics.language_to_tokenizing_statistics_map.items()
+                ):
+                    _log.info(
+                        "tokenizing %s: %.3f seconds, %.0f bytes/s, %.0f lines/s",
+                        language,
+                        tokenizing_statistics.duration,
+                        tokenizing_statistics.bytes_per_second,
+                        tokenizing_statistics.lines_per_second,
+                    )
+                writer.phase_statistics = phase_statistics
+                writer.slow_files = slow_files
+                if cache is not None:
+                    if self.cache_pack is not None:
+                        cache.pack(self.cache_pack)
+                    # Close the cache early so the statistics include evictions.
+                    cache.close()
+                    writer.cache_statistics = cache.statistics
 
 
 def pygount_command(arguments=None):
@@ -381,7 +916,7 @@ def pygount_command(arguments=None):
         result = 0
     except KeyboardInterrupt:  # pragma: no cover
         _log.error("interrupted as requested by user")
-    except (pygount.common.OptionError, OSError) as error:
+    except (pygount.common.Error, OSError) as error:
         _log.error(error)
     except Exception as error:
         _log.exception(error)
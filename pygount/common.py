@@ -4,6 +4,7 @@ Common classes and functions for pygount.
 
 # Copyright (c) 2016-2024, Thomas Aglassinger.
 # All rights reserved. Distributed under the BSD License.
+import contextlib
 import fnmatch
 import functools
 import inspect
@@ -21,6 +22,13 @@ REGEX_PATTERN_PREFIX = "[regex]"
 
 _REGEX_TYPE = type(re.compile(""))
 
+_DEFAULT_REGEX_FLAGS = re.compile("").flags
+
+#: Units for sizes in :py:func:`size_from`.
+_SIZE_UNIT_TO_FACTOR_MAP = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+_SIZE_REGEX = re.compile(r"^(?P<number>\d+)\s*(?P<unit>[kmg]?)b?$", re.IGNORECASE)
+
 
 class Error(Exception):
     """
@@ -100,6 +108,106 @@ def regexes_from(
     return result
 
 
+class NameMatcher:
+    """
+    Matcher to check if a name matches any of the regular expressions
+    ``regexes``, which for example were created using :py:func:`regexes_from()`.
+
+    Regular expressions created from shell patterns without placeholders, for
+    example "__pycache__", are checked as exact names, and those consisting of
+    a "*" followed by such a pattern, for example "*~", as name endings. All
+    other regular expressions are merged into a single one if possible. The
+    result for each name is remembered, so names that occur often only have
+    to be checked once. This is thread safe.
+    """
+
+    def __init__(self, regexes: Sequence[Pattern], max_cached_name_count: int = 65536):
+        names = set()
+        endings = []
+        other_regexes = []
+        for regex in regexes:
+            has_default_flags = regex.flags == _DEFAULT_REGEX_FLAGS
+            literal = _shell_literal_for(regex.pattern) if has_default_flags else None
+            if literal is not None:
+                names.add(literal)
+            elif (
+                has_default_flags
+                and regex.pattern.startswith(_ANY_SHELL_PREFIX_REGEX)
+                and (
+                    (literal := _shell_literal_for(_SHELL_REGEX_PREFIX + regex.pattern[len(_ANY_SHELL_PREFIX_REGEX) :]))
+                    is not None
+                )
+            ):
+                endings.append(literal)
+            else:
+                other_regexes.append(regex)
+        self._names = frozenset(names)
+        self._endings = tuple(endings)
+        self._other_regexes = _merged_regexes(other_regexes)
+        self.matches = functools.lru_cache(maxsize=max_cached_name_count)(self._matches)
+
+    def _matches(self, name: str) -> bool:
+        return (
+            name in self._names
+            or name.endswith(self._endings)
+            or any(regex.match(name) is not None for regex in self._other_regexes)
+        )
+
+
+#: Start and end of the regular expressions :py:func:`fnmatch.translate()` creates.
+_SHELL_REGEX_PREFIX = "(?s:"
+_SHELL_REGEX_SUFFIX = ")\\Z"
+
+#: Start of the regular expressions :py:func:`fnmatch.translate()` creates for shell patterns starting with "*".
+_ANY_SHELL_PREFIX_REGEX = _SHELL_REGEX_PREFIX + ".*"
+
+_ESCAPED_CHARACTER_REGEX = re.compile(r"\\(.)", re.DOTALL)
+
+
+def _shell_literal_for(regex_pattern: str) -> Optional[str]:
+    """
+    The name matched by ``regex_pattern`` if it was created by
+    :py:func:`fnmatch.translate()` for a shell pattern without placeholders,
+    otherwise ``None``.
+    """
+    result = None
+    if regex_pattern.startswith(_SHELL_REGEX_PREFIX) and regex_pattern.endswith(_SHELL_REGEX_SUFFIX):
+        escaped_literal = regex_pattern[len(_SHELL_REGEX_PREFIX) : -len(_SHELL_REGEX_SUFFIX)]
+        literal = _ESCAPED_CHARACTER_REGEX.sub(r"\1", escaped_literal)
+        if (
+            "*" not in literal
+            and "?" not in literal
+            and "[" not in literal
+            and fnmatch.translate(literal) == regex_pattern
+        ):
+            result = literal
+    return result
+
+
+def _merged_regexes(regexes: Sequence[Pattern]) -> list[Pattern]:
+    """
+    A single regular expression that matches if any of ``regexes`` matches,
+    or ``regexes`` themselves if they cannot be merged.
+    """
+    result = list(regexes)
+    if len(regexes) >= 2 and len({regex.flags for regex in regexes}) == 1:
+        # NOTE: Merging fails for example with global flags like "(?i)", which only work at the start.
+        with contextlib.suppress(re.error):
+            result = [re.compile("|".join(f"(?:{regex.pattern})" for regex in regexes), regexes[0].flags)]
+    return result
+
+
+def size_from(text: str) -> int:
+    """
+    The number of bytes described by ``text``, which is a number optionally
+    followed by K, M or G for KiB, MiB or GiB, for example "10M".
+    """
+    size_match = _SIZE_REGEX.match(text.strip())
+    if size_match is None:
+        raise ValueError(f"size must be a number optionally followed by K, M or G but is: {text!r}")
+    return int(size_match.group("number")) * _SIZE_UNIT_TO_FACTOR_MAP[size_match.group("unit").lower()]
+
+
 def lines(text: str) -> Iterator[str]:
     """
     Generator function to yield lines (delimited with ``'\n'``) stored in
@@ -1,5 +1,9 @@
+import logging
+import os
 import re
 import shutil
+from collections.abc import Iterator
+from dataclasses import dataclass
 from tempfile import mkdtemp
 from typing import Optional
 
@@ -11,6 +15,35 @@ _GIT_URL_REGEX = re.compile(
     r"(?P<remote_url>((git|ssh|http(s)?)|(git@[\w.-]+))(:(//)?)([\w.@:/\-~]+)(\.git))(/)?(?P<revision>[\w./\-]+)?"
 )
 
+#: Mode of entries in a git tree for symbolic links.
+_GIT_SYMBOLIC_LINK_MODE = "120000"
+
+#: Mode of entries in a git tree for submodules.
+_GIT_SUBMODULE_MODE = "160000"
+
+#: Modes of entries in a git tree that are not regular files.
+_GIT_NON_BLOB_MODES = (_GIT_SYMBOLIC_LINK_MODE, _GIT_SUBMODULE_MODE)
+
+#: Repositories used by the current process to read blobs, each with its own ``git cat-file --batch`` process.
+_git_dir_to_repo_map: dict[str, git.Repo] = {}
+
+#: Repositories inherited from the parent process, which must neither be used nor closed.
+_inherited_git_repos: list[git.Repo] = []
+
+_log = logging.getLogger("pygount")
+
+
+@dataclass(frozen=True)
+class GitTreeEntry:
+    """
+    A file in a git tree without the need for a working tree.
+    """
+
+    #: Path relative to the folder the tree was listed for, using "/" as separator like git does.
+    relative_path: str
+    blob_id: str
+    size: int
+
 
 def git_remote_url_and_revision_if_any(git_url: str) -> tuple[Optional[str], Optional[str]]:
     assert git_url is not None
@@ -21,10 +54,11 @@ def git_remote_url_and_revision_if_any(git_url: str) -> tuple[Optional[str], Opt
 
 
 class GitStorage:
-    def __init__(self, remote_url: str, revision: Optional[str] = None):
+    def __init__(self, remote_url: str, revision: Optional[str] = None, is_bare: bool = False):
         assert remote_url is not None
         self._remote_url = remote_url
         self._revision = revision
+        self._is_bare = is_bare
         self._temp_folder = mkdtemp()
 
     @property
@@ -32,10 +66,146 @@ class GitStorage:
         return self._temp_folder
 
     def extract(self):
-        multi_options = ["--depth", "1"]
-        if self._revision is not None:
-            multi_options.extend(["--branch", self._revision])
-        git.Repo.clone_from(self._remote_url, self._temp_folder, multi_options=multi_options)
+        if self._is_bare:
+            # Only fetch the objects of the revision but do not write them to a working tree. Unlike
+            # "git clone --branch", this also works for commits.
+            with git.Repo.init(self._temp_folder, bare=True) as repo:
+                repo.git.fetch("--depth", "1", self._remote_url, self._revision or "HEAD")
+                repo.git.update_ref("HEAD", repo.git.rev_parse("FETCH_HEAD^{commit}"))
+        else:
+            multi_options = ["--depth", "1"]
+            if self._revision is not None:
+                multi_options.extend(["--branch", self._revision])
+            git.Repo.clone_from(self._remote_url, self._temp_folder, multi_options=multi_options)
 
     def close(self):
         shutil.rmtree(self._temp_folder, ignore_errors=True)
+
+
+def git_dir_for(repo_folder: str) -> str:
+    """
+    The folder containing the git objects of the repository ``repo_folder``
+    is part of.
+    """
+    with git.Repo(repo_folder, search_parent_directories=True) as repo:
+        return repo.git_dir
+
+
+def git_tree_entries(repo_folder: str, ref: str) -> Iterator[GitTreeEntry]:
+    """
+    Files in the git tree at ``ref`` below ``repo_folder``, which can be a bare
+    repository, the root of a working tree or a folder within. Symbolic links
+    and submodules are skipped.
+    """
+    with git.Repo(repo_folder, search_parent_directories=True) as repo:
+        if repo.working_tree_dir is not None:
+            prefix = os.path.relpath(os.path.realpath(repo_folder), os.path.realpath(repo.working_tree_dir))
+            if prefix == os.curdir:
+                prefix = ""
+        else:
+            prefix = ""
+        prefix = prefix.replace(os.sep, "/")
+        pathspecs = [prefix] if prefix != "" else []
+        # With -l, git lists the size of each blob, so there is no need to read it.
+        ls_tree_output = repo.git.ls_tree("-r", "-l", "-z", "--full-tree", ref, "--", *pathspecs)
+    for ls_tree_line in ls_tree_output.split("\0"):
+        if ls_tree_line != "":
+            info, path = ls_tree_line.split("\t", 1)
+            mode, object_type, blob_id, size = info.split()
+            if object_type == "blob" and mode != _GIT_SYMBOLIC_LINK_MODE:
+                relative_path = path[len(prefix) + 1 :] if prefix != "" else path
+                yield GitTreeEntry(relative_path, blob_id, int(size))
+
+
+def unmodified_blob_ids(work_tree_folder: str) -> Optional[tuple[str, dict[str, str]]]:
+    """
+    The root folder of the git working tree containing ``work_tree_folder``
+    and a map of the paths relative to it (using "/" as separator) to the
+    blob IDs of all files tracked by git that are unchanged in the working
+    tree. This is ``None`` if ``work_tree_folder`` is not part of a git
+    working tree or git cannot be used.
+    """
+    try:
+        with git.Repo(work_tree_folder, search_parent_directories=True) as repo:
+            if repo.working_tree_dir is None:
+                result = None
+            else:
+                # Ask for the modified files after listing the index so that files changed in between are excluded.
+                ls_files_output = repo.git.ls_files("-s", "-z")
+                modified_paths = set(repo.git.ls_files("-m", "-z").split("\0"))
+                path_to_blob_id_map = {}
+                for ls_files_line in ls_files_output.split("\0"):
+                    if ls_files_line != "":
+                        info, path = ls_files_line.split("\t", 1)
+                        mode, blob_id, stage = info.split()
+                        if stage == "0" and mode not in _GIT_NON_BLOB_MODES and path not in modified_paths:
+                            path_to_blob_id_map[path] = blob_id
+                result = os.path.realpath(repo.working_tree_dir), path_to_blob_id_map
+    except git.GitError as error:
+        _log.debug("cannot use git blob IDs for %s: %s", work_tree_folder, error)
+        result = None
+    return result
+
+
+def git_work_tree_paths(work_tree_folder: str) -> Optional[list[str]]:
+    """
+    The paths relative to ``work_tree_folder`` (using "/" as separator) of
+    all files in it that are tracked by git or untracked but not ignored, as
+    listed by ``git ls-files`` without having to walk the folder. Symbolic
+    links, submodules and tracked files deleted from the working tree are
+    excluded. This is ``None`` if ``work_tree_folder`` is not part of a git
+    working tree or git cannot be used.
+    """
+    try:
+        git_command = git.Git(work_tree_folder)
+        ls_files_output = git_command.ls_files("-s", "-z")
+        deleted_paths = set(git_command.ls_files("-d", "-z").split("\0"))
+        others_output = git_command.ls_files("-o", "--exclude-standard", "-z")
+    except git.GitError as error:
+        _log.debug("cannot list git files in %s: %s", work_tree_folder, error)
+        return None
+    result = set()
+    for ls_files_line in ls_files_output.split("\0"):
+        if ls_files_line != "":
+            info, path = ls_files_line.split("\t", 1)
+            mode, _, _ = info.split()
+            if mode not in _GIT_NON_BLOB_MODES and path not in deleted_paths:
+                result.add(path)
+    for path in others_output.split("\0"):
+        # NOTE: Nested git repositories show up as folder ending with "/".
+        if path != "" and not path.endswith("/") and not os.path.islink(os.path.join(work_tree_folder, path)):
+            result.add(path)
+    return sorted(result)
+
+
+def git_blob_data(git_dir: str, blob_id: str) -> bytes:
+    """
+    The content of the blob ``blob_id`` in the repository ``git_dir``. All
+    blobs of a repository are read through a single long running
+    ``git cat-file --batch`` process of the current process.
+    """
+    repo = _git_dir_to_repo_map.get(git_dir)
+    if repo is None:
+        repo = git.Repo(git_dir)
+        _git_dir_to_repo_map[git_dir] = repo
+    _, _, _, result = repo.git.get_object_data(blob_id)
+    return result
+
+
+def close_git_repos():
+    """
+    Stop the processes started by :py:func:`git_blob_data()`.
+    """
+    for repo in _git_dir_to_repo_map.values():
+        repo.close()
+    _git_dir_to_repo_map.clear()
+
+
+def forget_inherited_git_repos():
+    """
+    Forget the processes started by :py:func:`git_blob_data()` in the parent
+    of a forked process without stopping them, so the forked process starts
+    its own ones instead of reading the replies meant for its parent.
+    """
+    _inherited_git_repos.extend(_git_dir_to_repo_map.values())
+    _git_dir_to_repo_map.clear()
@@ -0,0 +1,415 @@
+"""
+Index to find the pygments lexers for a file name without matching it
+against the file name patterns of all lexers, and a pool to reuse their
+instances.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import collections
+import dataclasses
+import fnmatch
+import importlib
+import json
+import logging
+import os
+import re
+from collections.abc import Iterable
+from importlib.metadata import entry_points
+from pathlib import Path
+from typing import Optional
+
+import pygments
+import pygments.lexer
+import pygments.lexers
+import pygments.util
+
+#: Name of the file within the cache folder to store the lexer index in.
+LEXER_INDEX_NAME = "pygount-lexer-index.json"
+
+#: Maximum number of lexer instances the pool of a process keeps.
+DEFAULT_LEXER_POOL_SIZE = 64
+
+#: Default number of characters at the start of a source code that lexers
+#: analyze to decide which of them to use if several match its file name.
+DEFAULT_DISAMBIGUATION_SIZE = 16 * 1024
+
+#: Characters in file name patterns that are placeholders.
+_PLACEHOLDER_CHARACTERS = "*?["
+
+#: Group of the entry points for pygments lexer plugins.
+_PLUGIN_LEXERS_GROUP = "pygments.lexers"
+
+_log = logging.getLogger("pygount")
+
+#: The lexer index used by the current process, once it is needed.
+_name_to_lexer_index_map: dict[str, "LexerIndex"] = {}
+
+_CURRENT_LEXER_INDEX_NAME = "current"
+
+
+class LexerPool:
+    """
+    Instances of lexers to reuse for analyzing many files, so options do not
+    have to be processed again for each file. Pygments lexers do not keep
+    any state between calls to ``get_tokens()``, so this is safe. Once the
+    pool holds more than ``max_size`` lexers, the least recently used one is
+    removed.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_LEXER_POOL_SIZE):
+        assert max_size >= 1
+        self._max_size = max_size
+        self._key_to_lexer_map: collections.OrderedDict[tuple, pygments.lexer.Lexer] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._key_to_lexer_map)
+
+    def lexer(self, lexer_class: type[pygments.lexer.Lexer], **options) -> pygments.lexer.Lexer:
+        """
+        An instance of ``lexer_class`` created with ``options``.
+        """
+        key = (lexer_class, tuple(sorted(options.items())))
+        result = self._key_to_lexer_map.get(key)
+        if result is None:
+            result = lexer_class(**options)
+            self._key_to_lexer_map[key] = result
+            if len(self._key_to_lexer_map) > self._max_size:
+                self._key_to_lexer_map.popitem(last=False)
+        else:
+            self._key_to_lexer_map.move_to_end(key)
+        return result
+
+
+#: Lexer instances of the current process.
+_lexer_pool = LexerPool()
+
+
+def lexer_pool() -> LexerPool:
+    """
+    The :py:class:`LexerPool` of the current process.
+    """
+    return _lexer_pool
+
+
+@dataclasses.dataclass
+class DisambiguationStatistics:
+    """
+    How lexers were chosen for files whose names match several lexers.
+    """
+
+    #: Number of files for which lexers analyzed the source code.
+    analyzed_count: int = 0
+    #: Number of files that used the lexer chosen before for a file in the same folder with the same suffix.
+    reused_count: int = 0
+
+    def add(self, other: "DisambiguationStatistics"):
+        self.analyzed_count += other.analyzed_count
+        self.reused_count += other.reused_count
+
+    def difference(self, other: "DisambiguationStatistics") -> "DisambiguationStatistics":
+        """
+        The decisions in ``self`` made after those in ``other``.
+        """
+        return DisambiguationStatistics(
+            self.analyzed_count - other.analyzed_count, self.reused_count - other.reused_count
+        )
+
+
+#: Disambiguation decisions of the current process.
+_disambiguation_statistics = DisambiguationStatistics()
+
+
+def disambiguation_statistics() -> DisambiguationStatistics:
+    """
+    The :py:class:`DisambiguationStatistics` of the current process.
+    """
+    return _disambiguation_statistics
+
+
+def _has_placeholder(pattern: str) -> bool:
+    return any(placeholder in pattern for placeholder in _PLACEHOLDER_CHARACTERS)
+
+
+def _index_key() -> list:
+    """
+    Something that changes whenever the lexers or their file name patterns
+    might change.
+    """
+    return [
+        pygments.__version__,
+        sorted(entry_point.value for entry_point in entry_points(group=_PLUGIN_LEXERS_GROUP)),
+    ]
+
+
+class LexerIndex:
+    """
+    The file name patterns of all pygments lexers, arranged to find the
+    lexers matching a file name mostly using dictionary lookups:
+
+    * patterns without placeholders map the exact file name to lexers,
+    * patterns of the form "*.suffix" map the part of a file name after its
+      last "." to lexers,
+    * all other patterns are matched one after another.
+
+    Lexer classes are only imported once they are needed, so a
+    :py:class:`LexerIndex` read with :py:meth:`from_json()` does not have to
+    import all lexers of pygments.
+
+    :param lexer_module_and_class_names: the module and class name of each lexer
+    :param patterns: tuples of the form ``(pattern, lexer_number, is_alias)``
+      where ``lexer_number`` refers to ``lexer_module_and_class_names`` and
+      ``is_alias`` indicates that the pattern is from ``alias_filenames``
+      instead of ``filenames``.
+    """
+
+    def __init__(self, lexer_module_and_class_names: list[tuple[str, str]], patterns: list[tuple[str, int, bool]]):
+        self._lexer_module_and_class_names = lexer_module_and_class_names
+        self._patterns = patterns
+        self._lexer_classes: list[Optional[type[pygments.lexer.Lexer]]] = [None] * len(lexer_module_and_class_names)
+        self._name_to_lexer_numbers_and_is_aliases_map = {}
+        self._suffix_to_endings_lexer_numbers_and_is_aliases_map = {}
+        self._endings_lexer_numbers_and_is_aliases_without_suffix = []
+        self._regexes_lexer_numbers_and_is_aliases = []
+        self._folder_and_suffix_to_lexer_number_map: dict[tuple[str, str], int] = {}
+        self._lexer_module_and_class_name_to_lexer_number_map = {
+            tuple(module_and_class_name): lexer_number
+            for lexer_number, module_and_class_name in enumerate(lexer_module_and_class_names)
+        }
+        for pattern, lexer_number, is_alias in patterns:
+            if not _has_placeholder(pattern):
+                self._name_to_lexer_numbers_and_is_aliases_map.setdefault(pattern, []).append((lexer_number, is_alias))
+            elif pattern.startswith("*") and not _has_placeholder(pattern[1:]):
+                ending = pattern[1:]
+                dot_index = ending.rfind(".")
+                if dot_index != -1:
+                    self._suffix_to_endings_lexer_numbers_and_is_aliases_map.setdefault(
+                        ending[dot_index + 1 :], []
+                    ).append((ending, lexer_number, is_alias))
+                else:
+                    self._endings_lexer_numbers_and_is_aliases_without_suffix.append((ending, lexer_number, is_alias))
+            else:
+                self._regexes_lexer_numbers_and_is_aliases.append(
+                    (re.compile(fnmatch.translate(pattern)), lexer_number, is_alias)
+                )
+
+    @staticmethod
+    def build() -> "LexerIndex":
+        """
+        A :py:class:`LexerIndex` for all lexers of pygments including plugins.
+        """
+        # NOTE: This imports all lexers, like pygments.lexers.guess_lexer_for_filename() does.
+        lexer_module_and_class_names = []
+        patterns = []
+        for lexer_number, lexer_class in enumerate(pygments.lexers._iter_lexerclasses()):  # noqa: SLF001
+            lexer_module_and_class_names.append((lexer_class.__module__, lexer_class.__name__))
+            patterns.extend((pattern, lexer_number, False) for pattern in lexer_class.filenames)
+            patterns.extend((pattern, lexer_number, True) for pattern in lexer_class.alias_filenames)
+        return LexerIndex(lexer_module_and_class_names, patterns)
+
+    def to_json(self) -> dict:
+        return {
+            "key": _index_key(),
+            "lexers": self._lexer_module_and_class_names,
+            "patterns": self._patterns,
+        }
+
+    @staticmethod
+    def from_json(index_map: dict) -> Optional["LexerIndex"]:
+        """
+        The :py:class:`LexerIndex` stored in ``index_map`` with
+        :py:meth:`to_json()`, or ``None`` if it is outdated.
+        """
+        result = None
+        if index_map.get("key") == _index_key():
+            result = LexerIndex(
+                [tuple(module_and_class_name) for module_and_class_name in index_map["lexers"]],
+                [
+                    tuple(pattern_lexer_number_and_is_alias)
+                    for pattern_lexer_number_and_is_alias in index_map["patterns"]
+                ],
+            )
+        return result
+
+    def _lexer_class(self, lexer_number: int) -> type[pygments.lexer.Lexer]:
+        result = self._lexer_classes[lexer_number]
+        if result is None:
+            module_name, class_name = self._lexer_module_and_class_names[lexer_number]
+            result = getattr(importlib.import_module(module_name), class_name)
+            self._lexer_classes[lexer_number] = result
+        return result
+
+    def _lexer_numbers_and_is_aliases(self, name: str) -> list[tuple[int, bool]]:
+        result = list(self._name_to_lexer_numbers_and_is_aliases_map.get(name, []))
+        dot_index = name.rfind(".")
+        if dot_index != -1:
+            result.extend(
+                (lexer_number, is_alias)
+                for ending, lexer_number, is_alias in self._suffix_to_endings_lexer_numbers_and_is_aliases_map.get(
+                    name[dot_index + 1 :], []
+                )
+                if name.endswith(ending)
+            )
+        result.extend(
+            (lexer_number, is_alias)
+            for ending, lexer_number, is_alias in self._endings_lexer_numbers_and_is_aliases_without_suffix
+            if name.endswith(ending)
+        )
+        result.extend(
+            (lexer_number, is_alias)
+            for regex, lexer_number, is_alias in self._regexes_lexer_numbers_and_is_aliases
+            if regex.match(name) is not None
+        )
+        return result
+
+    def has_lexer(self, source_path: str) -> bool:
+        """
+        Same as ``pygments.lexers.find_lexer_class_for_filename(source_path) is not None``.
+        """
+        return any(not is_alias for _, is_alias in self._lexer_numbers_and_is_aliases(os.path.basename(source_path)))
+
+    def languages(self, source_path: str) -> list[str]:
+        """
+        The names of the languages whose lexers match the name of
+        ``source_path``, without considering its content.
+        """
+        lexer_numbers = {
+            lexer_number
+            for lexer_number, is_alias in self._lexer_numbers_and_is_aliases(os.path.basename(source_path))
+            if not is_alias
+        }
+        return [self._lexer_class(lexer_number).name for lexer_number in sorted(lexer_numbers)]
+
+    def disambiguation_key(self, source_path: str) -> Optional[tuple[str, str]]:
+        """
+        The folder and suffix for which :py:meth:`guess_lexer_for_filename()`
+        remembers the lexer chosen for ``source_path``, or ``None`` if only
+        one lexer or none at all matches its name.
+        """
+        name = os.path.basename(source_path)
+        lexer_numbers = {lexer_number for lexer_number, _ in self._lexer_numbers_and_is_aliases(name)}
+        return (os.path.dirname(source_path), os.path.splitext(name)[1]) if len(lexer_numbers) >= 2 else None
+
+    def has_decision(self, disambiguation_key: tuple[str, str]) -> bool:
+        return disambiguation_key in self._folder_and_suffix_to_lexer_number_map
+
+    def decisions(self, disambiguation_keys: Iterable[tuple[str, str]]) -> dict[tuple[str, str], tuple[str, str]]:
+        """
+        The module and class name of the lexer chosen for each of
+        ``disambiguation_keys`` that has one, so another process can use the
+        same lexers with :py:meth:`add_decisions()`.
+        """
+        return {
+            disambiguation_key: self._lexer_module_and_class_names[
+                self._folder_and_suffix_to_lexer_number_map[disambiguation_key]
+            ]
+            for disambiguation_key in disambiguation_keys
+            if disambiguation_key in self._folder_and_suffix_to_lexer_number_map
+        }
+
+    def add_decisions(self, disambiguation_key_to_module_and_class_name_map: dict[tuple[str, str], tuple[str, str]]):
+        """
+        Use the lexers chosen in another process as returned by
+        :py:meth:`decisions()` for further files in the same folder with the
+        same suffix.
+        """
+        for disambiguation_key, module_and_class_name in disambiguation_key_to_module_and_class_name_map.items():
+            lexer_number = self._lexer_module_and_class_name_to_lexer_number_map.get(tuple(module_and_class_name))
+            if lexer_number is not None:
+                self._folder_and_suffix_to_lexer_number_map[disambiguation_key] = lexer_number
+
+    def guess_lexer_for_filename(
+        self, source_path: str, text: str, disambiguation_size: int = DEFAULT_DISAMBIGUATION_SIZE
+    ) -> pygments.lexer.Lexer:
+        """
+        Similar to :py:func:`pygments.lexers.guess_lexer_for_filename()`,
+        except that lexers are only imported if their file name patterns
+        match, and their instances come from the :py:func:`lexer_pool()`.
+
+        If several lexers match the file name, they only analyze the first
+        ``disambiguation_size`` characters of ``text``, and the lexer chosen
+        is reused for further files in the same folder with the same suffix,
+        provided it matches their names too. With a ``disambiguation_size``
+        of 0, lexers analyze all of ``text`` for each file, which gives the
+        same result as pygments.
+        """
+        name = os.path.basename(source_path)
+        lexer_number_to_is_primary_map = {}
+        for lexer_number, is_alias in self._lexer_numbers_and_is_aliases(name):
+            if is_alias:
+                lexer_number_to_is_primary_map[lexer_number] = False
+            else:
+                lexer_number_to_is_primary_map.setdefault(lexer_number, True)
+        if len(lexer_number_to_is_primary_map) == 0:
+            raise pygments.util.ClassNotFound(f"no lexer for filename {name!r} found")
+        if len(lexer_number_to_is_primary_map) == 1:
+            (lexer_number,) = lexer_number_to_is_primary_map
+            return _lexer_pool.lexer(self._lexer_class(lexer_number))
+        if disambiguation_size >= 1:
+            folder_and_suffix = (os.path.dirname(source_path), os.path.splitext(name)[1])
+            lexer_number = self._folder_and_suffix_to_lexer_number_map.get(folder_and_suffix)
+            if lexer_number in lexer_number_to_is_primary_map:
+                _disambiguation_statistics.reused_count += 1
+                return _lexer_pool.lexer(self._lexer_class(lexer_number))
+            text_to_analyze = text[:disambiguation_size]
+        else:
+            folder_and_suffix = None
+            text_to_analyze = text
+        lexer_number = self._analyzed_lexer_number(lexer_number_to_is_primary_map, text_to_analyze)
+        _disambiguation_statistics.analyzed_count += 1
+        if folder_and_suffix is not None:
+            self._folder_and_suffix_to_lexer_number_map[folder_and_suffix] = lexer_number
+        return _lexer_pool.lexer(self._lexer_class(lexer_number))
+
+    def _analyzed_lexer_number(self, lexer_number_to_is_primary_map: dict[int, bool], text: str) -> int:
+        ratings_and_lexer_numbers = []
+        for lexer_number, is_primary in sorted(lexer_number_to_is_primary_map.items()):
+            lexer_class = self._lexer_class(lexer_number)
+            rating = lexer_class.analyse_text(text)
+            if rating == 1.0:
+                return lexer_number
+            ratings_and_lexer_numbers.append(
+                ((rating, is_primary, lexer_class.priority, lexer_class.__name__), lexer_number)
+            )
+        ratings_and_lexer_numbers.sort(key=lambda rating_and_lexer_number: rating_and_lexer_number[0])
+        return ratings_and_lexer_numbers[-1][1]
+
+
+def lexer_index() -> LexerIndex:
+    """
+    The :py:class:`LexerIndex` of the current process, which is built when
+    it is needed first unless :py:func:`load_lexer_index()` was called before.
+    """
+    result = _name_to_lexer_index_map.get(_CURRENT_LEXER_INDEX_NAME)
+    if result is None:
+        result = LexerIndex.build()
+        _name_to_lexer_index_map[_CURRENT_LEXER_INDEX_NAME] = result
+    return result
+
+
+def load_lexer_index(cache_folder: str) -> LexerIndex:
+    """
+    Use the :py:class:`LexerIndex` stored in ``cache_folder`` for the current
+    process. If it does not exist yet or is outdated, build it and store it
+    for later runs.
+    """
+    index_path = Path(cache_folder, LEXER_INDEX_NAME)
+    try:
+        with index_path.open(encoding="utf-8") as index_file:
+            result = LexerIndex.from_json(json.load(index_file))
+    except FileNotFoundError:
+        result = None
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        _log.warning("cannot read lexer index %s, building it again: %s", index_path, error)
+        result = None
+    if result is None:
+        _log.info("building lexer index %s", index_path)
+        result = LexerIndex.build()
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_index_path = index_path.with_name(index_path.name + ".tmp")
+        with temp_index_path.open("w", encoding="utf-8") as temp_index_file:
+            json.dump(result.to_json(), temp_index_file)
+        # Replace any previous index in one go, so concurrent runs never read a partially written one.
+        temp_index_path.replace(index_path)
+    _name_to_lexer_index_map[_CURRENT_LEXER_INDEX_NAME] = result
+    return result
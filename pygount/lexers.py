@@ -4,6 +4,9 @@ Additional lexers for pygount that fill gaps left by :py:mod:`pygments`.
 
 # Copyright (c) 2016-2024, Thomas Aglassinger.
 # All rights reserved. Distributed under the BSD License.
+import functools
+import re
+
 import pygments.lexer
 import pygments.lexers
 import pygments.token
@@ -68,3 +71,84 @@ class PlainTextLexer(pygments.lexer.RegexLexer):
 
     name = "Text"
     tokens = {"root": [(r"\s*\n", pygments.token.Text), (r".+\n", pygments.token.Comment.Single)]}
+
+
+#: Comment syntax of languages for :py:func:`minimalistic_lexer()` as tuples of
+#: the form ``(line_comment_starts, block_comment_starts_and_ends, string_quotes)``.
+_C_STYLE_COMMENT_SYNTAX = (["//"], [("/*", "*/")], ['"', "'"])
+_HASH_COMMENT_SYNTAX = (["#"], [], ['"', "'"])
+_LANGUAGE_TO_COMMENT_SYNTAX_MAP = {
+    "ada": (["--"], [], ['"']),
+    "bash": _HASH_COMMENT_SYNTAX,
+    "c": _C_STYLE_COMMENT_SYNTAX,
+    "c#": _C_STYLE_COMMENT_SYNTAX,
+    "c++": _C_STYLE_COMMENT_SYNTAX,
+    "clojure": ([";"], [], ['"']),
+    "css": ([], [("/*", "*/")], ['"', "'"]),
+    "dart": _C_STYLE_COMMENT_SYNTAX,
+    "erlang": (["%"], [], ['"']),
+    "fortran": (["!"], [], ['"', "'"]),
+    "go": (["//"], [("/*", "*/")], ['"', "'", "`"]),
+    "groovy": _C_STYLE_COMMENT_SYNTAX,
+    "haskell": (["--"], [("{-", "-}")], ['"']),
+    "html": ([], [("<!--", "-->")], []),
+    "ini": ([";", "#"], [], []),
+    "java": _C_STYLE_COMMENT_SYNTAX,
+    "javascript": (["//"], [("/*", "*/")], ['"', "'", "`"]),
+    "json": ([], [], ['"']),
+    "kotlin": _C_STYLE_COMMENT_SYNTAX,
+    "lua": (["--"], [("--[[", "]]")], ['"', "'"]),
+    "makefile": (["#"], [], []),
+    "matlab": (["%"], [("%{", "%}")], ['"', "'"]),
+    "objective-c": _C_STYLE_COMMENT_SYNTAX,
+    "perl": _HASH_COMMENT_SYNTAX,
+    "php": (["//", "#"], [("/*", "*/")], ['"', "'"]),
+    "powershell": (["#"], [("<#", "#>")], ['"', "'"]),
+    "python": (["#"], [], ['"""', "'''", '"', "'"]),
+    "r": _HASH_COMMENT_SYNTAX,
+    "ruby": (["#"], [("=begin", "=end")], ['"', "'"]),
+    "rust": (["//"], [("/*", "*/")], ['"']),
+    "scala": _C_STYLE_COMMENT_SYNTAX,
+    "scheme": ([";"], [], ['"']),
+    "sql": (["--"], [("/*", "*/")], ["'", '"']),
+    "swift": _C_STYLE_COMMENT_SYNTAX,
+    "tex": (["%"], [], []),
+    "toml": _HASH_COMMENT_SYNTAX,
+    "typescript": (["//"], [("/*", "*/")], ['"', "'", "`"]),
+    "vb.net": (["'"], [], ['"']),
+    "xml": ([], [("<!--", "-->")], []),
+    "yaml": _HASH_COMMENT_SYNTAX,
+}
+
+
+def _string_regex(quote: str) -> str:
+    escaped_quote = re.escape(quote)
+    if len(quote) >= 2:
+        return escaped_quote + r"[\s\S]*?(?:" + escaped_quote + r"|\Z)"
+    return escaped_quote + r"(?:\\.|[^\\\n" + escaped_quote + "])*" + escaped_quote + "?"
+
+
+@functools.cache
+def minimalistic_lexer(language: str) -> pygments.lexer.RegexLexer:
+    """
+    A lexer for ``language`` that only distinguishes comments, strings and
+    code using the comment syntax of the language, in the style of
+    :py:class:`MinimalisticM4Lexer`. All of its regular expressions match in
+    linear time, so it is a fast fallback for lexers that take too long. For
+    languages with unknown comment syntax, all non-empty lines are code.
+    """
+    line_comment_starts, block_comment_starts_and_ends, string_quotes = _LANGUAGE_TO_COMMENT_SYNTAX_MAP.get(
+        language.lower(), ([], [], [])
+    )
+    root_tokens = [(r"\s+", pygments.token.Text)]
+    root_tokens.extend(
+        (re.escape(start) + r"[\s\S]*?(?:" + re.escape(end) + r"|\Z)", pygments.token.Comment.Multiline)
+        for start, end in block_comment_starts_and_ends
+    )
+    root_tokens.extend((re.escape(start) + r".*", pygments.token.Comment.Single) for start in line_comment_starts)
+    root_tokens.extend((_string_regex(quote), pygments.token.String) for quote in string_quotes)
+    root_tokens.extend([(r"\w+", pygments.token.Name), (r"[^\w\s]", pygments.token.Operator)])
+    lexer_class = type(
+        "MinimalisticCommentLexer", (pygments.lexer.RegexLexer,), {"name": language, "tokens": {"root": root_tokens}}
+    )
+    return lexer_class()
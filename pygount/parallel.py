@@ -0,0 +1,497 @@
+"""
+Parallel analysis of source code using multiple processes.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import contextlib
+import dataclasses
+import logging
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from .analysis import (
+    DuplicatePool,
+    MaxFileSizes,
+    PathData,
+    SourceAnalysis,
+    SourceState,
+    disambiguate_in_advance,
+    huge_source_analysis,
+)
+from .baseline import Baseline
+from .cache import BaseAnalysisCache
+from .git_storage import forget_inherited_git_repos
+from .lexer_index import DisambiguationStatistics, disambiguation_statistics, lexer_index
+from .timing import PhaseStatistics, phase_statistics
+
+try:
+    import resource
+
+    HAS_RESOURCE = True
+except ImportError:  # pragma: no cover
+    # Windows does not support resource limits.
+    HAS_RESOURCE = False
+
+#: Files up to this size (in bytes) are bundled with other files when sent to a worker process.
+SMALL_FILE_SIZE = 64 * 1024
+
+#: Maximum number of bytes of source code sent to a worker process in a single chunk.
+MAX_CHUNK_SIZE = 1024 * 1024
+
+#: Maximum number of files sent to a worker process in a single chunk.
+MAX_CHUNK_FILE_COUNT = 64
+
+#: Number of chunks per worker that can be pending before waiting for results.
+_PENDING_CHUNKS_PER_JOB = 4
+
+#: Maximum number of paths in a chunk including those already analyzed by the main process.
+_MAX_CHUNK_LENGTH = 1024
+
+_log = logging.getLogger("pygount")
+
+
+def usable_cpu_count() -> int:
+    """
+    Number of CPUs the current process can use, which can be less than the
+    number of CPUs on the machine, for example in containers.
+    """
+    try:
+        result = len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        # Some platforms like macOS and Windows do not support CPU affinity.
+        result = os.cpu_count() or 1
+    return max(1, result)
+
+
+@dataclass(frozen=True)
+class SlowFile:
+    """
+    A file whose analysis exceeded the time or memory limit of its worker, or
+    crashed it.
+    """
+
+    path: str
+    #: The names of the lexers matching the name of the file, separated by comma.
+    lexer_names: str
+    #: Why the analysis was stopped.
+    reason: str
+
+
+def _init_worker(log_level: int):
+    # Processes that are spawned instead of forked do not inherit the logging setup.
+    logging.basicConfig(level=logging.WARNING)
+    _log.setLevel(log_level)
+    # Processes that are forked share the "git cat-file" processes of the main process.
+    forget_inherited_git_repos()
+
+
+def disambiguated_in_advance(path_data: PathData, analysis_options: dict[str, Any]) -> Optional[tuple[str, str]]:
+    """
+    Same as :py:func:`pygount.analysis.disambiguate_in_advance()` using the
+    relevant ``analysis_options``.
+    """
+    return disambiguate_in_advance(
+        path_data,
+        **{
+            name: value
+            for name, value in analysis_options.items()
+            if name in ("encoding", "fallback_encoding", "disambiguation_size", "max_file_sizes")
+        },
+    )
+
+
+def _source_analyses_for_chunk(
+    path_datas: list[PathData],
+    analysis_options: dict[str, Any],
+    disambiguation_decisions: dict[tuple[str, str], tuple[str, str]],
+) -> tuple[list[SourceAnalysis], DisambiguationStatistics, PhaseStatistics]:
+    """
+    The analyses of ``path_datas`` together with the lexer disambiguation
+    decisions made and the time spent in each phase for them, so the main
+    process can report these for all workers.
+
+    :param disambiguation_decisions: the lexers chosen by the main process
+      for the folders and suffixes of ``path_datas``, see
+      :py:meth:`pygount.lexer_index.LexerIndex.decisions()`
+    """
+    lexer_index().add_decisions(disambiguation_decisions)
+    disambiguation_statistics_before = dataclasses.replace(disambiguation_statistics())
+    phase_statistics_before = phase_statistics().copy()
+    source_analyses = [SourceAnalysis.from_path_data(path_data, **analysis_options) for path_data in path_datas]
+    return (
+        source_analyses,
+        disambiguation_statistics().difference(disambiguation_statistics_before),
+        phase_statistics().difference(phase_statistics_before),
+    )
+
+
+class _Chunk:
+    """
+    Consecutive paths of which some are already analyzed in the main process
+    (for example duplicates) and the others are to be analyzed by a worker.
+    """
+
+    def __init__(self):
+        #: For each path either its analysis or ``None`` if it has to be analyzed by a worker.
+        self.source_analyses: list[Optional[SourceAnalysis]] = []
+        self.path_datas_to_analyze: list[PathData] = []
+        self.size_to_analyze = 0
+        #: Folders and suffixes of the paths to analyze for which the main process has chosen a lexer.
+        self.disambiguation_keys: set[tuple[str, str]] = set()
+
+    def __len__(self):
+        return len(self.source_analyses)
+
+    def add_source_analysis(self, source_analysis: SourceAnalysis):
+        self.source_analyses.append(source_analysis)
+
+    def add_path_data_to_analyze(
+        self, path_data: PathData, source_size: int, disambiguation_key: Optional[tuple[str, str]] = None
+    ):
+        self.source_analyses.append(None)
+        self.path_datas_to_analyze.append(path_data)
+        self.size_to_analyze += source_size
+        if disambiguation_key is not None:
+            self.disambiguation_keys.add(disambiguation_key)
+
+    def merged_source_analyses(self, analyzed_source_analyses: list[SourceAnalysis]) -> Iterator[SourceAnalysis]:
+        assert len(analyzed_source_analyses) == len(self.path_datas_to_analyze)
+        analyzed_source_analyses_iter = iter(analyzed_source_analyses)
+        for source_analysis in self.source_analyses:
+            yield next(analyzed_source_analyses_iter) if source_analysis is None else source_analysis
+
+
+def _chunks(
+    path_datas: Iterable[PathData],
+    duplicate_pool: Optional[DuplicatePool] = None,
+    cache: Optional[BaseAnalysisCache] = None,
+    baseline: Optional[Baseline] = None,
+    max_file_sizes: Optional[MaxFileSizes] = None,
+    analysis_options: Optional[dict[str, Any]] = None,
+) -> Iterator[_Chunk]:
+    """
+    Chunks of paths to be analyzed by a worker process. Small files are
+    bundled to reduce the overhead of inter process communication while
+    larger files are sent individually to spread the work evenly.
+
+    :param analysis_options: options to choose lexers in advance with
+      :py:func:`disambiguated_in_advance()`
+    """
+    chunk = _Chunk()
+    for path_data in path_datas:
+        disambiguation_key = (
+            disambiguated_in_advance(path_data, analysis_options) if analysis_options is not None else None
+        )
+        source_analysis = precomputed_source_analysis(path_data, duplicate_pool, cache, baseline, max_file_sizes)
+        if source_analysis is not None:
+            chunk.add_source_analysis(source_analysis)
+            if len(chunk) >= _MAX_CHUNK_LENGTH:
+                yield chunk
+                chunk = _Chunk()
+        else:
+            if path_data.size is not None:
+                source_size = path_data.size
+            else:
+                try:
+                    source_size = os.path.getsize(path_data.source_path)
+                except OSError:
+                    # Leave it to the worker to report the error.
+                    source_size = 0
+            is_large = source_size > SMALL_FILE_SIZE
+            if is_large and len(chunk.path_datas_to_analyze) >= 1:
+                yield chunk
+                chunk = _Chunk()
+            chunk.add_path_data_to_analyze(path_data, source_size, disambiguation_key)
+            if (
+                is_large
+                or chunk.size_to_analyze >= MAX_CHUNK_SIZE
+                or len(chunk.path_datas_to_analyze) >= MAX_CHUNK_FILE_COUNT
+            ):
+                yield chunk
+                chunk = _Chunk()
+    if len(chunk) >= 1:
+        yield chunk
+
+
+def precomputed_source_analysis(
+    path_data: PathData,
+    duplicate_pool: Optional[DuplicatePool] = None,
+    cache: Optional[BaseAnalysisCache] = None,
+    baseline: Optional[Baseline] = None,
+    max_file_sizes: Optional[MaxFileSizes] = None,
+) -> Optional[SourceAnalysis]:
+    """
+    The analysis for ``path_data`` if it can be derived without analyzing the
+    source code itself, otherwise ``None``.
+    """
+    # Check the size first, so huge files are not even read to find duplicates.
+    result = huge_source_analysis(path_data, max_file_sizes)
+    if result is None and duplicate_pool is not None:
+        duplicate_path = duplicate_pool.duplicate_path(
+            path_data.source_path,
+            path_data.size,
+            path_data.content_id,
+        )
+        if duplicate_path is not None:
+            _log.info("%s: is a duplicate of %s", path_data.source_path, duplicate_path)
+            result = SourceAnalysis.from_state(
+                path_data.source_path, path_data.group, SourceState.duplicate, duplicate_path, path_data.tmp_dir
+            )
+    if result is None and baseline is not None:
+        result = baseline.source_analysis(path_data)
+    if result is None and cache is not None:
+        result = cache.source_analysis(path_data)
+    return result
+
+
+def source_analyses(
+    path_datas: Iterable[PathData],
+    jobs: int,
+    duplicate_pool: Optional[DuplicatePool] = None,
+    cache: Optional[BaseAnalysisCache] = None,
+    baseline: Optional[Baseline] = None,
+    **analysis_options,
+) -> Iterator[SourceAnalysis]:
+    """
+    Analyses for all ``path_datas`` using ``jobs`` worker processes. The
+    analyses are yielded in the same order as ``path_datas``, so the result
+    is the same as calling :py:meth:`SourceAnalysis.from_path_data()` for each
+    of them in sequence.
+
+    :param cache: a :py:class:`BaseAnalysisCache` to look up analyses before sending them to
+      a worker and to add the analyses computed by the workers to
+    :param baseline: a :py:class:`Baseline` with analyses to reuse for unchanged files
+    :param analysis_options: further options passed to :py:meth:`SourceAnalysis.from_path_data()`
+    """
+    assert jobs >= 1
+    assert "duplicate_pool" not in analysis_options, "duplicate_pool must be passed as separate argument"
+
+    def chunk_source_analyses(chunk: _Chunk, future: Optional[Future]) -> Iterator[SourceAnalysis]:
+        if future is not None:
+            analyzed_source_analyses, chunk_disambiguation_statistics, chunk_phase_statistics = future.result()
+            disambiguation_statistics().add(chunk_disambiguation_statistics)
+            phase_statistics().add(chunk_phase_statistics)
+        else:
+            analyzed_source_analyses = []
+        if cache is not None:
+            for path_data, source_analysis in zip(chunk.path_datas_to_analyze, analyzed_source_analyses):
+                cache.add(path_data, source_analysis)
+        yield from chunk.merged_source_analyses(analyzed_source_analyses)
+
+    max_pending_chunk_count = jobs * _PENDING_CHUNKS_PER_JOB
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(_log.level,)) as executor:
+        pending_chunks_and_futures: deque[tuple[_Chunk, Optional[Future]]] = deque()
+        for chunk in _chunks(
+            path_datas, duplicate_pool, cache, baseline, analysis_options.get("max_file_sizes"), analysis_options
+        ):
+            if len(pending_chunks_and_futures) >= max_pending_chunk_count:
+                yield from chunk_source_analyses(*pending_chunks_and_futures.popleft())
+            future = (
+                executor.submit(
+                    _source_analyses_for_chunk,
+                    chunk.path_datas_to_analyze,
+                    analysis_options,
+                    lexer_index().decisions(chunk.disambiguation_keys),
+                )
+                if len(chunk.path_datas_to_analyze) >= 1
+                else None
+            )
+            pending_chunks_and_futures.append((chunk, future))
+        while len(pending_chunks_and_futures) >= 1:
+            yield from chunk_source_analyses(*pending_chunks_and_futures.popleft())
+
+
+def _isolated_worker(
+    connection: multiprocessing.connection.Connection,
+    analysis_options: dict[str, Any],
+    file_memory_limit: Optional[int],
+    log_level: int,
+):
+    """
+    Analyze the paths received from ``connection`` one after another, using
+    the lexers chosen by the main process sent along with them, and send
+    back each analysis, or ``None`` if it exceeded ``file_memory_limit``, in
+    which case the worker quits because its memory might be fragmented.
+    """
+    _init_worker(log_level)
+    if file_memory_limit is not None:
+        # NOTE: Linux does not enforce RLIMIT_RSS, so limit the address space instead.
+        resource.setrlimit(resource.RLIMIT_AS, (file_memory_limit, file_memory_limit))
+    path_data_and_decisions = connection.recv()
+    while path_data_and_decisions is not None:
+        path_data, disambiguation_decisions = path_data_and_decisions
+        lexer_index().add_decisions(disambiguation_decisions)
+        disambiguation_statistics_before = dataclasses.replace(disambiguation_statistics())
+        phase_statistics_before = phase_statistics().copy()
+        try:
+            source_analysis = SourceAnalysis.from_path_data(path_data, **analysis_options)
+        except MemoryError:
+            source_analysis = None
+        connection.send(
+            (
+                source_analysis,
+                disambiguation_statistics().difference(disambiguation_statistics_before),
+                phase_statistics().difference(phase_statistics_before),
+            )
+        )
+        path_data_and_decisions = connection.recv() if source_analysis is not None else None
+    connection.close()
+
+
+class _IsolatedWorker:
+    """
+    A worker process analyzing one file at a time, which can be killed if it
+    takes too long.
+    """
+
+    def __init__(self, analysis_options: dict[str, Any], file_memory_limit: Optional[int]):
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_isolated_worker,
+            args=(worker_connection, analysis_options, file_memory_limit, _log.level),
+            daemon=True,
+        )
+        self._process.start()
+        worker_connection.close()
+        #: Value of ``time.monotonic()`` when the analysis of the current file exceeds its time limit.
+        self.deadline = math.inf
+
+    def analyze(
+        self,
+        path_data: PathData,
+        disambiguation_decisions: dict[tuple[str, str], tuple[str, str]],
+        file_timeout: Optional[float],
+    ):
+        self.connection.send((path_data, disambiguation_decisions))
+        self.deadline = time.monotonic() + file_timeout if file_timeout is not None else math.inf
+
+    def exit_code(self) -> Optional[int]:
+        self._process.join(1)
+        return self._process.exitcode
+
+    def close(self, is_killing: bool = False):
+        if not is_killing:
+            # The worker might have already quit.
+            with contextlib.suppress(OSError):
+                self.connection.send(None)
+            self._process.join(1)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self.connection.close()
+
+
+def isolated_source_analyses(
+    path_datas: Iterable[PathData],
+    jobs: int,
+    file_timeout: Optional[float] = None,
+    file_memory_limit: Optional[int] = None,
+    duplicate_pool: Optional[DuplicatePool] = None,
+    cache: Optional[BaseAnalysisCache] = None,
+    baseline: Optional[Baseline] = None,
+    slow_files: Optional[list[SlowFile]] = None,
+    **analysis_options,
+) -> Iterator[SourceAnalysis]:
+    """
+    Same as :py:func:`source_analyses()`, except that each file is analyzed
+    on its own by one of ``jobs`` worker processes. If the analysis takes
+    longer than ``file_timeout`` seconds, needs more than
+    ``file_memory_limit`` bytes or crashes the worker, the worker is replaced
+    and the file results in :py:attr:`SourceState.error`.
+
+    :param slow_files: a list to append a :py:class:`SlowFile` to for each
+      file whose analysis was stopped
+    """
+    assert jobs >= 1
+    assert file_timeout is None or file_timeout > 0
+    assert file_memory_limit is None or HAS_RESOURCE
+    max_file_sizes = analysis_options.get("max_file_sizes")
+    path_data_iter = iter(path_datas)
+    # For each path not yet yielded, a list with its path data and analysis, or None while it is being analyzed.
+    pending_path_datas_and_analyses: deque[list] = deque()
+    idle_workers = [_IsolatedWorker(analysis_options, file_memory_limit) for _ in range(jobs)]
+    busy_worker_to_path_data_and_analysis_map: dict[_IsolatedWorker, list] = {}
+    has_more_path_datas = True
+    try:
+        while True:
+            while (
+                has_more_path_datas
+                and len(idle_workers) >= 1
+                and len(pending_path_datas_and_analyses) < _MAX_CHUNK_LENGTH
+            ):
+                path_data = next(path_data_iter, None)
+                if path_data is None:
+                    has_more_path_datas = False
+                else:
+                    disambiguation_key = disambiguated_in_advance(path_data, analysis_options)
+                    path_data_and_analysis = [
+                        path_data,
+                        precomputed_source_analysis(path_data, duplicate_pool, cache, baseline, max_file_sizes),
+                    ]
+                    pending_path_datas_and_analyses.append(path_data_and_analysis)
+                    if path_data_and_analysis[1] is None:
+                        worker = idle_workers.pop()
+                        worker.analyze(
+                            path_data,
+                            lexer_index().decisions([disambiguation_key] if disambiguation_key is not None else []),
+                            file_timeout,
+                        )
+                        busy_worker_to_path_data_and_analysis_map[worker] = path_data_and_analysis
+            while len(pending_path_datas_and_analyses) >= 1 and pending_path_datas_and_analyses[0][1] is not None:
+                yield pending_path_datas_and_analyses.popleft()[1]
+            if len(busy_worker_to_path_data_and_analysis_map) == 0:
+                if not has_more_path_datas:
+                    break
+                continue
+            deadline = min(worker.deadline for worker in busy_worker_to_path_data_and_analysis_map)
+            ready_connections = multiprocessing.connection.wait(
+                [worker.connection for worker in busy_worker_to_path_data_and_analysis_map],
+                None if deadline == math.inf else max(0.0, deadline - time.monotonic()),
+            )
+            for worker, path_data_and_analysis in list(busy_worker_to_path_data_and_analysis_map.items()):
+                path_data = path_data_and_analysis[0]
+                reason = None
+                if worker.connection in ready_connections:
+                    try:
+                        source_analysis, worker_disambiguation_statistics, worker_phase_statistics = (
+                            worker.connection.recv()
+                        )
+                    except EOFError:
+                        reason = f"analysis crashed with exit code {worker.exit_code()}"
+                    else:
+                        disambiguation_statistics().add(worker_disambiguation_statistics)
+                        phase_statistics().add(worker_phase_statistics)
+                        if source_analysis is None:
+                            reason = f"analysis exceeded memory limit of {file_memory_limit} bytes"
+                elif time.monotonic() >= worker.deadline:
+                    reason = f"analysis exceeded time limit of {file_timeout} seconds"
+                else:
+                    continue
+                del busy_worker_to_path_data_and_analysis_map[worker]
+                if reason is None:
+                    if cache is not None:
+                        cache.add(path_data, source_analysis)
+                    idle_workers.append(worker)
+                else:
+                    worker.close(is_killing=True)
+                    idle_workers.append(_IsolatedWorker(analysis_options, file_memory_limit))
+                    lexer_names = ", ".join(lexer_index().languages(path_data.source_path))
+                    _log.warning("%s: %s using lexer %s", path_data.source_path, reason, lexer_names)
+                    if slow_files is not None:
+                        slow_files.append(SlowFile(path_data.source_path, lexer_names, reason))
+                    source_analysis = SourceAnalysis.from_state(
+                        path_data.source_path, path_data.group, SourceState.error, reason, path_data.tmp_dir
+                    )
+                path_data_and_analysis[1] = source_analysis
+    finally:
+        for worker in [*idle_workers, *busy_worker_to_path_data_and_analysis_map]:
+            worker.close(is_killing=worker in busy_worker_to_path_data_and_analysis_map)
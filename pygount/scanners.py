@@ -0,0 +1,1117 @@
+"""
+Fast scanners that mark the lines of source code in a few common languages
+the same way the pygments lexers would, but only look for the tokens that
+actually matter to the result: comments and strings.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import keyword
+import re
+from collections.abc import Callable
+from typing import Optional
+
+import pygments.lexer
+
+#: Bits in the marks of a line for the kinds of source code it contains.
+CODE_MARK = 1
+DOCUMENTATION_MARK = 2
+STRING_MARK = 4
+
+#: Number of possible combinations of marks in a line.
+MARK_COMBINATION_COUNT = 8
+
+#: Characters the ``rstrip()`` of the pygments tokens regards as white space.
+_WHITE_SPACE_CHARACTERS = " \f\n\r\t"
+
+#: Lines with at least one character left after removing everything white.
+_NON_EMPTY_LINE_REGEX = re.compile(r"[^\n]+")
+
+
+class _BailOut(Exception):
+    """
+    Raised by a scanner that found a construct it cannot mark the same way as
+    the pygments lexer would.
+    """
+
+
+def _lexer_text(lexer: pygments.lexer.Lexer, text: str) -> str:
+    """
+    The text a pygments lexer actually tokenizes, see
+    ``pygments.lexer.Lexer.get_tokens()``.
+    """
+    if text.startswith("\ufeff"):
+        text = text[1:]
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    if lexer.stripall:
+        text = text.strip()
+    elif lexer.stripnl:
+        text = text.strip("\n")
+    if lexer.tabsize > 0:
+        text = text.expandtabs(lexer.tabsize)
+    if lexer.ensurenl and not text.endswith("\n"):
+        text += "\n"
+    return text
+
+
+class _LineMarker:
+    """
+    Marks of the lines in ``text`` which scanners set by marking the ranges
+    of comments and strings. Everything in between is code, which only marks
+    a line if it has something else than white characters and words.
+    """
+
+    def __init__(self, text: str):
+        assert text.endswith("\n")
+        self.text = text
+        self._code_texts = []
+        self._code_end = 0
+        self._line_number = 0
+        self._line_start = 0
+        line_count = text.count("\n")
+        self._documentation_marks = bytearray(line_count)
+        self._string_marks = bytearray(line_count)
+
+    def mark(self, start: int, end: int, mark: int):
+        """
+        Mark all lines ``text[start:end]`` spans with ``mark``, which must be
+        ``DOCUMENTATION_MARK`` or ``STRING_MARK``.
+        """
+        assert self._code_end <= start < end, f"start={start}, end={end}, code_end={self._code_end}"
+        text = self.text
+        self._code_texts.append(text[self._code_end : start])
+        first_line_number = self._line_number + text.count("\n", self._line_start, start)
+        newline_count = text.count("\n", start, end)
+        # Keep the newlines so the code text has the same lines, or at least
+        # separate the words around the range.
+        self._code_texts.append("\n" * newline_count if newline_count != 0 else " ")
+        last_line_number = first_line_number + newline_count - (text[end - 1] == "\n")
+        marks = self._documentation_marks if mark == DOCUMENTATION_MARK else self._string_marks
+        marks[first_line_number : last_line_number + 1] = bytes([mark]) * (last_line_number - first_line_number + 1)
+        self._code_end = end
+        self._line_number = first_line_number + newline_count
+        self._line_start = end
+
+    def line_marks(self, white_text: str, white_words: set[str]) -> bytearray:
+        """
+        The marks of all lines, with code between the marked ranges of
+        comments and strings.
+        """
+        self._code_texts.append(self.text[self._code_end :])
+        code_text = "".join(self._code_texts)
+        if white_words:
+            white_words_pattern = "|".join(re.escape(white_word) for white_word in sorted(white_words))
+            code_text = re.sub(rf"\b(?:{white_words_pattern})\b", " ", code_text)
+        code_text = code_text.translate(str.maketrans("", "", white_text.replace("\n", "")))
+        code_marks = (
+            _NON_EMPTY_LINE_REGEX.sub("\x01", code_text).replace("\x01\n", "\x01").replace("\n", "\x00").encode("ascii")
+        )
+        line_count = len(code_marks)
+        assert line_count == len(self._documentation_marks)
+        combined_marks = (
+            int.from_bytes(code_marks, "little")
+            | int.from_bytes(self._documentation_marks, "little")
+            | int.from_bytes(self._string_marks, "little")
+        )
+        return bytearray(combined_marks.to_bytes(line_count, "little"))
+
+
+def _line_start(text: str, position: int) -> int:
+    return text.rfind("\n", 0, position) + 1
+
+
+def _identifier_start(text: str, start: int, position: int) -> int:
+    """
+    Position of the first character of the identifier or number that ends at
+    ``position``, but not before ``start``.
+    """
+    result = position
+    while result > start and (text[result - 1].isalnum() or text[result - 1] == "_"):
+        result -= 1
+    return result
+
+
+#: Prefixes of Python strings, in lower case.
+_PYTHON_STRING_PREFIXES = {"", "b", "br", "f", "fr", "r", "rb", "rf", "u"}
+
+_PYTHON_CODE_REGEX = re.compile(r"""#|["']|^[ \t]*(?:match|case)\b""", re.MULTILINE)
+
+_PYTHON_DOCSTRING_PREFIX_REGEX = re.compile(r"[rRuUbB]{,2}")
+
+_PYTHON_SOFT_KEYWORD_REGEX = re.compile(
+    r"(^[ \t]*)(match|case)\b(?![ \t]*(?:[:,;=^&|@~)\]}]|(?:"
+    + "|".join(word for word in keyword.kwlist if word[0].islower())
+    + r")\b))",
+    re.MULTILINE,
+)
+
+_PYTHON_SOFT_KEYWORD_PATTERN_REGEX = re.compile(r"(\s+)([^\n_]*)(_\b)", re.MULTILINE)
+
+#: Escape sequences in strings depending on the string prefix, see
+#: ``pygments.lexers.python.PythonLexer``.
+_PYTHON_BYTES_ESCAPE_PATTERN = r"\\(?:[\\abfnrtv\"\']|\n|x[a-fA-F0-9]{2}|[0-7]{1,3})"
+_PYTHON_STRING_ESCAPE_PATTERN = r"\\(?:N\{.*?\}|u[a-fA-F0-9]{4}|U[a-fA-F0-9]{8})|" + _PYTHON_BYTES_ESCAPE_PATTERN
+_PYTHON_FSTRING_ESCAPE_PATTERN = r"\{\{|\}\}"
+
+_PYTHON_STRING_FORMAT_PATTERN = (
+    r"%(?:\(\w+\))?[-#0 +]*(?:[0-9]+|[*])?(?:\.(?:[0-9]+|[*]))?[hlL]?[E-GXc-giorsaux%]"
+    r"|\{(?:(?:\w+)(?:(?:\.\w+)|(?:\[[^\]]+\]))*)?(?:\![sra])?"
+    r"(?:\:(?:.?[<>=\^])?[-+ ]?#?0?(?:\d+)?,?(?:\.\d+)?[E-GXb-gnosx%]?)?\}"
+)
+
+_PYTHON_FSTRING_EXPRESSION_START_PATTERN = (
+    r"(?P<open>[{(\[])"
+    r"|(?P<space>\s+)"
+    r"|(?P<string>(?:[rR][fF]|[fF][rR]|[fF]|[rR][bB]|[bB][rR]|[rR]|[uU]|[bB])?[\"'])"
+)
+
+_PYTHON_FSTRING_EXPRESSION_REGEX = re.compile(
+    r"(?P<close>(?:=\s*)?(?:![sraf])?\})|(?P<colon>(?:=\s*)?(?:![sraf])?:)|"
+    + _PYTHON_FSTRING_EXPRESSION_START_PATTERN
+    + r"|(?P<other>[^\W\d]\w*|\d\w*|!=|==|<<|>>|:=|[-~+/*%=<>&^|.]|.)"
+)
+
+_PYTHON_FSTRING_INNER_EXPRESSION_REGEX = re.compile(
+    _PYTHON_FSTRING_EXPRESSION_START_PATTERN
+    + r"|(?P<close>[\])}])|(?P<other>[^\W\d]\w*|\d\w*|!=|==|<<|>>|:=|[-~+/*%=<>&^|.]|.)"
+)
+
+#: Regular expressions to tokenize the inside of strings, see
+#: :py:func:`_python_string_token_regex`.
+_python_key_to_string_token_regex_map = {}
+
+
+def _python_string_token_regex(quote: str, prefix: str) -> re.Pattern:
+    """
+    Regular expression to find the tokens in the inside of a Python string
+    starting with ``quote`` (which can be a triple quote) and ``prefix`` (in
+    lower case) the same way the pygments lexer does. The name of the group
+    that matched tells what kind of token was found.
+    """
+    key = (quote, prefix)
+    result = _python_key_to_string_token_regex_map.get(key)
+    if result is None:
+        is_fstring = "f" in prefix
+        is_raw = "r" in prefix
+        is_single_line = len(quote) == 1
+        escape_patterns = []
+        if is_fstring:
+            escape_patterns.append(_PYTHON_FSTRING_ESCAPE_PATTERN)
+        if not is_raw:
+            escape_patterns.append(_PYTHON_BYTES_ESCAPE_PATTERN if prefix == "b" else _PYTHON_STRING_ESCAPE_PATTERN)
+        patterns = [f"(?P<escape>{'|'.join(escape_patterns)})"] if escape_patterns else []
+        patterns.append(f"(?P<end>{quote})")
+        if is_single_line:
+            patterns.append(r"(?P<escaped_quote>\\\\|\\" + quote + r"|\\\n)")
+        if is_fstring:
+            patterns.extend([r"(?P<interpolation_end>\})", r"(?P<expression>\{)", r"(?P<content>[^\\\'\"{}\n]+)"])
+        else:
+            patterns.extend([f"(?P<format>{_PYTHON_STRING_FORMAT_PATTERN})", r"(?P<content>[^\\\'\"%{\n]+)"])
+        patterns.append(r"(?P<other>[\'\"\\])")
+        if not is_fstring:
+            patterns.append(r"(?P<percent>%|(?:\{{1,2}))")
+        if not is_single_line:
+            patterns.append(r"(?P<newline>\n)")
+        result = re.compile("|".join(patterns), re.MULTILINE)
+        _python_key_to_string_token_regex_map[key] = result
+    return result
+
+
+class _PythonScanner:
+    """
+    Scanner for Python mirroring ``pygments.lexers.PythonLexer`` including
+    the conversion of strings after a colon (``:``) to comments.
+    """
+
+    def __init__(self, marker: _LineMarker):
+        self._marker = marker
+        self._text = marker.text
+        self._is_after_colon = True
+
+    def scan(self):
+        text = self._text
+        code_start = 0
+        position = 0
+        while True:
+            match = _PYTHON_CODE_REGEX.search(text, position)
+            if match is None:
+                break
+            start = match.start()
+            found = text[start]
+            if found == "#":
+                self._skip_code(code_start, start)
+                end = text.find("\n", start)
+                self._marker.mark(start, end, DOCUMENTATION_MARK)
+                code_start = position = end
+            elif found in "\"'":
+                prefix_start = _identifier_start(text, code_start, start)
+                prefix = text[prefix_start:start]
+                if prefix[:1].isdigit():
+                    if not prefix.isdigit():
+                        raise _BailOut("string prefix after number")
+                    prefix_start = start
+                    prefix = ""
+                elif prefix.lower() not in _PYTHON_STRING_PREFIXES:
+                    prefix_start = start
+                    prefix = ""
+                self._skip_code(code_start, prefix_start)
+                end = self._docstring_end(code_start, prefix_start, start)
+                if end is None:
+                    # NOTE: If a newline reset the lexer, it is just code like after any other string.
+                    end, _ = self._string_end(prefix_start, start, prefix.lower())
+                code_start = position = end
+            else:
+                soft_keyword_match = _PYTHON_SOFT_KEYWORD_REGEX.match(text, start)
+                if soft_keyword_match is not None:
+                    pattern_match = _PYTHON_SOFT_KEYWORD_PATTERN_REGEX.match(text, soft_keyword_match.end())
+                    if pattern_match is not None and any(character in pattern_match.group(2) for character in "\"'#\\"):
+                        raise _BailOut("soft keyword pattern with string")
+                position = match.end()
+        self._skip_code(code_start, len(text))
+
+    def _skip_code(self, start: int, end: int):
+        self._is_after_colon_for(self._text[start:end])
+
+    def _is_after_colon_for(self, code: str):
+        last_non_white_code = code.rstrip(_WHITE_SPACE_CHARACTERS)
+        if last_non_white_code != "":
+            self._is_after_colon = last_non_white_code[-1] == ":"
+
+    def _mark_string(self, start: int, end: int):
+        if start < end:
+            self._marker.mark(start, end, DOCUMENTATION_MARK if self._is_after_colon else STRING_MARK)
+
+    def _docstring_end(self, code_start: int, prefix_start: int, quote_start: int) -> Optional[int]:
+        text = self._text
+        quote = text[quote_start] * 3
+        if not text.startswith(quote, quote_start):
+            return None
+        line_start = _line_start(text, prefix_start)
+        if (
+            line_start < code_start
+            or text[line_start:prefix_start].strip() != ""
+            or _PYTHON_DOCSTRING_PREFIX_REGEX.fullmatch(text, prefix_start, quote_start) is None
+        ):
+            return None
+        end = text.find(quote, quote_start + 3)
+        if end == -1:
+            return None
+        result = end + 3
+        self._mark_string(prefix_start, result)
+        return result
+
+    def _string_end(self, start: int, quote_start: int, prefix: str) -> tuple[int, bool]:
+        """
+        Mark the string that starts at ``start`` and has its opening quote at
+        ``quote_start``. The result is the position after the string, and if
+        a newline in a single line string reset the lexer, the position of
+        the newline.
+        """
+        text = self._text
+        quote = text[quote_start]
+        if text.startswith(quote * 3, quote_start):
+            quote *= 3
+        token_regex = _python_string_token_regex(quote, prefix)
+        string_start = start
+        position = quote_start + len(quote)
+        text_length = len(text)
+        while position < text_length:
+            match = token_regex.match(text, position)
+            if match is None:
+                # NOTE: Only a newline in a single line string can end up here, which resets the lexer.
+                assert text[position] == "\n"
+                self._mark_string(string_start, position)
+                return position, True
+            kind = match.lastgroup
+            position = match.end()
+            if kind == "end":
+                break
+            if kind == "expression":
+                self._mark_string(string_start, position)
+                position, is_reset = self._fstring_expression_end(position)
+                if is_reset:
+                    return position, True
+                string_start = position
+            elif not self._is_after_colon and match.group() == ":":
+                self._mark_string(string_start, position)
+                self._is_after_colon = True
+                string_start = position
+        self._mark_string(string_start, position)
+        return position, False
+
+    def _is_after_colon_for_string_token(self, token_text: str):
+        if not self._is_after_colon:
+            self._is_after_colon = token_text == ":"
+
+    def _fstring_expression_end(self, position: int) -> tuple[int, bool]:
+        """
+        Process the expression in an f-string starting at ``position`` up to
+        the position where the literal part of the string continues.
+        """
+        text = self._text
+        text_length = len(text)
+        depth = 0
+        while position < text_length:
+            match = (_PYTHON_FSTRING_INNER_EXPRESSION_REGEX if depth else _PYTHON_FSTRING_EXPRESSION_REGEX).match(
+                text, position
+            )
+            kind = match.lastgroup
+            token_start = position
+            position = match.end()
+            if kind == "open":
+                depth += 1
+                self._is_after_colon = False
+            elif kind == "close":
+                if depth == 0:
+                    # NOTE: This is a string token, and the literal part of the string continues with it.
+                    self._mark_string(token_start, position)
+                    self._is_after_colon_for_string_token(match.group())
+                    break
+                depth -= 1
+                self._is_after_colon = False
+            elif kind == "colon":
+                self._mark_string(token_start, position)
+                self._is_after_colon_for_string_token(match.group())
+                break
+            elif kind == "space":
+                self._is_after_colon_for(match.group())
+            elif kind == "string":
+                quote_start = position - 1
+                prefix = text[token_start:quote_start].lower()
+                position, is_reset = self._string_end(token_start, quote_start, prefix)
+                if is_reset:
+                    return position, True
+            else:
+                token_text = match.group()
+                if token_text[0].isdigit() and position < text_length and text[position] in "\"'":
+                    raise _BailOut("string prefix after number")
+                self._is_after_colon = token_text == ":"
+        return position, False
+
+
+def _python_marks(marker: _LineMarker):
+    _PythonScanner(marker).scan()
+
+
+_GO_CODE_REGEX = re.compile(r"[/'\"`]")
+
+_GO_MULTILINE_COMMENT_REGEX = re.compile(r"/(?:\\\n)?[*].*?[*](?:\\\n)?/", re.DOTALL)
+
+_GO_CHARACTER_REGEX = re.compile(
+    r"'(?:\\['\"\\abfnrtv]|\\x[0-9a-fA-F]{2}|\\[0-7]{1,3}|\\u[0-9a-fA-F]{4}|\\U[0-9a-fA-F]{8}|[^\\])'"
+)
+
+_GO_STRING_REGEX = re.compile(r'"(?:\\\\|\\[^\\]|[^"\\])*"')
+
+_GO_RAW_STRING_REGEX = re.compile(r"`[^`]*`")
+
+
+def _go_marks(marker: _LineMarker):
+    """
+    Mark comments and strings the same way as ``pygments.lexers.GoLexer``.
+    """
+    text = marker.text
+    position = 0
+    while True:
+        match = _GO_CODE_REGEX.search(text, position)
+        if match is None:
+            break
+        start = match.start()
+        found = text[start]
+        if found == "/":
+            if text.startswith("//", start):
+                end = text.find("\n", start)
+                marker.mark(start, end, DOCUMENTATION_MARK)
+                position = end
+                continue
+            comment_match = _GO_MULTILINE_COMMENT_REGEX.match(text, start)
+            if comment_match is not None:
+                marker.mark(start, comment_match.end(), DOCUMENTATION_MARK)
+                position = comment_match.end()
+            else:
+                position = start + 1
+        else:
+            string_regex = (
+                _GO_STRING_REGEX if found == '"' else _GO_CHARACTER_REGEX if found == "'" else _GO_RAW_STRING_REGEX
+            )
+            string_match = string_regex.match(text, start)
+            if string_match is not None:
+                marker.mark(start, string_match.end(), STRING_MARK)
+                position = string_match.end()
+            else:
+                position = start + 1
+
+
+_JAVA_CODE_REGEX = re.compile(r"[/\"']|(?<![\w$@.])(?:class|interface|var|import|package|record)\b")
+
+_JAVA_CHARACTER_REGEX = re.compile(r"'\\.'|'[^\\]'|'\\u[0-9a-fA-F]{4}'", re.DOTALL)
+
+_JAVA_STRING_REGEX = re.compile(r'"(?:[^\\"]|\\.)*"', re.DOTALL)
+
+_JAVA_TEXT_BLOCK_TOKEN_REGEX = re.compile(r'\\.|"""', re.DOTALL)
+
+_JAVA_IDENTIFIER_START_REGEX = re.compile(r"\s*(?:[^\W\d]|\$)")
+
+_JAVA_VAR_REGEX = re.compile(r"\s+(?:[^\W\d]|\$)")
+
+_JAVA_IMPORT_REGEX = re.compile(r"(?:\s+static)?\s+[\w.]")
+
+_JAVA_RECORD_PREFIX_REGEX = re.compile(r"\s*(?:(?:public|private|protected|static|strictfp)\s+)*")
+
+
+def _java_marks(marker: _LineMarker):
+    """
+    Mark comments and strings the same way as ``pygments.lexers.JavaLexer``.
+    """
+    text = marker.text
+    code_start = 0
+    position = 0
+    while True:
+        match = _JAVA_CODE_REGEX.search(text, position)
+        if match is None:
+            break
+        start = match.start()
+        found = match.group()
+        position = match.end()
+        if found == "/":
+            if text.startswith("//", start):
+                end = text.find("\n", start)
+                marker.mark(start, end, DOCUMENTATION_MARK)
+                code_start = position = end
+            elif text.startswith("/*", start):
+                end = text.find("*/", start + 2)
+                if end != -1:
+                    marker.mark(start, end + 2, DOCUMENTATION_MARK)
+                    code_start = position = end + 2
+        elif found == '"':
+            if text.startswith('"""\n', start):
+                end = len(text)
+                for token_match in _JAVA_TEXT_BLOCK_TOKEN_REGEX.finditer(text, start + 4):
+                    if token_match.group() == '"""':
+                        end = token_match.end()
+                        break
+            else:
+                string_match = _JAVA_STRING_REGEX.match(text, start)
+                end = string_match.end() if string_match is not None else len(text)
+            marker.mark(start, end, STRING_MARK)
+            code_start = position = end
+        elif found == "'":
+            character_match = _JAVA_CHARACTER_REGEX.match(text, start)
+            if character_match is not None:
+                marker.mark(start, character_match.end(), STRING_MARK)
+                code_start = position = character_match.end()
+        elif found in ("class", "interface"):
+            if _JAVA_IDENTIFIER_START_REGEX.match(text, position) is None:
+                raise _BailOut(f"{found} without name")
+        elif found == "var":
+            if text[position : position + 1].isspace() and _JAVA_VAR_REGEX.match(text, position) is None:
+                raise _BailOut("var without name")
+        elif found in ("import", "package"):
+            if text[position : position + 1].isspace() and _JAVA_IMPORT_REGEX.match(text, position) is None:
+                raise _BailOut(f"{found} without name")
+        else:
+            assert found == "record"
+            line_start = _line_start(text, start)
+            is_record = line_start >= code_start and _JAVA_RECORD_PREFIX_REGEX.fullmatch(text, line_start, start)
+            if is_record and _JAVA_IDENTIFIER_START_REGEX.match(text, position) is None:
+                raise _BailOut("record without name")
+
+
+_CSHARP_CODE_REGEX = re.compile(r"[/\"'#\[]|[@$]\"|(?<![\w@])(?:namespace|using)\b")
+
+_CSHARP_VERBATIM_STRING_REGEX = re.compile(r'@"(?:""|[^"])*"', re.DOTALL)
+
+_CSHARP_STRING_REGEX = re.compile(r'\$?"(?:\\\\|\\[^\\]|[^"\\\n])*["\n]', re.DOTALL)
+
+_CSHARP_CHARACTER_REGEX = re.compile(r"'\\.'|'[^\\]'", re.DOTALL)
+
+_CSHARP_PREPROCESSOR_REGEX = re.compile(
+    r"#[ \t]*(?:if|endif|else|elif|define|undef|line|error|warning|region|endregion|pragma)\b.*?\n", re.DOTALL
+)
+
+_CSHARP_NAMESPACE_REGEX = re.compile(r"\s+(?:\(|@?[_a-zA-Z]|\.)")
+
+
+def _csharp_marks(marker: _LineMarker):
+    """
+    Mark comments and strings the same way as ``pygments.lexers.CSharpLexer``.
+    """
+    text = marker.text
+    code_start = 0
+    position = 0
+    while True:
+        match = _CSHARP_CODE_REGEX.search(text, position)
+        if match is None:
+            break
+        start = match.start()
+        found = match.group()
+        position = match.end()
+        if found == "/":
+            if text.startswith("//", start):
+                end = text.find("\n", start)
+                marker.mark(start, end, DOCUMENTATION_MARK)
+                code_start = position = end
+            elif text.startswith("/*", start):
+                end = text.find("*/", start + 2)
+                if end != -1:
+                    marker.mark(start, end + 2, DOCUMENTATION_MARK)
+                    code_start = position = end + 2
+        elif found in ('"', '$"', '@"', "'"):
+            string_regex = (
+                _CSHARP_VERBATIM_STRING_REGEX
+                if found == '@"'
+                else _CSHARP_CHARACTER_REGEX
+                if found == "'"
+                else _CSHARP_STRING_REGEX
+            )
+            string_match = string_regex.match(text, start)
+            if string_match is not None:
+                marker.mark(start, string_match.end(), STRING_MARK)
+                code_start = position = string_match.end()
+            else:
+                # NOTE: The quote is an error token, so the lexer continues after the prefix.
+                position = start + 1
+        elif found == "#":
+            preprocessor_match = _CSHARP_PREPROCESSOR_REGEX.match(text, start)
+            if preprocessor_match is not None:
+                position = preprocessor_match.end()
+        elif found == "[":
+            line_start = _line_start(text, start)
+            if line_start >= code_start and text[line_start:start].strip() == "":
+                end = text.find("]", start + 1)
+                if end != -1:
+                    # NOTE: Attributes are code as a whole, even with strings in them.
+                    position = end + 1
+        elif _CSHARP_NAMESPACE_REGEX.match(text, position) is None and text[position : position + 1].isspace():
+            raise _BailOut(f"{found} without name")
+
+
+_C_CODE_REGEX = re.compile(r"[/\"'#]")
+
+_C_WHITE_SPACE_PATTERN = r"\s*(?:/[*].*?[*]/\s*)?"
+
+_C_WHITE_SPACE_REGEX = re.compile(_C_WHITE_SPACE_PATTERN)
+
+_C_IF_0_REGEX = re.compile(rf"{_C_WHITE_SPACE_PATTERN}#if\s+0")
+
+_C_IF_0_TOKEN_REGEX = re.compile(
+    r"(?P<push>^\s*#if.*?(?<!\\)\n)|(?P<pop>^\s*#el(?:se|if).*\n|^\s*#endif.*?(?<!\\)\n)|(?P<comment>.*?\n)",
+    re.MULTILINE,
+)
+
+_C_MACRO_TOKEN_REGEX = re.compile(
+    rf"(?P<include>(?P<include_white_space>{_C_WHITE_SPACE_PATTERN}include{_C_WHITE_SPACE_PATTERN})"
+    r"(?:\"[^\"]+\"|<[^>]+>)(?P<include_comment>[^\n]*))"
+    r"|(?P<code>[^/\n]+)|(?P<comment>/[*][\s\S]*?[*]/)|(?P<line_comment>//.*?\n)|(?P<slash>/)|(?P<newline>\n)"
+)
+
+_C_SINGLE_LINE_COMMENT_PATTERN = r"//(?:.|(?<=\\)\n)*\n"
+
+_C_MULTILINE_COMMENT_PATTERN = r"/(?:\\\n)?[*](?:[^*]|[*](?!(?:\\\n)?/))*[*](?:\\\n)?/"
+
+_C_SINGLE_LINE_COMMENT_REGEX = re.compile(_C_SINGLE_LINE_COMMENT_PATTERN)
+
+_C_MULTILINE_COMMENT_REGEX = re.compile(_C_MULTILINE_COMMENT_PATTERN)
+
+_C_COMMENT_REGEX = re.compile(rf"{_C_SINGLE_LINE_COMMENT_PATTERN}|{_C_MULTILINE_COMMENT_PATTERN}")
+
+#: The part of a function definition after its signature up to the body.
+_C_FUNCTION_BODY_START_REGEX = re.compile(
+    rf"\s*(?:(?:(?:{_C_SINGLE_LINE_COMMENT_PATTERN})|(?:{_C_MULTILINE_COMMENT_PATTERN}))\s*)*[^;{{/\"']*\{{"
+)
+
+_C_UNCLOSED_MULTILINE_COMMENT_REGEX = re.compile(r"/(?:\\\n)?[*]")
+
+_C_STRING_REGEX = re.compile(r'"(?:[^"\\\n]|\\[\s\S])*')
+
+_C_CHARACTER_REGEX = re.compile(r"'(?:\\.|\\[0-7]{1,3}|\\x[a-fA-F0-9]{1,2}|[^\\\'\n])'")
+
+_C_STRING_PREFIXES = {"", "L", "U", "u", "u8"}
+
+_CPP_RAW_STRING_PREFIXES = {"LR", "R", "UR", "u8R", "uR"}
+
+_CPP_RAW_STRING_REGEX = re.compile(r"(?:[LuU]|u8)?R\"([^\\()\s]{,16})\((?:.|\n)*?\)\1\"")
+
+_C_HEX_PART_PATTERN = r"[0-9a-fA-F](?:'?[0-9a-fA-F])*"
+_C_DECIMAL_PART_PATTERN = r"\d(?:'?\d)*"
+_C_INTEGER_SUFFIX_PATTERN = r"(?:[uU][lL]{0,2}|[lL]{1,2}[uU]?)?"
+
+#: Numbers in the same order as the rules of ``pygments.lexers.CLexer``,
+#: which might contain digit separators (``'``).
+_C_NUMBER_REGEX = re.compile(
+    rf"0[xX](?:{_C_HEX_PART_PATTERN}\.{_C_HEX_PART_PATTERN}|\.{_C_HEX_PART_PATTERN}|{_C_HEX_PART_PATTERN})"
+    rf"[pP][+-]?{_C_HEX_PART_PATTERN}[lL]?"
+    rf"|(?:{_C_DECIMAL_PART_PATTERN}\.{_C_DECIMAL_PART_PATTERN}|\.{_C_DECIMAL_PART_PATTERN}|{_C_DECIMAL_PART_PATTERN})"
+    rf"[eE][+-]?{_C_DECIMAL_PART_PATTERN}[fFlL]?"
+    rf"|(?:{_C_DECIMAL_PART_PATTERN}\.(?:{_C_DECIMAL_PART_PATTERN})?|\.{_C_DECIMAL_PART_PATTERN})[fFlL]?"
+    rf"|{_C_DECIMAL_PART_PATTERN}[fFlL]"
+    rf"|0[xX]{_C_HEX_PART_PATTERN}{_C_INTEGER_SUFFIX_PATTERN}"
+    rf"|0[bB][01](?:'?[01])*{_C_INTEGER_SUFFIX_PATTERN}"
+    rf"|0(?:'?[0-7])+{_C_INTEGER_SUFFIX_PATTERN}"
+    rf"|{_C_DECIMAL_PART_PATTERN}{_C_INTEGER_SUFFIX_PATTERN}"
+)
+
+
+class _CScanner:
+    """
+    Scanner for C and C++ mirroring ``pygments.lexers.CLexer`` and
+    ``pygments.lexers.CppLexer``.
+    """
+
+    def __init__(self, marker: _LineMarker, is_cpp: bool):
+        self._marker = marker
+        self._text = marker.text
+        self._is_cpp = is_cpp
+
+    def scan(self):
+        text = self._text
+        marker = self._marker
+        code_start = 0
+        previous_code_start = 0
+        latest_mark_start = -1
+        position = 0
+        while True:
+            match = _C_CODE_REGEX.search(text, position)
+            if match is None:
+                break
+            start = match.start()
+            found = text[start]
+            position = start + 1
+            end = None
+            if found == "/":
+                comment_match = _C_SINGLE_LINE_COMMENT_REGEX.match(text, start) or _C_MULTILINE_COMMENT_REGEX.match(
+                    text, start
+                )
+                if comment_match is not None:
+                    end = comment_match.end()
+                    if text[start + 1] == "/" and self._is_possible_function_signature_end(start, end):
+                        # NOTE: The parenthesis could end the signature of a function, which pygments then lexes
+                        #  separately without the rest of the comment.
+                        raise _BailOut("parenthesis in line comment")
+                elif _C_UNCLOSED_MULTILINE_COMMENT_REGEX.match(text, start) is not None:
+                    end = len(text)
+                if end is not None:
+                    marker.mark(start, end, DOCUMENTATION_MARK)
+            elif found == '"':
+                end = self._string_end(code_start, start)
+            elif found == "'":
+                end = self._character_end(code_start, start)
+            else:
+                assert found == "#"
+                # NOTE: The line start must be a position the lexer reaches, with at most one comment in front of the
+                # "#", which then is the latest range marked.
+                line_start = _line_start(text, start)
+                is_preprocessor = (
+                    line_start >= code_start or previous_code_start <= line_start <= latest_mark_start
+                ) and _C_WHITE_SPACE_REGEX.fullmatch(text, line_start, start) is not None
+                if is_preprocessor:
+                    end = self._preprocessor_end(line_start, start)
+            if end is not None:
+                latest_mark_start = start
+                previous_code_start, code_start = code_start, end
+                position = end
+
+    def _is_possible_function_signature_end(self, start: int, end: int) -> bool:
+        text = self._text
+        parenthesis_position = text.find(")", start, end)
+        if parenthesis_position == -1:
+            return False
+        statement_start = max(text.rfind(character, 0, start) for character in ";{}") + 1
+        statement = _C_COMMENT_REGEX.sub(" ", text[statement_start:start])
+        return (
+            statement.count("(") > statement.count(")")
+            and _C_FUNCTION_BODY_START_REGEX.match(text, parenthesis_position + 1) is not None
+        )
+
+    def _string_end(self, code_start: int, start: int) -> int:
+        text = self._text
+        prefix_start = _identifier_start(text, code_start, start)
+        prefix = text[prefix_start:start]
+        if self._is_cpp and prefix in _CPP_RAW_STRING_PREFIXES:
+            raw_string_match = _CPP_RAW_STRING_REGEX.match(text, prefix_start)
+            if raw_string_match is not None:
+                self._marker.mark(prefix_start, raw_string_match.end(), STRING_MARK)
+                return raw_string_match.end()
+        string_match = _C_STRING_REGEX.match(text, start)
+        result = string_match.end()
+        if text[result] == '"':
+            result += 1
+        self._marker.mark(prefix_start if prefix in _C_STRING_PREFIXES else start, result, STRING_MARK)
+        return result
+
+    def _character_end(self, code_start: int, start: int) -> Optional[int]:
+        text = self._text
+        prefix_start = _identifier_start(text, code_start, start)
+        if prefix_start < start and text[prefix_start].isdigit():
+            number_match = _C_NUMBER_REGEX.match(text, prefix_start)
+            if number_match is not None and number_match.end() > start:
+                return None
+        character_match = _C_CHARACTER_REGEX.match(text, start)
+        if character_match is None:
+            return None
+        result = character_match.end()
+        self._marker.mark(
+            prefix_start if text[prefix_start:start] in _C_STRING_PREFIXES else start, result, STRING_MARK
+        )
+        return result
+
+    def _preprocessor_end(self, line_start: int, start: int) -> int:
+        text = self._text
+        if_0_match = _C_IF_0_REGEX.match(text, line_start)
+        if if_0_match is not None:
+            return self._if_0_end(if_0_match.end())
+        position = start + 1
+        text_length = len(text)
+        while position < text_length:
+            match = _C_MACRO_TOKEN_REGEX.match(text, position)
+            kind = match.lastgroup
+            position = match.end()
+            if kind == "include":
+                if "/" in match.group("include_white_space"):
+                    raise _BailOut("comment in include")
+                if match.group("include_comment") != "":
+                    self._marker.mark(match.start("include_comment"), position, DOCUMENTATION_MARK)
+            elif kind == "comment":
+                self._marker.mark(match.start(), position, DOCUMENTATION_MARK)
+            elif kind == "line_comment":
+                self._marker.mark(match.start(), position, DOCUMENTATION_MARK)
+                break
+            elif kind == "newline" and text[position - 2] != "\\":
+                break
+        brace_position = text.find("{", start, position)
+        if (
+            brace_position != -1
+            and (text.find('"', brace_position, position) != -1 or "'" in text[brace_position:position])
+            and self._is_possible_function_body_start(start, brace_position)
+        ):
+            # NOTE: The brace could start the body of a function, which pygments then lexes without the macro.
+            raise _BailOut("brace and string in macro")
+        return position
+
+    def _is_possible_function_body_start(self, start: int, brace_position: int) -> bool:
+        text = self._text
+        if any(character in text[start:brace_position] for character in ";/\"'"):
+            return False
+        previous_position = max(text.rfind(character, 0, start) for character in ";{/\"'")
+        return (previous_position != -1 and text[previous_position] == "/") or ")" in text[
+            previous_position + 1 : start
+        ]
+
+    def _if_0_end(self, position: int) -> int:
+        text = self._text
+        text_length = len(text)
+        depth = 1
+        while depth != 0 and position < text_length:
+            match = _C_IF_0_TOKEN_REGEX.match(text, position)
+            kind = match.lastgroup
+            if kind == "push":
+                depth += 1
+            elif kind == "pop":
+                depth -= 1
+            else:
+                self._marker.mark(position, match.end(), DOCUMENTATION_MARK)
+            position = match.end()
+        return position
+
+
+def _c_marks(marker: _LineMarker):
+    _CScanner(marker, is_cpp=False).scan()
+
+
+def _cpp_marks(marker: _LineMarker):
+    _CScanner(marker, is_cpp=True).scan()
+
+
+_JAVASCRIPT_CODE_REGEX = re.compile(r"[/\"'`}]|<!--")
+
+_JAVASCRIPT_HASHBANG_REGEX = re.compile(r"#! ?/.*?$", re.MULTILINE)
+
+_JAVASCRIPT_STRING_REGEXES = {
+    '"': re.compile(r'"(?:\\\\|\\[^\\]|[^"\\])*"'),
+    "'": re.compile(r"'(?:\\\\|\\[^\\]|[^'\\])*'"),
+}
+
+_JAVASCRIPT_REGEX_REGEX = re.compile(r"/(?:\\.|[^[/\\\n]|\[(?:\\.|[^\]\\\n])*])+/(?:[gimuysd]+\b|\B)", re.DOTALL)
+
+_JAVASCRIPT_TEMPLATE_TOKEN_REGEX = re.compile(r"\\.|`|\$\{", re.DOTALL)
+
+_JAVASCRIPT_OPERATOR_CHARACTERS = "+-~?:<>=!*|&%^/\\."
+
+_JAVASCRIPT_OPERATOR_REGEX = re.compile(
+    r"(?P<other>\.\.\.|=>|\.)|\+\+|--|~|\?\?=?|\?|:|\\(?=\n)|(?:<<|>>>?|==?|!=?|(?:\*\*|\|\||&&|[-<>+*%&|^/]))=?"
+)
+
+_TYPESCRIPT_MODULE_REGEX = re.compile(r"\bmodule\s*[\w?.$]+\Z")
+
+_TYPESCRIPT_TYPE_REGEX = re.compile(r"[\w?.$]+\s*:\s*[\w?.$]*\Z")
+
+#: Words after which a slash starts a regular expression.
+_JAVASCRIPT_REGEX_WORDS = {
+    "async",
+    "await",
+    "break",
+    "case",
+    "catch",
+    "class",
+    "const",
+    "continue",
+    "debugger",
+    "default",
+    "delete",
+    "do",
+    "else",
+    "export",
+    "extends",
+    "finally",
+    "for",
+    "function",
+    "if",
+    "import",
+    "in",
+    "instanceof",
+    "let",
+    "new",
+    "of",
+    "return",
+    "static",
+    "super",
+    "switch",
+    "this",
+    "throw",
+    "try",
+    "typeof",
+    "var",
+    "void",
+    "while",
+    "with",
+    "yield",
+}
+
+_TYPESCRIPT_REGEX_WORDS = _JAVASCRIPT_REGEX_WORDS | {
+    "abstract",
+    "enum",
+    "implements",
+    "interface",
+    "override",
+    "private",
+    "protected",
+    "public",
+    "readonly",
+}
+
+
+class _JavascriptScanner:
+    """
+    Scanner for JavaScript and TypeScript mirroring
+    ``pygments.lexers.JavascriptLexer`` and ``pygments.lexers.TypeScriptLexer``
+    including when a slash starts a regular expression.
+    """
+
+    def __init__(self, marker: _LineMarker, is_typescript: bool):
+        self._marker = marker
+        self._text = marker.text
+        self._is_typescript = is_typescript
+        self._regex_words = _TYPESCRIPT_REGEX_WORDS if is_typescript else _JAVASCRIPT_REGEX_WORDS
+
+    def scan(self):
+        position = 0
+        is_regex_allowed = True
+        hashbang_match = _JAVASCRIPT_HASHBANG_REGEX.match(self._text)
+        if hashbang_match is not None:
+            position = hashbang_match.end()
+            self._marker.mark(0, position, DOCUMENTATION_MARK)
+            is_regex_allowed = False
+        self._code_end(position, is_regex_allowed, is_template_expression=False)
+
+    def _code_end(self, position: int, is_regex_allowed: bool, is_template_expression: bool) -> int:
+        """
+        Mark the code starting at ``position``. The result is the position of
+        the ``}`` ending the expression in a template, or the end of the text.
+        """
+        text = self._text
+        marker = self._marker
+        code_start = position
+        # NOTE: Comments do not change whether a slash starts a regular expression, so only the latest code matters,
+        #  which is only checked once a slash actually shows up.
+        latest_code_range = None
+        while True:
+            match = _JAVASCRIPT_CODE_REGEX.search(text, position)
+            if match is None:
+                return len(text)
+            start = match.start()
+            found = match.group()
+            if text[code_start:start].strip() != "":
+                latest_code_range = (code_start, start)
+            if found == "}":
+                if is_template_expression:
+                    return start
+                is_regex_allowed = False
+                latest_code_range = None
+                end = start + 1
+            elif found == "<!--":
+                if start == 0 or text[start - 1] == "\n":
+                    is_regex_allowed = True
+                    latest_code_range = None
+                end = start + 4
+                marker.mark(start, end, DOCUMENTATION_MARK)
+            elif found == "/":
+                if text.startswith("//", start):
+                    end = text.find("\n", start)
+                    marker.mark(start, end, DOCUMENTATION_MARK)
+                elif text.startswith("/*", start) and (comment_end := text.find("*/", start + 2)) != -1:
+                    end = comment_end + 2
+                    marker.mark(start, end, DOCUMENTATION_MARK)
+                else:
+                    if latest_code_range is not None:
+                        is_regex_allowed = self._is_regex_allowed_after(*latest_code_range)
+                        latest_code_range = None
+                    end, is_regex_allowed = self._slash_end(
+                        start, is_regex_allowed or start == 0 or text[start - 1] == "\n"
+                    )
+            elif found == "`":
+                end = self._template_end(start)
+                is_regex_allowed = False
+                latest_code_range = None
+            else:
+                string_match = _JAVASCRIPT_STRING_REGEXES[found].match(text, start)
+                if string_match is not None:
+                    end = string_match.end()
+                    marker.mark(start, end, STRING_MARK)
+                else:
+                    end = start + 1
+                is_regex_allowed = False
+                latest_code_range = None
+            code_start = position = end
+
+    def _slash_end(self, start: int, is_regex_allowed: bool) -> tuple[int, bool]:
+        """
+        End of a slash that is either an operator or starts a regular expression, and whether a regular
+        expression can follow it.
+        """
+        text = self._text
+        if is_regex_allowed:
+            regex_match = _JAVASCRIPT_REGEX_REGEX.match(text, start)
+            if regex_match is not None:
+                end = regex_match.end()
+                self._marker.mark(start, end, STRING_MARK)
+                return end, False
+            # NOTE: The rest of the line is an error, after which a regular expression may follow.
+            return text.find("\n", start) + 1, True
+        return start + (2 if text.startswith("/=", start) else 1), True
+
+    def _template_end(self, start: int) -> int:
+        text = self._text
+        string_start = start
+        position = start + 1
+        while True:
+            match = _JAVASCRIPT_TEMPLATE_TOKEN_REGEX.search(text, position)
+            if match is None:
+                position = len(text)
+                break
+            position = match.end()
+            found = match.group()
+            if found == "`":
+                break
+            if found == "${":
+                self._marker.mark(string_start, position, STRING_MARK)
+                string_start = self._code_end(position, is_regex_allowed=False, is_template_expression=True)
+                position = string_start + 1
+                if string_start == len(text):
+                    return string_start
+        self._marker.mark(string_start, position, STRING_MARK)
+        return position
+
+    def _is_regex_allowed_after(self, code_start: int, code_end: int) -> bool:
+        """
+        Whether a slash after the code between ``code_start`` and
+        ``code_end`` starts a regular expression, which only depends on the
+        last token of the code.
+        """
+        text = self._text
+        code = text[code_start:code_end].rstrip()
+        code_end = code_start + len(code)
+        last_character = code[-1]
+        if last_character in "{([;,":
+            return True
+        if last_character in ")]}":
+            return False
+        if last_character in _JAVASCRIPT_OPERATOR_CHARACTERS:
+            # NOTE: Operators can be several characters long, so find the last one from the start of all of them.
+            position = code_end - 1
+            while position > code_start and text[position - 1] in _JAVASCRIPT_OPERATOR_CHARACTERS:
+                position -= 1
+            result = False
+            while position < code_end:
+                operator_match = _JAVASCRIPT_OPERATOR_REGEX.match(text, position, code_end + 1)
+                if operator_match is None:
+                    raise _BailOut("unknown operator")
+                position = operator_match.end()
+                result = operator_match.lastgroup is None
+            if position != code_end:
+                raise _BailOut("unknown operator")
+            return result
+        word_start = code_end
+        while word_start > code_start and (text[word_start - 1].isalnum() or text[word_start - 1] in "_$"):
+            word_start -= 1
+        if word_start == code_end or text[word_start].isdigit():
+            return False
+        previous_character = text[word_start - 1] if word_start > 0 else ""
+        if previous_character == "#" or (self._is_typescript and previous_character == "@"):
+            return False
+        result = text[word_start:code_end] in self._regex_words
+        if self._is_typescript:
+            if _TYPESCRIPT_MODULE_REGEX.search(code) is not None:
+                result = True
+            elif result and _TYPESCRIPT_TYPE_REGEX.search(text, code_start, code_end) is not None:
+                raise _BailOut("keyword that might be a type")
+        return result
+
+
+def _javascript_marks(marker: _LineMarker):
+    _JavascriptScanner(marker, is_typescript=False).scan()
+
+
+def _typescript_marks(marker: _LineMarker):
+    _JavascriptScanner(marker, is_typescript=True).scan()
+
+
+_LANGUAGE_TO_SCANNER_MAP: dict[str, Callable[[_LineMarker], None]] = {
+    "C": _c_marks,
+    "C#": _csharp_marks,
+    "C++": _cpp_marks,
+    "Go": _go_marks,
+    "Java": _java_marks,
+    "JavaScript": _javascript_marks,
+    "Python": _python_marks,
+    "TypeScript": _typescript_marks,
+}
+
+
+def has_scanner(language: str) -> bool:
+    """
+    Whether there is a fast scanner for ``language``, which is the name of a
+    pygments lexer.
+    """
+    return language in _LANGUAGE_TO_SCANNER_MAP
+
+
+def line_marks(lexer: pygments.lexer.Lexer, text: str, white_text: str, white_words: set[str]) -> Optional[bytearray]:
+    """
+    The marks of each line of ``text`` as combination of ``CODE_MARK``,
+    ``DOCUMENTATION_MARK`` and ``STRING_MARK`` the same as
+    ``pygount.analysis._line_marks()`` would yield using ``lexer``, or
+    ``None`` if there is no scanner for the language of ``lexer`` or the
+    scanner found a construct it cannot handle.
+    """
+    scanner = _LANGUAGE_TO_SCANNER_MAP.get(lexer.name)
+    if scanner is None:
+        return None
+    lexer_text = _lexer_text(lexer, text)
+    if not lexer_text.endswith("\n"):
+        return None
+    marker = _LineMarker(lexer_text)
+    try:
+        scanner(marker)
+    except _BailOut:
+        return None
+    return marker.line_marks(white_text, white_words)
@@ -0,0 +1,214 @@
+"""
+Low overhead timing of the phases of an analysis, so it is possible to tell
+where a slow run spends its time.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import copy
+import functools
+import threading
+import time
+from collections.abc import Callable, Generator, Iterator
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Optional, TypeVar
+
+_T = TypeVar("_T")
+
+
+class Phase(Enum):
+    """
+    Phases of an analysis, with the value being the name used in the JSON
+    output.
+    """
+
+    #: Finding the files to analyze.
+    scanning = "scanning"
+    #: Finding the encoding of a file.
+    encoding_detection = "encodingDetection"
+    #: Finding the lexer to analyze a file with.
+    lexer_guessing = "lexerGuessing"
+    #: Lexing a file and counting its lines.
+    tokenizing = "tokenizing"
+    #: Finding the dialect of an XML file.
+    xml_dialect_sniffing = "xmlDialectSniffing"
+    #: Hashing files to find duplicates.
+    duplicate_hashing = "duplicateHashing"
+    #: Adding analyses to the output.
+    writing = "writing"
+
+
+@dataclass
+class TokenizingStatistics:
+    """
+    Time spent to tokenize the files of a language and how much source code
+    they contained.
+    """
+
+    duration: float = 0.0
+    byte_count: int = 0
+    line_count: int = 0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.byte_count / self.duration if self.duration > 0 else 0.0
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.line_count / self.duration if self.duration > 0 else 0.0
+
+    def add(self, other: "TokenizingStatistics"):
+        self.duration += other.duration
+        self.byte_count += other.byte_count
+        self.line_count += other.line_count
+
+
+@dataclass
+class PhaseStatistics:
+    """
+    Time spent in each :py:class:`Phase`. If phases are nested, the time
+    spent in the inner phase only counts for the inner one.
+    """
+
+    #: Seconds spent in each phase.
+    phase_to_duration_map: dict[Phase, float] = field(default_factory=dict)
+    #: Statistics of :py:attr:`Phase.tokenizing` for each language.
+    language_to_tokenizing_statistics_map: dict[str, TokenizingStatistics] = field(default_factory=dict)
+
+    def duration(self, phase: Phase) -> float:
+        return self.phase_to_duration_map.get(phase, 0.0)
+
+    def add_duration(self, phase: Phase, duration: float):
+        self.phase_to_duration_map[phase] = self.phase_to_duration_map.get(phase, 0.0) + duration
+
+    def add_tokenizing(self, language: str, duration: float, byte_count: int, line_count: int):
+        tokenizing_statistics = self.language_to_tokenizing_statistics_map.get(language)
+        if tokenizing_statistics is None:
+            tokenizing_statistics = TokenizingStatistics()
+            self.language_to_tokenizing_statistics_map[language] = tokenizing_statistics
+        tokenizing_statistics.add(TokenizingStatistics(duration, byte_count, line_count))
+
+    def add(self, other: "PhaseStatistics"):
+        for phase, duration in other.phase_to_duration_map.items():
+            self.add_duration(phase, duration)
+        for language, tokenizing_statistics in other.language_to_tokenizing_statistics_map.items():
+            self.add_tokenizing(
+                language,
+                tokenizing_statistics.duration,
+                tokenizing_statistics.byte_count,
+                tokenizing_statistics.line_count,
+            )
+
+    def copy(self) -> "PhaseStatistics":
+        return copy.deepcopy(self)
+
+    def difference(self, other: "PhaseStatistics") -> "PhaseStatistics":
+        """
+        The time spent in ``self`` after the time in ``other``.
+        """
+        result = self.copy()
+        for phase, duration in other.phase_to_duration_map.items():
+            result.add_duration(phase, -duration)
+        for language, tokenizing_statistics in other.language_to_tokenizing_statistics_map.items():
+            result.add_tokenizing(
+                language,
+                -tokenizing_statistics.duration,
+                -tokenizing_statistics.byte_count,
+                -tokenizing_statistics.line_count,
+            )
+        result.phase_to_duration_map = {
+            phase: duration for phase, duration in result.phase_to_duration_map.items() if duration != 0
+        }
+        result.language_to_tokenizing_statistics_map = {
+            language: tokenizing_statistics
+            for language, tokenizing_statistics in result.language_to_tokenizing_statistics_map.items()
+            if tokenizing_statistics.byte_count != 0 or tokenizing_statistics.duration != 0
+        }
+        return result
+
+
+#: Time spent in the phases of the current process.
+_phase_statistics = PhaseStatistics()
+
+#: For each thread the innermost :py:class:`PhaseTimer` currently timing, if any.
+_thread_local = threading.local()
+
+
+def phase_statistics() -> PhaseStatistics:
+    """
+    The :py:class:`PhaseStatistics` of the current process.
+    """
+    return _phase_statistics
+
+
+class PhaseTimer:
+    """
+    Context manager adding the time spent within it to its phase. Once
+    exited, :py:attr:`duration` is the time spent in the phase itself,
+    excluding nested phases.
+    """
+
+    __slots__ = ("_outer_timer", "_phase", "_start_time", "duration")
+
+    def __init__(self, phase: Phase):
+        self._phase = phase
+        self._outer_timer: Optional[PhaseTimer] = None
+        self._start_time = 0.0
+        self.duration = 0.0
+
+    def _pause(self, now: float):
+        self.duration += now - self._start_time
+        _phase_statistics.add_duration(self._phase, now - self._start_time)
+
+    def _resume(self, now: float):
+        self._start_time = now
+
+    def __enter__(self) -> "PhaseTimer":
+        now = time.perf_counter()
+        self._outer_timer = getattr(_thread_local, "timer", None)
+        if self._outer_timer is not None:
+            self._outer_timer._pause(now)  # noqa: SLF001
+        _thread_local.timer = self
+        self._resume(now)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        now = time.perf_counter()
+        self._pause(now)
+        _thread_local.timer = self._outer_timer
+        if self._outer_timer is not None:
+            self._outer_timer._resume(now)  # noqa: SLF001
+
+
+def timed(phase: Phase) -> Callable[[Callable[..., _T]], Callable[..., _T]]:
+    """
+    Decorator to add the time spent in a function to ``phase``.
+    """
+
+    def decorator(function: Callable[..., _T]) -> Callable[..., _T]:
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs) -> _T:
+            with PhaseTimer(phase):
+                return function(*args, **kwargs)
+
+        return timed_function
+
+    return decorator
+
+
+def timed_items(phase: Phase, items: Generator[_T, None, None]) -> Iterator[_T]:
+    """
+    The same items as ``items`` but with the time spent to compute each of
+    them added to ``phase``.
+    """
+    try:
+        while True:
+            with PhaseTimer(phase):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        items.close()
@@ -14,6 +14,7 @@ from rich.console import Console
 from rich.table import Table
 
 import pygount
+import pygount.timing
 
 from . import SourceAnalysis
 from .summary import ProjectSummary
@@ -21,7 +22,7 @@ from .summary import ProjectSummary
 #: Version of cloc the --format=cloc-xml pretends to be.
 CLOC_VERSION = "1.60"
 
-JSON_FORMAT_VERSION = "1.1.0"
+JSON_FORMAT_VERSION = "1.2.0"
 
 
 class BaseWriter:
@@ -39,6 +40,14 @@ class BaseWriter:
         self.duration = None
         self.duration_in_seconds = 0.0
         self.has_to_track_progress = True
+        #: Statistics of the :py:class:`pygount.cache.BaseAnalysisCache` used, if any.
+        self.cache_statistics = None
+        #: The :py:class:`pygount.parallel.SlowFile` whose analysis exceeded the limits for a single file.
+        self.slow_files = []
+        #: The :py:class:`pygount.timing.PhaseStatistics` of the analysis, if known.
+        self.phase_statistics = None
+        #: The :py:func:`pygount.cache.options_key()` of the analysis, if known.
+        self.options_key = None
 
     def __enter__(self):
         return self
@@ -185,7 +194,15 @@ class SummaryWriter(BaseWriter):
             str(self.project_summary.total_documentation_count),
             formatted_percentage(self.project_summary.total_documentation_percentage),
         )
-        Console(file=self._target_stream, soft_wrap=True).print(table)
+        console = Console(file=self._target_stream, soft_wrap=True)
+        console.print(table)
+        if len(self.slow_files) >= 1:
+            slow_files_table = Table(title="Slow files")
+            for column in ("Path", "Lexer", "Reason"):
+                slow_files_table.add_column(column, overflow="fold")
+            for slow_file in self.slow_files:
+                slow_files_table.add_row(slow_file.path, slow_file.lexer_names, slow_file.reason)
+            console.print(slow_files_table)
 
 
 class JsonWriter(BaseWriter):
@@ -205,6 +222,7 @@ class JsonWriter(BaseWriter):
                 "documentationCount": source_analysis.documentation_count,
                 "emptyCount": source_analysis.empty_count,
                 "group": source_analysis.group,
+                "isApproximate": source_analysis.is_approximate,
                 "isCountable": source_analysis.is_countable,
                 "language": source_analysis.language,
                 "lineCount": source_analysis.line_count,
@@ -221,6 +239,7 @@ class JsonWriter(BaseWriter):
         json_map = {
             "formatVersion": JSON_FORMAT_VERSION,
             "pygountVersion": pygount.__version__,
+            "optionsKey": self.options_key,
             "files": self.source_analyses,
             "languages": [
                 {
@@ -242,10 +261,28 @@ class JsonWriter(BaseWriter):
                 for language_summary in self.project_summary.language_to_language_summary_map.values()
             ],
             "runtime": {
+                "cache": (
+                    {
+                        "evictionCount": self.cache_statistics.eviction_count,
+                        "hitCount": self.cache_statistics.hit_count,
+                        "missCount": self.cache_statistics.miss_count,
+                    }
+                    if self.cache_statistics is not None
+                    else None
+                ),
                 "durationInSeconds": self.duration_in_seconds,
                 "filesPerSecond": self.files_per_second,
                 "finishedAt": self.finished_at.isoformat(),
                 "linesPerSecond": self.lines_per_second,
+                "phases": (
+                    {phase.value: self._phase_map(phase) for phase in pygount.timing.Phase}
+                    if self.phase_statistics is not None
+                    else None
+                ),
+                "slowFiles": [
+                    {"lexer": slow_file.lexer_names, "path": slow_file.path, "reason": slow_file.reason}
+                    for slow_file in self.slow_files
+                ],
                 "startedAt": self.started_at.isoformat(),
             },
             "summary": {
@@ -264,6 +301,24 @@ class JsonWriter(BaseWriter):
         }
         json.dump(json_map, self._target_stream)
 
+    def _phase_map(self, phase: pygount.timing.Phase) -> dict:
+        result = {"durationInSeconds": self.phase_statistics.duration(phase)}
+        if phase == pygount.timing.Phase.tokenizing:
+            result["languages"] = [
+                {
+                    "byteCount": tokenizing_statistics.byte_count,
+                    "bytesPerSecond": tokenizing_statistics.bytes_per_second,
+                    "durationInSeconds": tokenizing_statistics.duration,
+                    "language": language,
+                    "lineCount": tokenizing_statistics.line_count,
+                    "linesPerSecond": tokenizing_statistics.lines_per_second,
+                }
+                for language, tokenizing_statistics in sorted(
+                    self.phase_statistics.language_to_tokenizing_statistics_map.items()
+                )
+            ]
+        return result
+
 
 def digit_width(line_count: int) -> int:
     assert line_count >= 0
@@ -8,6 +8,8 @@ import logging
 import re
 import xml.sax
 
+import pygount.timing
+
 # TODO #10: Replace regex for DTD by working DTD handler.
 #: Regular expression to obtain DTD.
 _DTD_REGEX = re.compile(r'<!DOCTYPE\s+(?P<name>[a-zA-Z][a-zA-Z-]*)\s+PUBLIC\s+"(?P<public_id>.+)"')
@@ -62,6 +64,7 @@ class XmlDialectHandler(xml.sax.ContentHandler, xml.sax.handler.DTDHandler):
         self._path = self._path[: -len(name) - 1]
 
 
+@pygount.timing.timed(pygount.timing.Phase.xml_dialect_sniffing)
 def xml_dialect(xml_path, xml_code):
     # TODO #10: Remove hack to obtain DTD using a regex instead of a DTDHandler.
     dtd_match = _DTD_REGEX.match(xml_code)
@@ -5,17 +5,25 @@ Tests for pygount source code analysis.
 # Copyright (c) 2016-2024, Thomas Aglassinger.
 # All rights reserved. Distributed under the BSD License.
 import glob
+import hashlib
 import os
 import unittest
 from io import BytesIO, StringIO
+from pathlib import Path
 
+import git
 import pytest
 from pygments import lexers, token
 
+import pygount.lexers
 from pygount import Error as PygountError
 from pygount import analysis, common
 from pygount.analysis import (
-    _delined_tokens,
+    _HAS_LEXING_TIME_LIMIT,
+    PathData,
+    _head_lines,
+    _line_counts,
+    _line_marks,
     _line_parts,
     _pythonized_comments,
     base_language,
@@ -63,6 +71,46 @@ class SourceScannerTest(TempFolderTest):
         scanned_names = [os.path.basename(path_data.source_path) for path_data in scanner.source_paths()]
         assert scanned_names == [name_to_include]
 
+    def test_can_keep_stat_results_of_files_in_nested_folders(self):
+        project_folder = os.path.join(self.tests_temp_folder, "project")
+        for relative_path in ("top.py", "a/a.py", "a/b/ab.py", "c/c.py", "c/.skip/skip.py"):
+            self.create_temp_file(os.path.join("project", relative_path), "x = 1", do_create_folder=True)
+        Path(project_folder, "link.py").symlink_to(Path(project_folder, "top.py"))
+
+        path_datas = list(analysis.SourceScanner([project_folder]).source_paths())
+        assert [os.path.relpath(path_data.source_path, project_folder) for path_data in path_datas] == [
+            os.path.join("a", "a.py"),
+            os.path.join("a", "b", "ab.py"),
+            os.path.join("c", "c.py"),
+            "top.py",
+        ]
+        for path_data in path_datas:
+            assert path_data.group == "project"
+            assert path_data.size == 5
+            assert path_data.stat_result.st_size == 5
+
+    def test_can_find_git_blob_ids_of_unmodified_files(self):
+        project_folder = os.path.join(self.tests_temp_folder, "project")
+        for name in ("unmodified.py", "modified.py"):
+            self.create_temp_file(os.path.join("project", "sub", name), f"# {name}", do_create_folder=True)
+        with git.Repo.init(project_folder) as repo:
+            repo.index.add(["sub/unmodified.py", "sub/modified.py"])
+            actor = git.Actor("Some Tester", "tester@example.com")
+            repo.index.commit("Add some files", author=actor, committer=actor)
+            expected_blob_id = repo.head.commit.tree["sub/unmodified.py"].hexsha
+        self.create_temp_file(os.path.join("project", "sub", "modified.py"), "# changed")
+        self.create_temp_file(os.path.join("project", "sub", "untracked.py"), "# untracked")
+
+        with analysis.SourceScanner([os.path.join(project_folder, "sub")]) as scanner:
+            name_to_blob_id_map = {
+                os.path.basename(path_data.source_path): path_data.blob_id for path_data in scanner.source_paths()
+            }
+        assert name_to_blob_id_map == {
+            "modified.py": None,
+            "unmodified.py": expected_blob_id,
+            "untracked.py": None,
+        }
+
     def test_fails_on_non_repo_url(self):
         non_repo_urls = [["https://github.com/roskakori/pygount/"], ["git@github.com:roskakori/pygount"]]
         for non_repo_url in non_repo_urls:
@@ -87,22 +135,25 @@ class SourceScannerTest(TempFolderTest):
 
 
 class AnalysisTest(unittest.TestCase):
-    def test_can_deline_tokens(self):
-        assert list(_delined_tokens([(token.Comment, "# a")])) == [(token.Comment, "# a")]
-        assert list(_delined_tokens([(token.Comment, "# a\n#  b")])) == [
-            (token.Comment, "# a\n"),
-            (token.Comment, "#  b"),
-        ]
-        assert list(_delined_tokens([(token.Comment, "# a\n#  b\n")])) == [
-            (token.Comment, "# a\n"),
-            (token.Comment, "#  b\n"),
-        ]
-        assert list(_delined_tokens([(token.Comment, "# a\n#  b\n # c\n")])) == [
-            (token.Comment, "# a\n"),
-            (token.Comment, "#  b\n"),
-            (token.Comment, " # c\n"),
+    def test_can_mark_lines_spanned_by_tokens(self):
+        python_lexer = lexers.get_lexer_by_name("python")
+        source_code = 'x = """\nsome\n\ntext"""  # comment\n\n(\n    1,\n)\n'
+        assert list(_line_parts(python_lexer, source_code)) == [
+            set("cs"),
+            set("s"),
+            set("s"),
+            set("ds"),
+            set(),
+            set(),
+            set("c"),
+            set(),
         ]
 
+    def test_can_count_line_marks(self):
+        python_lexer = lexers.get_lexer_by_name("python")
+        source_code = '"""\nSome module.\n"""\n\nx = "x"  # x\ny = "y"\n'
+        assert _line_counts(_line_marks(python_lexer, source_code)) == (2, 3, 1, 0)
+
     def test_can_compute_python_line_parts(self):
         python_lexer = lexers.get_lexer_by_name("python")
         assert list(_line_parts(python_lexer, "#")) == [set("d")]
@@ -117,7 +168,7 @@ class AnalysisTest(unittest.TestCase):
         source_code = '#!/bin/python\n"Some tool."\n#(C) by me\ndef x():\n    "Some function"\n    return 1'
         python_lexer = lexers.get_lexer_by_name("python")
         python_tokens = python_lexer.get_tokens(source_code)
-        for token_type, _ in list(_pythonized_comments(_delined_tokens(python_tokens))):
+        for token_type, _ in list(_pythonized_comments(python_tokens)):
             assert token_type not in token.String
 
     def test_can_analyze_python(self):
@@ -184,6 +235,111 @@ class FileAnalysisTest(TempFolderTest):
         assert source_analysis.state == analysis.SourceState.error
         assert "0x80" in str(source_analysis.state_info)
 
+    def test_can_count_lines_without_lexing(self):
+        test_path = self.create_temp_binary_file(
+            "some.py", b"\n# Some comment\r\n\r\nprint('some')\n  \t\nprint('other')"
+        )
+        source_analysis = analysis.SourceAnalysis.from_file(test_path, "test", count_mode="lines")
+        assert source_analysis.state == analysis.SourceState.counted
+        assert source_analysis.language == "Python"
+        assert source_analysis.is_countable
+        assert (source_analysis.code_count, source_analysis.documentation_count) == (3, 0)
+        assert (source_analysis.empty_count, source_analysis.string_count) == (3, 0)
+        assert source_analysis.line_count == 6
+
+    def test_can_count_lines_of_utf_16(self):
+        test_path = self.create_temp_binary_file("some.py", "﻿print('some')\n\nprint('other')\n".encode("utf-16"))
+        source_analysis = analysis.SourceAnalysis.from_file(test_path, "test", count_mode="lines")
+        assert source_analysis.state == analysis.SourceState.counted
+        assert (source_analysis.code_count, source_analysis.empty_count) == (2, 1)
+
+    def test_can_analyze_in_chunks(self):
+        source_path = os.path.join(PYGOUNT_SOURCE_FOLDER, "analysis.py")
+        with open(source_path, "rb") as source_file:
+            test_path = self.create_temp_binary_file("some.py", source_file.read().replace(b"\n", b"\r\n"))
+        expected_analysis = analysis.SourceAnalysis.from_file(test_path, "test")
+        chunked_analysis = analysis.SourceAnalysis.from_file(test_path, "test", chunk_size=4096)
+        assert _counts(chunked_analysis) == _counts(expected_analysis)
+
+    def test_can_analyze_unchunkable_language_entirely(self):
+        test_path = self.create_temp_file(
+            "some.rb", ["# Some comment", "=begin", "Documentation", "=end", "x = 1"] * 300
+        )
+        expected_analysis = analysis.SourceAnalysis.from_file(test_path, "test")
+        chunked_analysis = analysis.SourceAnalysis.from_file(test_path, "test", chunk_size=1024)
+        assert _counts(chunked_analysis) == _counts(expected_analysis)
+
+    def test_can_analyze_unterminated_comment_in_chunks_approximately(self):
+        test_path = self.create_temp_file("some.c", ["int x;", "/*"] + ["some comment"] * 10_000)
+        expected_analysis = analysis.SourceAnalysis.from_file(test_path, "test")
+        chunked_analysis = analysis.SourceAnalysis.from_file(test_path, "test", chunk_size=1024)
+        assert chunked_analysis.state == analysis.SourceState.analyzed
+        assert chunked_analysis.is_approximate
+        assert not expected_analysis.is_approximate
+        assert _counts(chunked_analysis) == _counts(expected_analysis)
+
+    def test_can_restart_chunks_with_fallback_encoding(self):
+        source_data = "# \N{EURO SIGN}\n".encode() + b"x = 1\n" * 2000 + b"# caf\xe9\n"
+        test_path = self.create_temp_binary_file("some.py", source_data)
+        expected_analysis = analysis.SourceAnalysis.from_file(test_path, "test", fallback_encoding=None)
+        chunked_analysis = analysis.SourceAnalysis.from_file(test_path, "test", fallback_encoding=None, chunk_size=4096)
+        assert expected_analysis.state == analysis.SourceState.analyzed
+        assert _counts(chunked_analysis) == _counts(expected_analysis)
+
+    def test_can_read_unchunkable_language_entirely_with_fallback_encoding(self):
+        source_data = b"x = 1\n" * 2000 + b"# caf\xe9\n"
+        test_path = self.create_temp_binary_file("some.rb", source_data)
+        expected_analysis = analysis.SourceAnalysis.from_file(test_path, "test", fallback_encoding=None)
+        chunked_analysis = analysis.SourceAnalysis.from_file(test_path, "test", fallback_encoding=None, chunk_size=4096)
+        assert expected_analysis.state == analysis.SourceState.analyzed
+        assert _counts(chunked_analysis) == _counts(expected_analysis)
+
+    def test_can_detect_broken_encoding_in_chunks(self):
+        test_path = self.create_temp_binary_file("some.py", b"x = 1\n" * 1000 + b"s = '\xff'\n")
+        source_analysis = analysis.SourceAnalysis.from_file(test_path, "test", encoding="utf-8", chunk_size=1024)
+        assert source_analysis.state == analysis.SourceState.error
+
+    def test_can_detect_huge_file(self):
+        test_path = self.create_temp_file("some.py", ["print('some')"] * 100)
+        max_file_sizes = analysis.MaxFileSizes(1000)
+        source_analysis = analysis.SourceAnalysis.from_file(test_path, "test", max_file_sizes=max_file_sizes)
+        assert source_analysis.state == analysis.SourceState.huge
+        assert source_analysis.language == "__huge__"
+        assert source_analysis.state_info == "size of 1400 bytes exceeds maximum of 1000 bytes"
+        path_data = PathData(test_path, "test", size=1400)
+        assert analysis.huge_source_analysis(path_data, max_file_sizes).state == analysis.SourceState.huge
+
+    def test_can_detect_huge_file_in_tmp_dir(self):
+        test_path = self.create_temp_file("some/some.py", ["print('some')"] * 100, do_create_folder=True)
+        tmp_dir = os.path.dirname(test_path)
+        max_file_sizes = analysis.MaxFileSizes(1000)
+        path_data = PathData(test_path, "test", tmp_dir=tmp_dir, size=1400)
+        assert analysis.huge_source_analysis(path_data, max_file_sizes).path == "some.py"
+        source_analysis = analysis.SourceAnalysis.from_file(
+            test_path, "test", tmp_dir=tmp_dir, max_file_sizes=max_file_sizes
+        )
+        assert source_analysis.state == analysis.SourceState.huge
+        assert source_analysis.path == "some.py"
+        source_analysis = analysis.SourceAnalysis.from_path_data(path_data, max_file_sizes=max_file_sizes)
+        assert source_analysis.state == analysis.SourceState.huge
+        assert analysis.huge_source_analysis(path_data, analysis.MaxFileSizes(2000)) is None
+
+    @pytest.mark.skipif(not _HAS_LEXING_TIME_LIMIT, reason="lexing time cannot be limited on this platform")
+    def test_can_count_approximately_if_lexing_is_too_slow(self):
+        source_path = os.path.join(PYGOUNT_SOURCE_FOLDER, "analysis.py")
+        with open(source_path, "rb") as source_file:
+            test_path = self.create_temp_binary_file("some.py", source_file.read())
+        source_analysis = analysis.SourceAnalysis.from_file(test_path, "test", lexing_budget=0.001)
+        assert source_analysis.state == analysis.SourceState.analyzed
+        assert source_analysis.is_approximate
+        assert "is_approximate=True" in repr(source_analysis)
+        with open(test_path, encoding="utf-8") as test_file:
+            expected_line_counts = _line_counts(
+                _line_marks(pygount.lexers.minimalistic_lexer("Python"), test_file.read())
+            )
+        assert _counts(source_analysis)[2:] == expected_line_counts
+        assert not analysis.SourceAnalysis.from_file(test_path, "test").is_approximate
+
     def test_can_detect_silent_dos_batch_remarks(self):
         test_bat_path = self.create_temp_file(
             "test_can_detect_silent_dos_batch_remarks.bat",
@@ -428,6 +584,84 @@ class GeneratedCodeTest(TempFolderTest):
         )
         assert source_analysis.state == analysis.SourceState.generated
 
+    def test_can_detect_generated_code_with_regexes_that_cannot_be_combined(self):
+        generated_regexes = common.regexes_from(common.REGEX_PATTERN_PREFIX + r"(.)\1,(?i).*PRINT")
+        matching_number_line_and_regex = analysis.matching_number_line_and_regex(
+            GeneratedCodeTest._STANDARD_SOURCE_LINES, generated_regexes
+        )
+        assert matching_number_line_and_regex is not None
+        assert matching_number_line_and_regex[0] == 1
+        assert matching_number_line_and_regex[2] == generated_regexes[0]
+
+    def test_can_detect_generated_code_in_head_of_large_file(self):
+        lines = ["# Generated automatically.", *(f"print({number})" for number in range(10000))]
+        generated_py_path = self.create_temp_file("generated.py", lines)
+        source_analysis = analysis.SourceAnalysis.from_file(generated_py_path, "test")
+        assert source_analysis.state == analysis.SourceState.generated
+        assert source_analysis.state_info == (
+            f"line 0 matches {common.regexes_from(analysis.DEFAULT_GENERATED_PATTERNS_TEXT)[4]}"
+        )
+
+    def test_can_detect_generated_code_after_long_lines(self):
+        lines = ["x = 1" + " " * analysis.PROBE_HEAD_SIZE, "# Do not edit."]
+        generated_py_path = self.create_temp_file("generated.py", lines)
+        source_analysis = analysis.SourceAnalysis.from_file(generated_py_path, "test")
+        assert source_analysis.state == analysis.SourceState.generated
+        assert source_analysis.state_info.startswith("line 1 matches ")
+
+    def test_can_analyze_utf_8_character_crossing_end_of_head(self):
+        # NOTE: The last byte of the head is the first of the 2 bytes encoding "\N{LATIN SMALL LETTER A WITH MACRON}".
+        source_data = b"#" * (analysis.PROBE_HEAD_SIZE - 1) + "\N{LATIN SMALL LETTER A WITH MACRON}\nx = 1\n".encode()
+        source_path = self.create_temp_binary_file("some.py", source_data)
+        source_analysis = analysis.SourceAnalysis.from_file(source_path, "test", fallback_encoding=None)
+        assert source_analysis.state == analysis.SourceState.analyzed
+        assert (source_analysis.code_count, source_analysis.documentation_count) == (1, 1)
+
+    def test_can_analyze_fallback_encoding_after_utf_8_head(self):
+        source_data = "# \N{EURO SIGN}\n".encode() + b"x = 1\n" * analysis.PROBE_HEAD_SIZE + b"# caf\xe9\n"
+        source_path = self.create_temp_binary_file("some.py", source_data)
+        source_analysis = analysis.SourceAnalysis.from_file(source_path, "test", fallback_encoding=None)
+        assert source_analysis.state == analysis.SourceState.analyzed
+        assert (source_analysis.code_count, source_analysis.documentation_count) == (analysis.PROBE_HEAD_SIZE, 2)
+
+
+def _counts(source_analysis: analysis.SourceAnalysis) -> tuple:
+    return (
+        source_analysis.state,
+        source_analysis.language,
+        source_analysis.code_count,
+        source_analysis.documentation_count,
+        source_analysis.empty_count,
+        source_analysis.string_count,
+    )
+
+
+def test_can_parse_max_file_sizes():
+    assert analysis.MaxFileSizes.from_text("0") == analysis.MaxFileSizes()
+    assert analysis.MaxFileSizes.from_text("10M, JSON=1k, sql=0") == analysis.MaxFileSizes(
+        10 * 1024 * 1024, {"json": 1024, "sql": 0}
+    )
+    assert analysis.MaxFileSizes.from_text("json=2G") == analysis.MaxFileSizes(0, {"json": 2 * 1024**3})
+    for broken_text in ["", "many", "1T", "=1"]:
+        with pytest.raises(ValueError):
+            analysis.MaxFileSizes.from_text(broken_text)
+
+
+def test_can_find_max_file_size_for_language():
+    max_file_sizes = analysis.MaxFileSizes(100, {"json": 10, "c": 0})
+    assert max_file_sizes.max_size("some.json") == 10
+    assert max_file_sizes.max_size("some.py") == 100
+    assert max_file_sizes.max_size("some.unknown") == 100
+    # Both C and Objective-C match the name, and the largest limit applies.
+    assert max_file_sizes.max_size("some.h") == 0
+
+
+def test_can_find_head_lines():
+    assert _head_lines("a\nb\nc", False, 2) == ["a", "b"]
+    assert _head_lines("a\nb", False, 2) is None
+    assert _head_lines("a\nb\n", True, 5) == ["a", "b"]
+    assert _head_lines("", True, 5) == []
+
 
 class SizeTest(TempFolderTest):
     def test_can_detect_empty_source_code(self):
@@ -487,6 +721,113 @@ class DuplicatePoolTest(TempFolderTest):
         assert duplicate_pool.duplicate_path(original_path) is None
         assert original_path == duplicate_pool.duplicate_path(duplicate_path)
 
+    def test_can_distinguish_large_files_with_same_sample(self):
+        sample = b"x" * analysis.DUPLICATE_SAMPLE_SIZE
+        original_path = self.create_temp_binary_file("original", sample + b"same" + sample)
+        other_path = self.create_temp_binary_file("other", sample + b"othr" + sample)
+        duplicate_path = self.create_temp_binary_file("duplicate", sample + b"same" + sample)
+        duplicate_pool = analysis.DuplicatePool()
+        assert duplicate_pool.duplicate_path(original_path) is None
+        assert duplicate_pool.duplicate_path(other_path) is None
+        assert duplicate_pool.duplicate_path(duplicate_path) == original_path
+
+    def test_can_skip_hashing_large_files_with_different_sample(self):
+        sample = b"x" * analysis.DUPLICATE_SAMPLE_SIZE
+        some_path = self.create_temp_binary_file("some", b"some" + sample + sample)
+        other_path = self.create_temp_binary_file("other", b"othr" + sample + sample)
+        duplicate_pool = analysis.DuplicatePool()
+        assert duplicate_pool.duplicate_path(some_path) is None
+        assert duplicate_pool.duplicate_path(other_path) is None
+        assert duplicate_pool._path_to_hash_map == {}  # noqa: SLF001
+
+    def test_can_hash_with_sha256(self):
+        source_path = self.create_temp_file("some", "some")
+        duplicate_pool = analysis.DuplicatePool("sha256")
+        assert duplicate_pool.content_hash(source_path) == hashlib.sha256(b"some").digest()
+        assert analysis.DuplicatePool.hash_for(source_path) == hashlib.blake2b(b"some").digest()
+
+    def test_can_detect_duplicate_using_content_id_without_reading(self):
+        duplicate_pool = analysis.DuplicatePool()
+        assert duplicate_pool.duplicate_path("no_such_original", 4, b"same") is None
+        assert duplicate_pool.duplicate_path("no_such_other", 4, b"other") is None
+        assert duplicate_pool.duplicate_path("no_such_duplicate", 4, b"same") == "no_such_original"
+
+    def test_can_detect_duplicate_with_and_without_content_id(self):
+        same_content = "same"
+        original_path = self.create_temp_file("original", same_content)
+        other_path = self.create_temp_file("other", "othr")
+        duplicate_path = self.create_temp_file("duplicate", same_content)
+        duplicate_pool = analysis.DuplicatePool()
+        assert duplicate_pool.duplicate_path(original_path, 4, b"some_blob_id") is None
+        assert duplicate_pool.duplicate_path(other_path, 4, b"other_blob_id") is None
+        assert duplicate_pool.duplicate_path(duplicate_path) == original_path
+
+    def test_can_prepare_duplicates(self):
+        sample = b"x" * analysis.DUPLICATE_SAMPLE_SIZE
+        original_path = self.create_temp_binary_file("original", sample + b"same" + sample)
+        other_path = self.create_temp_binary_file("other", sample + b"othr" + sample)
+        duplicate_path = self.create_temp_binary_file("duplicate", sample + b"same" + sample)
+        unique_path = self.create_temp_file("unique", "unique")
+        path_datas = [PathData(path, "some") for path in (original_path, other_path, duplicate_path, unique_path)]
+        duplicate_pool = analysis.DuplicatePool()
+        duplicate_pool.prepare(path_datas, 2)
+        assert unique_path not in duplicate_pool._path_to_sample_hash_map  # noqa: SLF001
+        Path(original_path).unlink()
+        assert duplicate_pool.duplicate_path(original_path) is None
+        assert duplicate_pool.duplicate_path(other_path) is None
+        assert duplicate_pool.duplicate_path(duplicate_path) == original_path
+        assert duplicate_pool.duplicate_path(unique_path) is None
+
+    def test_can_prepare_duplicates_like_without_preparing(self):
+        path_datas = [
+            PathData(self.create_temp_file(name, content), "some", blob_id=blob_id)
+            for name, content, blob_id in (
+                ("original", "same", "01"),
+                ("other", "othr", "02"),
+                ("duplicate", "same", None),
+                ("another_duplicate", "same", "01"),
+            )
+        ]
+        prepared_duplicate_pool = analysis.DuplicatePool()
+        prepared_duplicate_pool.prepare(path_datas)
+        duplicate_pool = analysis.DuplicatePool()
+        for path_data in path_datas:
+            assert prepared_duplicate_pool.duplicate_path(
+                path_data.source_path, path_data.size, path_data.content_id
+            ) == duplicate_pool.duplicate_path(path_data.source_path, path_data.size, path_data.content_id)
+
+
+class FileProbeTest(TempFolderTest):
+    def test_can_read_head_and_data_once(self):
+        content = b"x" * (analysis.PROBE_HEAD_SIZE + 10)
+        source_path = self.create_temp_binary_file("some.txt", content)
+        with analysis.FileProbe(source_path) as file_probe:
+            assert file_probe.size == len(content)
+            assert file_probe.head() == content[: analysis.PROBE_HEAD_SIZE]
+            assert file_probe.data() == content
+            assert file_probe.data() == content
+        # open, fstat, read head, read rest, close
+        assert file_probe.system_call_count == 5
+
+    def test_can_read_empty_file(self):
+        source_path = self.create_temp_binary_file("empty.txt", b"")
+        with analysis.FileProbe(source_path) as file_probe:
+            assert file_probe.head() == b""
+            assert file_probe.data() == b""
+        assert file_probe.system_call_count == 3
+
+    def test_can_analyze_windows_newlines_same_as_unix_newlines(self):
+        lines = ["# Some comment", "", "print('some')"]
+        unix_path = self.create_temp_binary_file("unix.py", "\n".join(lines).encode())
+        windows_path = self.create_temp_binary_file("windows.py", "\r\n".join(lines).encode())
+        unix_analysis = analysis.SourceAnalysis.from_file(unix_path, "test")
+        windows_analysis = analysis.SourceAnalysis.from_file(windows_path, "test")
+        assert (windows_analysis.code_count, windows_analysis.documentation_count, windows_analysis.empty_count) == (
+            unix_analysis.code_count,
+            unix_analysis.documentation_count,
+            unix_analysis.empty_count,
+        )
+
 
 @pytest.mark.parametrize(
     "suffix, expected_result",
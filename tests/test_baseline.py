@@ -0,0 +1,133 @@
+"""
+Tests for incremental analysis based on a previous JSON result.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import json
+import os
+from pathlib import Path
+
+import git
+import pytest
+
+from pygount import command
+from pygount.analysis import PathData
+from pygount.baseline import Baseline
+from pygount.common import Error
+
+from ._common import TempFolderTest
+
+
+class BaselineTest(TempFolderTest):
+    def setUp(self):
+        super().setUp()
+        self.project_folder = os.path.join(self.tests_temp_folder, "project")
+        os.makedirs(self.project_folder)
+        self.repo = git.Repo.init(self.project_folder)
+        self.create_temp_file("project/changed.py", ["print('changed')"])
+        self.create_temp_file("project/deleted.py", ["print('deleted')"])
+        self.create_temp_file("project/renamed.py", ["print('renamed')"])
+        self.create_temp_file("project/unchanged.py", ["# Unchanged", "print('unchanged')"])
+        self.repo.index.add(["changed.py", "deleted.py", "renamed.py", "unchanged.py"])
+        actor = git.Actor("Some Tester", "tester@example.com")
+        self.repo.index.commit("Add some files", author=actor, committer=actor)
+        self.baseline_path = os.path.join(self.tests_temp_folder, "baseline.json")
+        self._write_json(self.baseline_path)
+
+    def tearDown(self):
+        self.repo.close()
+        super().tearDown()
+
+    def _write_json(self, json_path: str, *options: str) -> dict:
+        exit_code = command.pygount_command(["--format=json", "--out", json_path, *options, self.project_folder])
+        assert exit_code == 0
+        with open(json_path, encoding="utf-8") as json_file:
+            return json.load(json_file)
+
+    def _change_project(self):
+        self.create_temp_file("project/added.py", ["print('added')"])
+        self.create_temp_file("project/changed.py", ["# Changed", "print('changed')"])
+        os.remove(os.path.join(self.project_folder, "deleted.py"))
+        Path(self.project_folder, "renamed.py").rename(Path(self.project_folder, "other.py"))
+
+    def test_can_reuse_unchanged_files(self):
+        self._change_project()
+        baseline = Baseline(self.baseline_path, "HEAD", [self.project_folder])
+        unchanged_path = os.path.join(self.project_folder, "unchanged.py")
+        unchanged_source_analysis = baseline.source_analysis(PathData(unchanged_path, "project"))
+        assert unchanged_source_analysis is not None
+        assert (unchanged_source_analysis.code_count, unchanged_source_analysis.documentation_count) == (1, 1)
+        changed_path = os.path.join(self.project_folder, "changed.py")
+        assert baseline.source_analysis(PathData(changed_path, "project")) is None
+        assert baseline.reused_count == 1
+
+    def test_can_update_baseline_to_same_result_as_full_analysis(self):
+        self._change_project()
+        incremental_map = self._write_json(
+            os.path.join(self.tests_temp_folder, "incremental.json"),
+            "--baseline",
+            self.baseline_path,
+            "--since-ref",
+            "HEAD",
+        )
+        full_map = self._write_json(os.path.join(self.tests_temp_folder, "full.json"))
+        assert incremental_map["files"] == full_map["files"]
+        assert incremental_map["languages"] == full_map["languages"]
+        assert incremental_map["summary"] == full_map["summary"]
+        assert sorted(os.path.basename(file_map["path"]) for file_map in incremental_map["files"]) == [
+            "added.py",
+            "changed.py",
+            "other.py",
+            "unchanged.py",
+        ]
+
+    def test_can_ignore_baseline_with_different_options(self):
+        self._change_project()
+        incremental_map = self._write_json(
+            os.path.join(self.tests_temp_folder, "incremental.json"),
+            "--count-mode=lines",
+            "--baseline",
+            self.baseline_path,
+            "--since-ref",
+            "HEAD",
+        )
+        full_map = self._write_json(os.path.join(self.tests_temp_folder, "full.json"), "--count-mode=lines")
+        assert incremental_map["files"] == full_map["files"]
+        assert incremental_map["optionsKey"] == full_map["optionsKey"]
+        with open(self.baseline_path, encoding="utf-8") as baseline_file:
+            assert json.load(baseline_file)["optionsKey"] != full_map["optionsKey"]
+
+    def test_can_reuse_baseline_with_same_options_key(self):
+        with open(self.baseline_path, encoding="utf-8") as baseline_file:
+            options_key = json.load(baseline_file)["optionsKey"]
+        unchanged_path_data = PathData(os.path.join(self.project_folder, "unchanged.py"), "project")
+        baseline = Baseline(self.baseline_path, "HEAD", [self.project_folder], options_key)
+        assert baseline.source_analysis(unchanged_path_data) is not None
+        other_baseline = Baseline(self.baseline_path, "HEAD", [self.project_folder], "other")
+        assert other_baseline.source_analysis(unchanged_path_data) is None
+        assert other_baseline.reused_count == 0
+
+    def test_can_find_changed_files_in_several_repositories(self):
+        other_folder = os.path.join(self.tests_temp_folder, "other_project")
+        os.makedirs(other_folder)
+        with git.Repo.init(other_folder) as other_repo:
+            self.create_temp_file("other_project/other_changed.py", ["print('other')"])
+            other_repo.index.add(["other_changed.py"])
+            actor = git.Actor("Some Tester", "tester@example.com")
+            other_repo.index.commit("Add some file", author=actor, committer=actor)
+        baseline_map = self._write_json(self.baseline_path, other_folder)
+        assert len(baseline_map["files"]) == 5
+        self.create_temp_file("other_project/other_changed.py", ["# Changed", "print('other')"])
+        baseline = Baseline(self.baseline_path, "HEAD", [self.project_folder, other_folder])
+        assert baseline.source_analysis(PathData(os.path.join(other_folder, "other_changed.py"), "other")) is None
+        unchanged_path_data = PathData(os.path.join(self.project_folder, "unchanged.py"), "project")
+        assert baseline.source_analysis(unchanged_path_data) is not None
+
+    def test_fails_on_unknown_since_ref(self):
+        with pytest.raises(Error, match="no_such_ref"):
+            Baseline(self.baseline_path, "no_such_ref", [self.project_folder])
+
+    def test_fails_on_baseline_without_since_ref(self):
+        exit_code = command.pygount_command(["--baseline", self.baseline_path, self.project_folder])
+        assert exit_code == 1
@@ -0,0 +1,141 @@
+"""
+Tests for the persistent cache of source code analyses.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import gzip
+import os
+import time
+
+import pytest
+
+from pygount import analysis
+from pygount.cache import AnalysisCache, BaseAnalysisCache, ContentAnalysisCache, options_key
+from pygount.common import Error
+
+from ._common import TempFolderTest
+
+_SOME_OPTIONS_KEY = options_key("automatic", None, None, False)
+
+
+def test_can_compute_options_key():
+    assert options_key("automatic", None, None, False) == _SOME_OPTIONS_KEY
+    assert options_key("utf-8", None, None, False) != _SOME_OPTIONS_KEY
+    assert options_key("automatic", None, None, True) != _SOME_OPTIONS_KEY
+    assert options_key("automatic", None, None, False, 0) != _SOME_OPTIONS_KEY
+
+
+def test_fails_on_cache_without_add(tmp_path):
+    class IncompleteAnalysisCache(BaseAnalysisCache):
+        def source_analysis(self, path_data: analysis.PathData):
+            return None
+
+    with pytest.raises(TypeError, match="add"):
+        IncompleteAnalysisCache(str(tmp_path), _SOME_OPTIONS_KEY)
+
+
+class AnalysisCacheTest(TempFolderTest):
+    def setUp(self):
+        super().setUp()
+        self.cache_folder = os.path.join(self.tests_temp_folder, "cache")
+
+    def _create_old_source_file(self, name: str, lines: list[str]) -> analysis.PathData:
+        source_path = self.create_temp_file(name, lines)
+        an_hour_ago = time.time() - 3600
+        os.utime(source_path, (an_hour_ago, an_hour_ago))
+        return analysis.PathData(source_path, "test")
+
+    def _cached_source_analysis(self, path_data: analysis.PathData, cache_size: int = 100):
+        with AnalysisCache(self.cache_folder, _SOME_OPTIONS_KEY, cache_size) as cache:
+            result = cache.source_analysis(path_data)
+            if result is None:
+                cache.add(path_data, analysis.SourceAnalysis.from_file(path_data.source_path, path_data.group))
+        return result, cache.statistics
+
+    def test_can_reuse_analysis_of_unchanged_file(self):
+        path_data = self._create_old_source_file("some.py", ["# Some comment", "print('some')"])
+        first_source_analysis, first_statistics = self._cached_source_analysis(path_data)
+        assert first_source_analysis is None
+        assert (first_statistics.hit_count, first_statistics.miss_count) == (0, 1)
+
+        second_source_analysis, second_statistics = self._cached_source_analysis(path_data)
+        assert (second_statistics.hit_count, second_statistics.miss_count) == (1, 0)
+        assert repr(second_source_analysis) == repr(
+            analysis.SourceAnalysis.from_file(path_data.source_path, path_data.group)
+        )
+
+    def test_can_detect_changed_file(self):
+        path_data = self._create_old_source_file("some.py", ["print('some')"])
+        self._cached_source_analysis(path_data)
+        self._create_old_source_file("some.py", ["print('some')", "print('other')"])
+        source_analysis, _ = self._cached_source_analysis(path_data)
+        assert source_analysis is None
+
+    def test_can_skip_recently_modified_file(self):
+        path_data = analysis.PathData(self.create_temp_file("some.py", ["print('some')"]), "test")
+        self._cached_source_analysis(path_data)
+        source_analysis, _ = self._cached_source_analysis(path_data)
+        assert source_analysis is None
+
+    def test_can_evict_least_recently_used_analyses(self):
+        path_datas = [self._create_old_source_file(f"some_{index}.py", [f"x = {index}"]) for index in range(3)]
+        for path_data in path_datas:
+            _, statistics = self._cached_source_analysis(path_data, cache_size=2)
+        assert statistics.eviction_count == 1
+        first_source_analysis, _ = self._cached_source_analysis(path_datas[0], cache_size=2)
+        assert first_source_analysis is None
+        last_source_analysis, _ = self._cached_source_analysis(path_datas[-1], cache_size=2)
+        assert last_source_analysis is not None
+
+
+class ContentAnalysisCacheTest(TempFolderTest):
+    def setUp(self):
+        super().setUp()
+        self.cache_folder = os.path.join(self.tests_temp_folder, "cache")
+
+    def _path_data(self, relative_path: str, lines: list[str]) -> analysis.PathData:
+        return analysis.PathData(self.create_temp_file(relative_path, lines, do_create_folder=True), "test")
+
+    def _cached_source_analysis(self, path_data: analysis.PathData, cache_folder=None):
+        with ContentAnalysisCache(cache_folder or self.cache_folder, _SOME_OPTIONS_KEY) as cache:
+            result = cache.source_analysis(path_data)
+            if result is None:
+                cache.add(path_data, analysis.SourceAnalysis.from_file(path_data.source_path, path_data.group))
+        return result
+
+    def test_can_reuse_analysis_of_same_content_in_other_folder(self):
+        lines = ["# Some comment", "print('some')"]
+        assert self._cached_source_analysis(self._path_data("checkout_1/some.py", lines)) is None
+        other_path_data = self._path_data("checkout_2/some.py", lines)
+        other_source_analysis = self._cached_source_analysis(other_path_data)
+        assert other_source_analysis is not None
+        assert other_source_analysis.path == other_path_data.source_path
+        assert (other_source_analysis.code_count, other_source_analysis.documentation_count) == (1, 1)
+
+    def test_can_distinguish_same_content_with_different_name(self):
+        lines = ["# Some comment"]
+        self._cached_source_analysis(self._path_data("some.py", lines))
+        assert self._cached_source_analysis(self._path_data("some.txt", lines)) is None
+
+    def test_can_pack_and_restore(self):
+        path_data = self._path_data("some.py", ["print('some')"])
+        pack_path = os.path.join(self.tests_temp_folder, "cache.pack")
+        self._cached_source_analysis(path_data)
+        with ContentAnalysisCache(self.cache_folder, _SOME_OPTIONS_KEY) as cache:
+            cache.pack(pack_path)
+
+        other_cache_folder = os.path.join(self.tests_temp_folder, "other_cache")
+        with ContentAnalysisCache(other_cache_folder, _SOME_OPTIONS_KEY) as other_cache:
+            other_cache.restore(pack_path)
+        assert self._cached_source_analysis(path_data, other_cache_folder) is not None
+
+    def test_fails_on_restoring_broken_pack(self):
+        pack_path = os.path.join(self.tests_temp_folder, "broken.pack")
+        with gzip.open(pack_path, "wt", encoding="utf-8") as pack_file:
+            pack_file.write('{"format": "something else"}\n')
+        with (
+            ContentAnalysisCache(self.cache_folder, _SOME_OPTIONS_KEY) as cache,
+            pytest.raises(Error, match="unsupported format"),
+        ):
+            cache.restore(pack_path)
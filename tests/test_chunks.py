@@ -0,0 +1,115 @@
+"""
+Tests for lexing source code in chunks, which must yield the same tokens as
+lexing all of it at once.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import os
+
+import pygments.lexers
+import pygments.token
+import pytest
+
+from pygount import chunks
+
+from ._common import PYGOUNT_SOURCE_FOLDER
+
+_LANGUAGE_AND_TEXTS = [
+    ("C", "/*\n * Comment\n */\n#include <stdio.h>\n\nint main(void)\n{\n    return 0; // done\n}\n"),
+    ("C++", 'auto s = R"(raw\nstring)";\nint x = 1;\n'),
+    ("Python", 'def some():\n    """\n    Docstring.\n    """\n    return 1  # comment\n\n\n'),
+    ("Python", "\n\n\ufeffx = 1\n\n"),
+    ("Python", "\ufeff\n\nx = 1\n"),
+    ("SQL", "-- comment\nselect *\nfrom some; /* block\ncomment */\n"),
+]
+
+
+def _text_parts(text: str, part_size: int) -> list[str]:
+    return [text[index : index + part_size] for index in range(0, len(text), part_size)]
+
+
+@pytest.mark.parametrize("language, text", _LANGUAGE_AND_TEXTS)
+@pytest.mark.parametrize("part_size", [1, 3, 7, 1000])
+def test_can_lex_in_chunks(language, text, part_size):
+    lexer = pygments.lexers.get_lexer_by_name(language.lower())
+    assert chunks.is_chunkable(lexer)
+    expected_tokens = list(lexer.get_tokens(text))
+    margin = max(len(token_text) for _, token_text in expected_tokens)
+    assert list(chunks.chunked_tokens(lexer, iter(_text_parts(text, part_size)), margin)) == expected_tokens
+
+
+def test_can_lex_own_source_code_in_chunks():
+    lexer = pygments.lexers.get_lexer_by_name("python")
+    with open(os.path.join(PYGOUNT_SOURCE_FOLDER, "analysis.py"), encoding="utf-8") as source_file:
+        text = source_file.read()
+    expected_tokens = list(lexer.get_tokens(text))
+    assert list(chunks.chunked_tokens(lexer, iter(_text_parts(text, 4096)), 1024)) == expected_tokens
+
+
+def test_can_lex_only_newlines_in_chunks():
+    lexer = pygments.lexers.get_lexer_by_name("python")
+    for text in ["", "\n", "\n\n\n\n"]:
+        assert list(chunks.chunked_tokens(lexer, iter(_text_parts(text, 1)), 1)) == list(lexer.get_tokens(text))
+
+
+def test_can_decode_chunks():
+    data = "a\r\nb\rc\nä\r\n".encode()
+    data_chunks = [data[index : index + 1] for index in range(len(data))]
+    assert "".join(chunks.decoded_chunks(iter(data_chunks), "utf-8")) == "a\nb\nc\nä\n"
+
+
+def test_fails_on_broken_chunks():
+    with pytest.raises(UnicodeDecodeError):
+        list(chunks.decoded_chunks(iter([b"a", b"\xc3"]), "utf-8"))
+
+
+def test_can_detect_chunkable_lexers():
+    assert chunks.is_chunkable(pygments.lexers.get_lexer_by_name("python"))
+    assert chunks.is_chunkable(pygments.lexers.get_lexer_by_name("c"))
+    assert not chunks.is_chunkable(pygments.lexers.get_lexer_by_name("ruby"))
+    assert not chunks.is_chunkable(pygments.lexers.get_lexer_by_name("python", stripall=True))
+    assert not chunks.is_chunkable(pygments.lexers.get_lexer_by_name("html+php"))
+
+
+def test_can_cut_unterminated_comment_in_chunks():
+    # NOTE: The C lexer lexes an unterminated comment as a single token up to the end of the text.
+    lexer = pygments.lexers.get_lexer_by_name("c")
+    text = "x;\n/*\n" + "some comment\n" * 10_000
+    cut_positions = []
+    tokens = list(chunks.chunked_tokens(lexer, iter(_text_parts(text, 1000)), 250, 4000, cut_positions))
+    assert "".join(token_text for _, token_text in tokens) == text
+    assert len(cut_positions) >= 10
+    assert all(text[cut_position - 1] == "\n" for cut_position in cut_positions)
+    expected_tokens = list(lexer.get_tokens(text))
+    assert tokens[:3] == expected_tokens[:3]
+    assert expected_tokens[3][0] == pygments.token.Comment.Multiline
+    assert {token_type for token_type, _ in tokens[3:]} == {pygments.token.Comment.Multiline}
+
+
+def test_can_restart_in_string_state_in_chunks():
+    # NOTE: The Python lexer has a state for strings, in which it lexes each line separately.
+    lexer = pygments.lexers.get_lexer_by_name("python")
+    text = 'x = """\n' + "some text\n" * 10_000
+    cut_positions = []
+    tokens = list(chunks.chunked_tokens(lexer, iter(_text_parts(text, 1000)), 250, 4000, cut_positions))
+    assert tokens == list(lexer.get_tokens(text))
+    assert cut_positions == []
+
+
+def test_can_cut_long_line_in_chunks():
+    lexer = pygments.lexers.get_lexer_by_name("c")
+    text = "/* " + "x" * 10_000 + "\n"
+    cut_positions = []
+    tokens = list(chunks.chunked_tokens(lexer, iter(_text_parts(text, 1000)), 250, 4000, cut_positions))
+    assert "".join(token_text for _, token_text in tokens) == text
+    assert len(cut_positions) >= 1
+
+
+def test_can_lex_without_cut_if_lexer_gets_back_to_root_state():
+    lexer = pygments.lexers.get_lexer_by_name("c")
+    text = "/*\n" + "some comment\n" * 1_000 + "*/\nint x;\n" * 10
+    cut_positions = []
+    tokens = list(chunks.chunked_tokens(lexer, iter(_text_parts(text, 1000)), 250, 40_000, cut_positions))
+    assert tokens == list(lexer.get_tokens(text))
+    assert cut_positions == []
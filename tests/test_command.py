@@ -9,11 +9,14 @@ import contextlib
 import json
 import os
 import tempfile
+import time
 from xml.etree import ElementTree
 
+import git
 import pytest
 
 import pygount
+import pygount.timing
 from pygount import command
 from pygount.command import VALID_OUTPUT_FORMATS, Command
 from pygount.common import OptionError
@@ -227,3 +230,312 @@ class PygountCommandTest(TempFolderTest):
         file_elements = cloc_xml_root.findall("files/file[@language='HTML']")
         assert file_elements is not None
         assert len(file_elements) == 1
+
+    def test_can_analyze_in_parallel_with_same_result_as_sequential(self):
+        project_folder = os.path.join(self.tests_temp_folder, "project")
+        source_lines = ["# Duplicate source", "print('duplicate code')"]
+        self.create_temp_file(os.path.join("project", "original.py"), source_lines, do_create_folder=True)
+        self.create_temp_file(os.path.join("project", "duplicate.py"), source_lines)
+        self.create_temp_file(os.path.join("project", "empty.py"), "")
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        files_to_jobs_map = {}
+        for jobs in (1, 2):
+            exit_code = command.pygount_command(
+                ["--jobs", str(jobs), "--format=json", "--out", json_path, project_folder, PYGOUNT_SOURCE_FOLDER]
+            )
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                files_to_jobs_map[jobs] = json.load(json_file)["files"]
+        assert files_to_jobs_map[1] == files_to_jobs_map[2]
+        assert any(file_map["state"] == "duplicate" for file_map in files_to_jobs_map[2])
+
+    def test_can_stream_with_same_result_as_without(self):
+        project_folder = os.path.join(self.tests_temp_folder, "project")
+        source_lines = ["# Duplicate source", "print('duplicate code')"]
+        # "sub-folder.py" sorts before the files in "sub".
+        self.create_temp_file(os.path.join("project", "sub", "original.py"), source_lines, do_create_folder=True)
+        self.create_temp_file(os.path.join("project", "sub-folder.py"), source_lines)
+        self.create_temp_file(os.path.join("project", "sub.py"), source_lines)
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        files_maps = []
+        for options in (["--jobs=1"], ["--stream", "--jobs=1"], ["--stream", "--jobs=2"]):
+            exit_code = command.pygount_command(
+                [*options, "--format=json", "--out", json_path, project_folder, PYGOUNT_SOURCE_FOLDER]
+            )
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                files_maps.append(json.load(json_file)["files"])
+        assert files_maps[0] == files_maps[1] == files_maps[2]
+        project_file_maps = [file_map for file_map in files_maps[1] if file_map["group"] == "project"]
+        assert [
+            (os.path.relpath(file_map["path"], project_folder), file_map["stateInfo"]) for file_map in project_file_maps
+        ] == [
+            ("sub-folder.py", None),
+            ("sub.py", project_file_maps[0]["path"]),
+            (os.path.join("sub", "original.py"), project_file_maps[1]["path"]),
+        ]
+
+    def test_can_disambiguate_lexers_independent_of_jobs(self):
+        objective_c_lines = ["#import <Foundation/Foundation.h>", "@interface Some : NSObject", "@end"]
+        self.create_temp_file("mixed/a000.h", objective_c_lines, do_create_folder=True)
+        for number in range(1, 300):
+            self.create_temp_file(f"mixed/b{number:03d}.h", ["#include <stdio.h>", f"int some{number}(void);"])
+        mixed_folder = os.path.join(self.tests_temp_folder, "mixed")
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        jobs_to_languages_map = {}
+        # NOTE: Analyze with several jobs first, so forked workers cannot inherit lexers chosen by previous runs.
+        for options in (["--jobs=4", "--file-timeout=60"], ["--jobs=4"], ["--jobs=1"]):
+            exit_code = command.pygount_command([*options, "--format=json", "--out", json_path, mixed_folder])
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                jobs_to_languages_map[" ".join(options)] = [
+                    file_map["language"] for file_map in json.load(json_file)["files"]
+                ]
+        assert set(jobs_to_languages_map["--jobs=1"]) == {"Objective-C"}
+        assert jobs_to_languages_map["--jobs=4"] == jobs_to_languages_map["--jobs=1"]
+        assert jobs_to_languages_map["--jobs=4 --file-timeout=60"] == jobs_to_languages_map["--jobs=1"]
+
+    def test_fails_on_too_few_jobs(self):
+        exit_code = command.pygount_command(["--jobs", "0", tempfile.gettempdir()])
+        assert exit_code == 1
+
+    def test_can_analyze_git_ref_without_working_tree(self):
+        project_folder = os.path.join(self.tests_temp_folder, "project")
+        self.create_temp_file("project/some.py", ["# Some comment", "print('some')"], do_create_folder=True)
+        self.create_temp_file("project/same.py", ["# Some comment", "print('some')"])
+        self.create_temp_file("project/empty.py", "")
+        self.create_temp_binary_file("project/some.bin", b"\0\1\2")
+        self.create_temp_file("project/sub/other.c", ["int x; /* Other */"], do_create_folder=True)
+        self.create_temp_file("project/.skip/skip.py", ["skip = 1"], do_create_folder=True)
+        with git.Repo.init(project_folder) as repo:
+            repo.index.add(["some.py", "same.py", "empty.py", "some.bin", "sub/other.c", ".skip/skip.py"])
+            actor = git.Actor("Some Tester", "tester@example.com")
+            repo.index.commit("Add some files", author=actor, committer=actor)
+            bare_folder = os.path.join(self.tests_temp_folder, "bare.git")
+            repo.clone(bare_folder, bare=True).close()
+
+        def files_map(*options: str) -> dict[str, dict]:
+            json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+            exit_code = command.pygount_command(["--format=json", "--out", json_path, *options])
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                file_maps = json.load(json_file)["files"]
+            return {os.path.relpath(file_map.pop("path"), options[-1]): file_map for file_map in file_maps}
+
+        working_tree_files_map = files_map(project_folder)
+        # Changes to the working tree must not affect the analysis of the git tree.
+        self.create_temp_file("project/some.py", ["print('changed')"])
+        self.create_temp_file("project/added.py", ["print('added')"])
+        working_tree_files_map.pop(os.path.join(".skip", "skip.py"), None)
+        for options in (["--git-ref", "HEAD", project_folder], ["--git-ref", "HEAD", "--jobs", "2", bare_folder]):
+            git_files_map = files_map(*options)
+            if options[-1] == bare_folder:
+                for file_map in git_files_map.values():
+                    file_map["group"] = "project"
+                    if file_map["stateInfo"] is not None:
+                        file_map["stateInfo"] = file_map["stateInfo"].replace(bare_folder, project_folder)
+            assert git_files_map == working_tree_files_map
+
+    def test_can_analyze_git_ref_with_several_chunks_in_parallel(self):
+        project_folder = os.path.join(self.tests_temp_folder, "project")
+        relative_paths = []
+        for file_index in range(600):
+            # Headers and ".m" files need reading blobs in the main process to choose their lexer.
+            suffix = ("h", "m", "py", "c", "txt", "js")[file_index % 6]
+            relative_path = f"folder{file_index % 10}/some{file_index}.{suffix}"
+            self.create_temp_file(
+                f"project/{relative_path}", [f"int some{file_index};", "/* Comment */"] * 20, do_create_folder=True
+            )
+            relative_paths.append(relative_path)
+        with git.Repo.init(project_folder) as repo:
+            repo.index.add(relative_paths)
+            actor = git.Actor("Some Tester", "tester@example.com")
+            repo.index.commit("Add some files", author=actor, committer=actor)
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        jobs_to_files_map = {}
+        for jobs in ("2", "1"):
+            exit_code = command.pygount_command(
+                ["--format=json", "--out", json_path, "--git-ref", "HEAD", "--jobs", jobs, project_folder]
+            )
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                jobs_to_files_map[jobs] = json.load(json_file)["files"]
+        assert len(jobs_to_files_map["2"]) == len(relative_paths)
+        assert [file_map["path"] for file_map in jobs_to_files_map["2"] if file_map["state"] == "error"] == []
+        assert jobs_to_files_map["2"] == jobs_to_files_map["1"]
+
+    def test_can_analyze_git_files(self):
+        project_folder = os.path.join(self.tests_temp_folder, "project")
+        self.create_temp_file("project/some.py", ["print('some')"], do_create_folder=True)
+        self.create_temp_file("project/sub/other.c", ["int x; /* Other */"], do_create_folder=True)
+        self.create_temp_file("project/.gitignore", ["ignored/"])
+        with git.Repo.init(project_folder) as repo:
+            repo.index.add(["some.py", "sub/other.c", ".gitignore"])
+        self.create_temp_file("project/untracked.py", ["print('untracked')"])
+        self.create_temp_file("project/ignored/ignored.py", ["print('ignored')"], do_create_folder=True)
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        files_maps = []
+        for options in ([], ["--git-files"]):
+            exit_code = command.pygount_command([*options, "--format=json", "--out", json_path, project_folder])
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                files_maps.append(json.load(json_file)["files"])
+        scanned_files_map, git_files_map = files_maps
+        assert git_files_map == [
+            file_map for file_map in scanned_files_map if os.path.basename(file_map["path"]) != "ignored.py"
+        ]
+        assert len(git_files_map) == 3
+
+    def test_fails_on_git_files_with_git_ref(self):
+        exit_code = command.pygount_command(["--git-files", "--git-ref", "HEAD", PYGOUNT_PROJECT_FOLDER])
+        assert exit_code == 1
+
+    def test_fails_on_git_ref_with_revision_in_url(self):
+        exit_code = command.pygount_command(["--git-ref", "HEAD", "https://github.com/roskakori/pygount.git/v0.1"])
+        assert exit_code == 1
+
+    def test_can_use_fast_engine(self):
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        files_maps = []
+        for engine in pygount.analysis.VALID_ENGINES:
+            exit_code = command.pygount_command(
+                [f"--engine={engine}", "--format=json", "--out", json_path, PYGOUNT_SOURCE_FOLDER]
+            )
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                files_maps.append(json.load(json_file)["files"])
+        pygments_files_map, fast_files_map = files_maps
+        assert fast_files_map == pygments_files_map
+
+    def test_can_count_lines_only(self):
+        source_path = self.create_temp_file("some.py", ["# Some comment", "", "print('some')"])
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        exit_code = command.pygount_command(["--count-mode=lines", "--format=json", "--out", json_path, source_path])
+        assert exit_code == 0
+        with open(json_path, encoding="utf-8") as json_file:
+            [file_map] = json.load(json_file)["files"]
+        assert file_map["state"] == "counted"
+        assert (file_map["codeCount"], file_map["documentationCount"], file_map["emptyCount"]) == (2, 0, 1)
+
+    def test_can_skip_huge_files(self):
+        small_path = self.create_temp_file("small.py", ["print('some')"])
+        large_path = self.create_temp_file("large.py", ["print('some')"] * 100)
+        large_data_path = self.create_temp_file("large.json", ["[", *(["  1,"] * 100), "  1", "]"])
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        exit_code = command.pygount_command(
+            [
+                "--max-file-size=1K,json=0",
+                "--format=json",
+                "--out",
+                json_path,
+                small_path,
+                large_path,
+                large_data_path,
+            ]
+        )
+        assert exit_code == 0
+        with open(json_path, encoding="utf-8") as json_file:
+            result = json.load(json_file)
+        path_to_file_map = {os.path.basename(file_map["path"]): file_map for file_map in result["files"]}
+        assert path_to_file_map["small.py"]["state"] == "analyzed"
+        assert path_to_file_map["large.py"]["state"] == "huge"
+        assert path_to_file_map["large.py"]["language"] == "__huge__"
+        assert path_to_file_map["large.json"]["state"] == "analyzed"
+        assert "__huge__" in {language_map["language"] for language_map in result["languages"]}
+
+    def test_fails_on_broken_max_file_size(self):
+        exit_code = command.pygount_command(["--max-file-size", "many", PYGOUNT_PROJECT_FOLDER])
+        assert exit_code == 1
+
+    def test_can_analyze_with_file_limits(self):
+        source_path = self.create_temp_file("some.py", ["# Some comment", "print('some')"])
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        exit_code = command.pygount_command(
+            ["--file-timeout=60", "--file-memory-limit=8G", "--format=json", "--out", json_path, source_path]
+        )
+        assert exit_code == 0
+        with open(json_path, encoding="utf-8") as json_file:
+            result = json.load(json_file)
+        [file_map] = result["files"]
+        assert file_map["state"] == "analyzed"
+        assert result["runtime"]["slowFiles"] == []
+
+    def test_can_report_phases(self):
+        source_path = self.create_temp_file("some.py", ["# Some comment", "print('some')"])
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        for jobs in ("1", "2"):
+            exit_code = command.pygount_command(["--jobs", jobs, "--format=json", "--out", json_path, source_path])
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                phases_map = json.load(json_file)["runtime"]["phases"]
+            assert set(phases_map.keys()) == {phase.value for phase in pygount.timing.Phase}
+            assert phases_map["tokenizing"]["durationInSeconds"] > 0
+            [tokenizing_map] = phases_map["tokenizing"]["languages"]
+            assert tokenizing_map["language"] == "Python"
+            assert tokenizing_map["lineCount"] == 2
+            assert tokenizing_map["bytesPerSecond"] > 0
+
+    def test_fails_on_broken_file_limits(self):
+        assert command.pygount_command(["--file-timeout=0", PYGOUNT_PROJECT_FOLDER]) == 1
+        assert command.pygount_command(["--file-memory-limit=much", PYGOUNT_PROJECT_FOLDER]) == 1
+
+    def test_fails_on_negative_disambiguation_size(self):
+        exit_code = command.pygount_command(["--disambiguation-size", "-1", PYGOUNT_PROJECT_FOLDER])
+        assert exit_code == 1
+
+    def test_fails_on_git_ref_for_folder_without_git(self):
+        exit_code = command.pygount_command(["--git-ref", "HEAD", tempfile.gettempdir()])
+        assert exit_code == 1
+
+    def test_can_use_cache(self):
+        source_path = self.create_temp_file("some.py", ["# Some comment", "print('some')"])
+        an_hour_ago = time.time() - 3600
+        os.utime(source_path, (an_hour_ago, an_hour_ago))
+        cache_folder = os.path.join(self.tests_temp_folder, "cache")
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        cache_maps = []
+        for _ in range(2):
+            exit_code = command.pygount_command(
+                ["--cache-dir", cache_folder, "--format=json", "--out", json_path, source_path]
+            )
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                cache_maps.append(json.load(json_file)["runtime"]["cache"])
+        first_cache_map, second_cache_map = cache_maps
+        assert (first_cache_map["hitCount"], first_cache_map["missCount"]) == (0, 1)
+        assert (second_cache_map["hitCount"], second_cache_map["missCount"]) == (1, 0)
+
+    def test_can_share_content_cache_using_pack(self):
+        pack_path = os.path.join(self.tests_temp_folder, "pygount-cache.pack")
+        json_path = os.path.join(self.tests_temp_folder, "pygount.json")
+        cache_maps = []
+        for checkout_name, pack_option in (("checkout_1", "--cache-pack"), ("checkout_2", "--cache-restore")):
+            source_path = self.create_temp_file(
+                os.path.join(checkout_name, "some.py"), ["print('some')"], do_create_folder=True
+            )
+            cache_folder = os.path.join(self.tests_temp_folder, checkout_name + "_cache")
+            exit_code = command.pygount_command(
+                [
+                    "--cache-dir",
+                    cache_folder,
+                    "--cache-mode=content",
+                    pack_option,
+                    pack_path,
+                    "--format=json",
+                    "--out",
+                    json_path,
+                    source_path,
+                ]
+            )
+            assert exit_code == 0
+            with open(json_path, encoding="utf-8") as json_file:
+                cache_maps.append(json.load(json_file)["runtime"]["cache"])
+        first_cache_map, second_cache_map = cache_maps
+        assert (first_cache_map["hitCount"], first_cache_map["missCount"]) == (0, 1)
+        assert (second_cache_map["hitCount"], second_cache_map["missCount"]) == (1, 0)
+
+    def test_fails_on_cache_pack_without_content_cache_mode(self):
+        cache_folder = os.path.join(self.tests_temp_folder, "cache")
+        pack_path = os.path.join(self.tests_temp_folder, "pygount-cache.pack")
+        exit_code = command.pygount_command(["--cache-dir", cache_folder, "--cache-pack", pack_path, __file__])
+        assert exit_code == 1
@@ -68,6 +68,31 @@ def test_can_match_regex_from_multiple_default_shell_patterns():
     assert regexes[0].match("x") is not None
 
 
+def test_can_match_names_like_regexes():
+    names = ["", ".git", "_svn", "__pycache__", "a~", "some.py", "some.pyc", "x", "X", "some", "a.b"]
+    for patterns_text in (
+        ".?*, _svn, __pycache__",
+        ".*, *~",
+        "*",
+        "py, pyc",
+        "a.b, *.py, x*",
+        pygount.common.REGEX_PATTERN_PREFIX + r"x, ^.+\.py$",
+        pygount.common.REGEX_PATTERN_PREFIX + r"(?i)x, some",
+    ):
+        regexes = pygount.common.regexes_from(patterns_text)
+        name_matcher = pygount.common.NameMatcher(regexes)
+        for name in names:
+            expected_match = any(regex.match(name) is not None for regex in regexes)
+            assert name_matcher.matches(name) == expected_match, f"patterns_text={patterns_text!r}, name={name!r}"
+
+
+def test_can_match_names_without_regexes():
+    name_matcher = pygount.common.NameMatcher(pygount.common.regexes_from("__pycache__, *~"))
+    assert name_matcher._names == {"__pycache__"}  # noqa: SLF001
+    assert name_matcher._endings == ("~",)  # noqa: SLF001
+    assert name_matcher._other_regexes == []  # noqa: SLF001
+
+
 def test_can_represent_text_as_list():
     assert pygount.common.as_list("") == []
     assert pygount.common.as_list("a") == ["a"]
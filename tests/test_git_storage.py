@@ -1,6 +1,21 @@
+import os
 from pathlib import Path
 
-from pygount.git_storage import GitStorage, git_remote_url_and_revision_if_any
+import git
+
+from pygount.git_storage import (
+    GitStorage,
+    _git_dir_to_repo_map,
+    close_git_repos,
+    forget_inherited_git_repos,
+    git_blob_data,
+    git_dir_for,
+    git_remote_url_and_revision_if_any,
+    git_tree_entries,
+    git_work_tree_paths,
+)
+
+from ._common import TempFolderTest
 
 
 def test_can_extract_git_remote_url_and_revision_if_any():
@@ -33,3 +48,87 @@ def test_can_extract_and_close_and_find_files_from_cloned_git_remote_url_with_re
     finally:
         git_storage.close()
     assert not readme_path.exists()
+
+
+class GitTreeTest(TempFolderTest):
+    def setUp(self):
+        super().setUp()
+        self.project_folder = os.path.join(self.tests_temp_folder, "project")
+        self.create_temp_file("project/some.py", ["print('some')"], do_create_folder=True)
+        self.create_temp_file("project/sub/other.py", ["# Other"], do_create_folder=True)
+        os.symlink("some.py", os.path.join(self.project_folder, "link.py"))
+        with git.Repo.init(self.project_folder) as repo:
+            repo.index.add(["some.py", "sub/other.py", "link.py"])
+            actor = git.Actor("Some Tester", "tester@example.com")
+            repo.index.commit("Add some files", author=actor, committer=actor)
+        # Changes to the working tree must not affect the tree.
+        self.create_temp_file("project/some.py", ["print('changed')"])
+
+    def test_can_list_git_tree_entries(self):
+        git_tree_entries_by_path = {
+            git_tree_entry.relative_path: git_tree_entry
+            for git_tree_entry in git_tree_entries(self.project_folder, "HEAD")
+        }
+        assert sorted(git_tree_entries_by_path.keys()) == ["some.py", "sub/other.py"]
+        some_git_tree_entry = git_tree_entries_by_path["some.py"]
+        assert some_git_tree_entry.size == len("print('some')\n")
+        assert git_blob_data(git_dir_for(self.project_folder), some_git_tree_entry.blob_id) == b"print('some')\n"
+
+    def test_can_list_git_tree_entries_in_sub_folder(self):
+        relative_paths = [
+            git_tree_entry.relative_path
+            for git_tree_entry in git_tree_entries(os.path.join(self.project_folder, "sub"), "HEAD")
+        ]
+        assert relative_paths == ["other.py"]
+
+    def test_can_forget_inherited_git_repos(self):
+        git_dir = git_dir_for(self.project_folder)
+        with git.Repo(self.project_folder) as repo:
+            blob_id = repo.head.commit.tree["some.py"].hexsha
+        try:
+            assert git_blob_data(git_dir, blob_id) == b"print('some')\n"
+            inherited_repo = _git_dir_to_repo_map[git_dir]
+            forget_inherited_git_repos()
+            try:
+                assert _git_dir_to_repo_map == {}
+                assert git_blob_data(git_dir, blob_id) == b"print('some')\n"
+                assert _git_dir_to_repo_map[git_dir] is not inherited_repo
+                # The processes of the inherited repository still belong to the parent process.
+                assert inherited_repo.git.cat_file_all is not None
+            finally:
+                inherited_repo.close()
+        finally:
+            close_git_repos()
+
+    def test_can_extract_commit_without_working_tree(self):
+        with git.Repo(self.project_folder) as repo:
+            first_commit = repo.head.commit.hexsha
+            repo.index.add(["some.py"])
+            actor = git.Actor("Some Tester", "tester@example.com")
+            repo.index.commit("Change some file", author=actor, committer=actor)
+        for revision, expected_data in ((first_commit, b"print('some')\n"), (None, b"print('changed')\n")):
+            git_storage = GitStorage(self.project_folder, revision, is_bare=True)
+            try:
+                git_storage.extract()
+                git_tree_entries_by_path = {
+                    git_tree_entry.relative_path: git_tree_entry
+                    for git_tree_entry in git_tree_entries(git_storage.temp_folder, "HEAD")
+                }
+                assert sorted(git_tree_entries_by_path.keys()) == ["some.py", "sub/other.py"]
+                some_blob_id = git_tree_entries_by_path["some.py"].blob_id
+                assert git_blob_data(git_dir_for(git_storage.temp_folder), some_blob_id) == expected_data
+            finally:
+                git_storage.close()
+
+    def test_can_list_git_work_tree_paths(self):
+        self.create_temp_file("project/.gitignore", ["ignored/"])
+        self.create_temp_file("project/ignored/ignored.py", ["# Ignored"], do_create_folder=True)
+        self.create_temp_file("project/untracked.py", ["# Untracked"])
+        Path(self.project_folder, "sub", "other.py").unlink()
+        assert git_work_tree_paths(self.project_folder) == [".gitignore", "some.py", "untracked.py"]
+
+    def test_can_list_git_work_tree_paths_in_sub_folder(self):
+        assert git_work_tree_paths(os.path.join(self.project_folder, "sub")) == ["other.py"]
+
+    def test_can_detect_folder_without_git_work_tree(self):
+        assert git_work_tree_paths(os.path.join(self.project_folder, ".git")) is None
@@ -0,0 +1,158 @@
+"""
+Tests for the index to find pygments lexers for file names.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import dataclasses
+import json
+import os
+
+import pygments.lexers
+import pygments.util
+import pytest
+
+from pygount import lexer_index
+from pygount.lexer_index import LEXER_INDEX_NAME, DisambiguationStatistics, LexerIndex, LexerPool
+
+from ._common import PYGOUNT_PROJECT_FOLDER, TempFolderTest
+
+_NAMES_TO_CHECK = [
+    "",
+    ".bashrc",
+    "CMakeLists.txt",
+    "Makefile",
+    "a.",
+    "build.gradle.kts",
+    "no_suffix",
+    "some.H",
+    "some.c",
+    "some.d.ts",
+    "some.h",
+    "some.html",
+    "some.inc",
+    "some.m",
+    "some.pl",
+    "some.py",
+    "some.tar.gz",
+    "some.txt",
+    "some.xml",
+    "some~",
+]
+
+
+def _guessed_lexer_name(guess_lexer_for_filename, name: str, text: str, **options):
+    try:
+        result = type(guess_lexer_for_filename(name, text, **options)).__name__
+    except pygments.util.ClassNotFound:
+        result = None
+    return result
+
+
+def test_can_find_same_lexers_as_pygments():
+    index = LexerIndex.build()
+    names_to_check = _NAMES_TO_CHECK + os.listdir(PYGOUNT_PROJECT_FOLDER)
+    for name in names_to_check:
+        assert index.has_lexer(name) == (pygments.lexers.find_lexer_class_for_filename(name) is not None), name
+        for text in ("", "#!/bin/sh\necho hello\n", "<?xml version='1.0'?><some/>\n"):
+            assert _guessed_lexer_name(
+                index.guess_lexer_for_filename, name, text, disambiguation_size=0
+            ) == _guessed_lexer_name(pygments.lexers.guess_lexer_for_filename, name, text), (
+                f"name={name!r}, text={text!r}"
+            )
+
+
+_MATLAB_TEXT = "function y = some(x)\n  y = x;\nend\n"
+
+
+def test_can_disambiguate_lexers_using_start_of_text():
+    index = LexerIndex.build()
+    assert type(index.guess_lexer_for_filename("some/some.m", _MATLAB_TEXT)).__name__ == "MatlabLexer"
+    assert (
+        type(index.guess_lexer_for_filename("other/some.m", "\n" * 10 + _MATLAB_TEXT, disambiguation_size=5)).__name__
+        == "ObjectiveCLexer"
+    )
+
+
+def test_can_reuse_disambiguated_lexer_for_same_folder_and_suffix():
+    index = LexerIndex.build()
+    disambiguation_statistics_before = dataclasses.replace(lexer_index.disambiguation_statistics())
+    matlab_lexer = index.guess_lexer_for_filename("some/some.m", _MATLAB_TEXT)
+    assert index.guess_lexer_for_filename("some/other.m", "") is matlab_lexer
+    assert index.guess_lexer_for_filename("other/other.m", "") is not matlab_lexer
+    assert index.guess_lexer_for_filename("some/other.m", "", disambiguation_size=0) is not matlab_lexer
+    disambiguation_statistics = lexer_index.disambiguation_statistics().difference(disambiguation_statistics_before)
+    assert disambiguation_statistics == DisambiguationStatistics(analyzed_count=3, reused_count=1)
+
+
+def test_can_pass_disambiguation_decisions_to_other_index():
+    index = LexerIndex.build()
+    assert index.disambiguation_key("some/some.py") is None
+    disambiguation_key = index.disambiguation_key("some/some.m")
+    assert disambiguation_key == ("some", ".m")
+    assert not index.has_decision(disambiguation_key)
+    matlab_lexer = index.guess_lexer_for_filename("some/some.m", _MATLAB_TEXT)
+    assert index.has_decision(disambiguation_key)
+    decisions = index.decisions([disambiguation_key, ("other", ".m")])
+    assert decisions == {disambiguation_key: ("pygments.lexers.matlab", "MatlabLexer")}
+    other_index = LexerIndex.build()
+    other_index.add_decisions(decisions)
+    assert other_index.guess_lexer_for_filename("some/other.m", "@interface Some\n@end\n") is matlab_lexer
+
+
+def test_can_find_lexers_in_small_index():
+    index = LexerIndex(
+        [("pygments.lexers.python", "PythonLexer")], [("*.py", 0, False), ("SConstruct", 0, False), ("*.x?", 0, True)]
+    )
+    assert index.has_lexer("some/SConstruct")
+    assert not index.has_lexer("some.xy")
+    assert type(index.guess_lexer_for_filename("some.xy", "")).__name__ == "PythonLexer"
+    with pytest.raises(pygments.util.ClassNotFound):
+        index.guess_lexer_for_filename("some.txt", "")
+
+
+def test_can_reuse_lexers_from_pool():
+    lexer_pool = LexerPool(2)
+    python_lexer = lexer_pool.lexer(pygments.lexers.PythonLexer)
+    assert lexer_pool.lexer(pygments.lexers.PythonLexer) is python_lexer
+    assert lexer_pool.lexer(pygments.lexers.PythonLexer, stripnl=False) is not python_lexer
+    assert len(lexer_pool) == 2
+
+
+def test_can_evict_least_recently_used_lexer_from_pool():
+    lexer_pool = LexerPool(2)
+    python_lexer = lexer_pool.lexer(pygments.lexers.PythonLexer)
+    c_lexer = lexer_pool.lexer(pygments.lexers.CLexer)
+    assert lexer_pool.lexer(pygments.lexers.PythonLexer) is python_lexer
+    lexer_pool.lexer(pygments.lexers.JavaLexer)
+    assert len(lexer_pool) == 2
+    assert lexer_pool.lexer(pygments.lexers.PythonLexer) is python_lexer
+    assert lexer_pool.lexer(pygments.lexers.CLexer) is not c_lexer
+
+
+def test_can_guess_same_lexer_instance_for_files_of_same_kind():
+    index = LexerIndex.build()
+    assert index.guess_lexer_for_filename("some.py", "") is index.guess_lexer_for_filename("other.py", "")
+
+
+class LexerIndexTest(TempFolderTest):
+    def test_can_store_and_load_lexer_index(self):
+        cache_folder = os.path.join(self.tests_temp_folder, "cache")
+        built_index = lexer_index.load_lexer_index(cache_folder)
+        assert lexer_index.lexer_index() is built_index
+        index_path = os.path.join(cache_folder, LEXER_INDEX_NAME)
+        assert os.path.exists(index_path)
+        loaded_index = lexer_index.load_lexer_index(cache_folder)
+        assert loaded_index is not built_index
+        assert loaded_index.to_json() == built_index.to_json()
+
+    def test_can_rebuild_outdated_lexer_index(self):
+        cache_folder = os.path.join(self.tests_temp_folder, "cache")
+        os.makedirs(cache_folder)
+        index_path = os.path.join(cache_folder, LEXER_INDEX_NAME)
+        with open(index_path, "w", encoding="utf-8") as index_file:
+            json.dump({"key": ["0.0"], "lexers": [], "patterns": []}, index_file)
+        index = lexer_index.load_lexer_index(cache_folder)
+        assert index.has_lexer("some.py")
+        with open(index_path, encoding="utf-8") as index_file:
+            assert json.load(index_file)["key"] != ["0.0"]
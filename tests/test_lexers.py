@@ -111,3 +111,42 @@ def test_can_lex_plain_text():
     )
     text_tokens = list(lexer.get_tokens(text))
     assert text_tokens == [(token.Token.Comment.Single, "a\n"), (token.Token.Text, "\n \t \n  \n")]
+
+
+def test_can_lex_comments_and_strings_minimalistically():
+    lexer = pygount.lexers.minimalistic_lexer("C")
+    assert lexer.name == "C"
+    text_tokens = list(lexer.get_tokens('/* some\n * comment */\nint x = f("s\\"", \'c\'); // x\n'))
+    assert [token_type for token_type, token_text in text_tokens if not token_text.isspace()] == [
+        token.Comment.Multiline,
+        token.Name,
+        token.Name,
+        token.Operator,
+        token.Name,
+        token.Operator,
+        token.String,
+        token.Operator,
+        token.String,
+        token.Operator,
+        token.Operator,
+        token.Comment.Single,
+    ]
+
+
+def test_can_lex_unterminated_comments_and_strings_minimalistically():
+    lexer = pygount.lexers.minimalistic_lexer("Python")
+    assert list(lexer.get_tokens('"""some\nstring')) == [(token.String, '"""some\nstring\n')]
+    lexer = pygount.lexers.minimalistic_lexer("SQL")
+    assert list(lexer.get_tokens("/* some\ncomment")) == [(token.Comment.Multiline, "/* some\ncomment\n")]
+
+
+def test_can_lex_unknown_language_minimalistically():
+    lexer = pygount.lexers.minimalistic_lexer("Some")
+    assert list(lexer.get_tokens("x # y")) == [
+        (token.Name, "x"),
+        (token.Text, " "),
+        (token.Operator, "#"),
+        (token.Text, " "),
+        (token.Name, "y"),
+        (token.Text, "\n"),
+    ]
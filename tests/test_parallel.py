@@ -0,0 +1,108 @@
+"""
+Tests for parallel analysis of source code.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from pygount import analysis, parallel
+from pygount.parallel import _chunks
+
+from ._common import PYGOUNT_SOURCE_FOLDER, TempFolderTest
+
+
+def test_can_compute_usable_cpu_count():
+    assert parallel.usable_cpu_count() >= 1
+
+
+def _vm_size() -> int:
+    with open("/proc/self/status", encoding="ascii") as status_file:
+        for line in status_file:
+            if line.startswith("VmSize:"):
+                return int(line.split()[1]) * 1024
+    raise AssertionError("cannot find VmSize")
+
+
+_is_forking = multiprocessing.get_start_method() == "fork"
+
+
+@pytest.mark.skipif(not _is_forking, reason="workers must inherit the patched analysis")
+@pytest.mark.parametrize(
+    "name, reason_start",
+    [
+        ("crashing.py", "analysis crashed with exit code 3"),
+        ("hungry.py", "analysis exceeded memory limit of "),
+        ("slow.py", "analysis exceeded time limit of 2.0 seconds"),
+    ],
+)
+def test_can_stop_isolated_analysis(tmp_path, monkeypatch, name, reason_start):
+    original_from_path_data = analysis.SourceAnalysis.from_path_data
+
+    def patched_from_path_data(path_data, **analysis_options):
+        source_name = os.path.basename(path_data.source_path)
+        if source_name == "crashing.py":
+            os._exit(3)
+        elif source_name == "hungry.py":
+            _ = bytearray(1024**3)
+        elif source_name == "slow.py":
+            time.sleep(60)
+        return original_from_path_data(path_data, **analysis_options)
+
+    # Let the workers inherit the lexer index and the imported lexers, so their first analysis is fast enough.
+    original_from_path_data(analysis.PathData(__file__, "test"))
+    monkeypatch.setattr(analysis.SourceAnalysis, "from_path_data", staticmethod(patched_from_path_data))
+    path_datas = []
+    for source_name in ["before.py", name, "after.py"]:
+        source_path = tmp_path / source_name
+        source_path.write_text("pass\n", encoding="utf-8")
+        path_datas.append(analysis.PathData(str(source_path), "test"))
+    slow_files = []
+    file_memory_limit = _vm_size() + 256 * 1024**2 if name == "hungry.py" else None
+    source_analyses = list(
+        parallel.isolated_source_analyses(path_datas, 2, 2.0, file_memory_limit, slow_files=slow_files)
+    )
+    assert [source_analysis.state for source_analysis in source_analyses] == [
+        analysis.SourceState.analyzed,
+        analysis.SourceState.error,
+        analysis.SourceState.analyzed,
+    ]
+    assert source_analyses[1].state_info.startswith(reason_start)
+    [slow_file] = slow_files
+    assert slow_file == parallel.SlowFile(path_datas[1].source_path, "Python", source_analyses[1].state_info)
+
+
+class ParallelTest(TempFolderTest):
+    def test_can_bundle_small_files_in_chunks(self):
+        small_paths = [self.create_temp_file(f"small_{index}.py", "pass") for index in range(3)]
+        large_path = self.create_temp_file("large.py", "x = 1\n" * (parallel.SMALL_FILE_SIZE // 4))
+        path_datas = [analysis.PathData(path, "test") for path in [*small_paths, large_path, small_paths[0]]]
+        chunks = list(_chunks(path_datas))
+        assert [len(chunk) for chunk in chunks] == [3, 1, 1]
+
+    def test_can_analyze_in_same_order_as_sequential(self):
+        with analysis.SourceScanner([PYGOUNT_SOURCE_FOLDER]) as scanner:
+            path_datas = list(scanner.source_paths())
+        expected_analyses = [
+            analysis.SourceAnalysis.from_file(path_data.source_path, path_data.group) for path_data in path_datas
+        ]
+        actual_analyses = list(parallel.source_analyses(path_datas, 2))
+        assert [repr(source_analysis) for source_analysis in actual_analyses] == [
+            repr(source_analysis) for source_analysis in expected_analyses
+        ]
+        assert os.path.basename(actual_analyses[0].path) == os.path.basename(path_datas[0].source_path)
+
+    def test_can_analyze_isolated_in_same_order_as_sequential(self):
+        with analysis.SourceScanner([PYGOUNT_SOURCE_FOLDER]) as scanner:
+            path_datas = list(scanner.source_paths())
+        expected_analyses = [
+            analysis.SourceAnalysis.from_file(path_data.source_path, path_data.group) for path_data in path_datas
+        ]
+        actual_analyses = list(parallel.isolated_source_analyses(path_datas, 2, file_timeout=60))
+        assert [repr(source_analysis) for source_analysis in actual_analyses] == [
+            repr(source_analysis) for source_analysis in expected_analyses
+        ]
@@ -0,0 +1,184 @@
+"""
+Tests for the fast scanners to classify lines, which must yield the same marks
+as lexing with pygments.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import glob
+import os
+
+import pygments.lexers
+import pytest
+
+from pygount import scanners
+from pygount.analysis import _line_marks, white_characters, white_code_words
+
+from ._common import PYGOUNT_PROJECT_FOLDER, PYGOUNT_SOURCE_FOLDER
+
+_PYTHON_TEXTS = [
+    "",
+    "\n",
+    "pass\n",
+    "x = 1  # comment\n\n\n",
+    '"""Module docstring."""\nimport os\n',
+    'def some():\n    """\n    Docstring\n    spanning lines.\n    """\n    return 1\n',
+    "def some():\n    r'''Raw docstring with \\''' quote.'''\n    pass\n",
+    'x = (\n    "implicitly"\n    "concatenated"\n)\n',
+    's = "a # not a comment"  # but this is\n',
+    "s = b'\\x00' + rb'\\d' + u'\\N{BULLET}'\n",
+    "f = f\"{x!r:>{width}} {y['key']} {{literal}}\"\n",
+    'f = f"""\n{\n    x  # comment\n}\n"""\n',
+    'f = f"{x:{"nested"}}"\n',
+    "s = 'unterminated\nx = 1\n",
+    "s = '%s and %(name)d' % values\n",
+    "match command:\n    case [x, y]:\n        pass\n    case _:\n        pass\n",
+    "class Some:\n    '''Docstring'''\n\n    x: int = 1\n",
+    "x = [\n    1,\n    2,\n]\n",
+    "if x:\n    '''Not a docstring but a string.'''\n",
+    "x = 0x1f + 1_000 + 1e-3j\n",
+    "# -*- coding: utf-8 -*-\n#!/usr/bin/env python\n",
+    "\ttabbed = 1\r\nwindows = 2\r\n",
+    "\ufeffbom = 1\n",
+]
+
+_C_TEXTS = [
+    "int x;\n",
+    "/* comment */ int x; // line comment\n",
+    "/*\n * Multiline\n * comment\n */\nint x;\n",
+    '#include "some.h"\n#include <stdio.h> /* comment */\n',
+    "#define SOME(x) \\\n    ((x) + 1)\n",
+    "#if 0\nint disabled;\n#if 1\nint nested;\n#endif\n#else\nint enabled;\n#endif\n",
+    '  /* leading */ #pragma once\nconst char *s = "string \\" with quote";\n',
+    "char c = '\\n'; char d = 'x';\n",
+    'const wchar_t *w = L"wide"; const char *u = u8"utf";\n',
+    "int main(void)\n{\n    return 0;\n}\n",
+    "int some(int a, // first\n         int b); // second\n",
+    'const char *s = "line \\\ncontinued";\n',
+    "// comment \\\ncontinued\nint x;\n",
+    "x = a / b / c;\n",
+    "/* unclosed comment\nint x;\n",
+    "label:\n    goto label;\n",
+]
+
+_CPP_TEXTS = [
+    *_C_TEXTS,
+    'auto s = R"(raw "string")"; auto t = R"delimiter(raw)delimiter";\n',
+    "int x = 1'000'000; char c = 'c';\n",
+    "namespace some {\ntemplate <typename T> class Some { };\n}\n",
+    'auto u = u8R"(raw\nspanning)";\n',
+]
+
+_CSHARP_TEXTS = [
+    "using System;\n\nnamespace Some\n{\n    class Some { }\n}\n",
+    '/// <summary>Documentation</summary>\nvar s = @"verbatim ""quoted""\nstring";\n',
+    "var i = $\"interpolated {x}\"; var c = 'c';\n",
+    "#region Some\nint x;\n#endregion\n",
+    '[Obsolete("attribute")]\nvoid Some() { }\n',
+    "/* comment */ int x; // line comment\n",
+]
+
+_GO_TEXTS = [
+    'package main\n\nimport "fmt"\n',
+    'func main() {\n\tfmt.Println("hello") // greet\n}\n',
+    "var s = `raw\nstring`\n",
+    "var r = 'x'\nvar e = '\\n'\n",
+    "/*\nblock\n*/\nvar x = 1\n",
+    "var x = a / b\n",
+]
+
+_JAVA_TEXTS = [
+    "package some;\n\nimport java.util.List;\n",
+    "/**\n * Javadoc.\n */\npublic class Some {\n}\n",
+    "String s = \"string\"; char c = 'c'; // comment\n",
+    'String t = """\n    text block with "quotes"\n    """;\n',
+    "var x = a / b;\n",
+    "record Point(int x, int y) { }\n",
+    '@Override\npublic String toString() { return ""; }\n',
+]
+
+_JAVASCRIPT_TEXTS = [
+    "#!/usr/bin/env node\nconst x = 1;\n",
+    "const s = 'single' + \"double\"; // comment\n",
+    "const t = `template ${x + `nested ${y}`} end`;\n",
+    "const t = `multiline\ntemplate`;\n",
+    "const r = /regex[/]with\\/slashes/g.test(s);\n",
+    "const d = a / b / c;\n",
+    "const d = (a) / 2; const r = [/x/];\n",
+    "if (x) /regex/.test(y);\n",
+    "return /regex/;\n",
+    "x = y\n/regex/g.exec(z)\n",
+    "/* block\n   comment */ x++ / 2;\n",
+    "<!-- html comment\nx = 1;\n",
+    "const o = {a: 1, b: 'c'};\n}\n/x/;\n",
+    "x = a++ /b/ c;\n",
+    "const u = 'unterminated\nx = 1;\n",
+]
+
+_TYPESCRIPT_TEXTS = [
+    *_JAVASCRIPT_TEXTS,
+    "function some(x: number): string { return `${x}`; }\n",
+    "interface Some {\n    x?: number; // optional\n}\n",
+    "declare module 'some' {\n    export const x: number;\n}\n",
+    "@decorator\nclass Some { private x = a / b; }\n",
+]
+
+_LANGUAGE_AND_TEXTS = [
+    *(("C", text) for text in _C_TEXTS),
+    *(("C++", text) for text in _CPP_TEXTS),
+    *(("C#", text) for text in _CSHARP_TEXTS),
+    *(("Go", text) for text in _GO_TEXTS),
+    *(("Java", text) for text in _JAVA_TEXTS),
+    *(("JavaScript", text) for text in _JAVASCRIPT_TEXTS),
+    *(("Python", text) for text in _PYTHON_TEXTS),
+    *(("TypeScript", text) for text in _TYPESCRIPT_TEXTS),
+]
+
+
+def _lexer_for(language: str) -> pygments.lexer.Lexer:
+    return pygments.lexers.get_lexer_by_name(language.lower(), stripnl=False, ensurenl=False)
+
+
+def _fast_line_marks(lexer: pygments.lexer.Lexer, text: str):
+    language_id = lexer.name.lower()
+    white_text = " \f\n\r\t" + white_characters(language_id)
+    return scanners.line_marks(lexer, text, white_text, white_code_words(language_id))
+
+
+@pytest.mark.parametrize("language, text", _LANGUAGE_AND_TEXTS)
+def test_can_mark_lines_like_pygments(language, text):
+    lexer = _lexer_for(language)
+    assert lexer.name == language
+    expected_line_marks = _line_marks(lexer, text)
+    assert _line_marks(lexer, text, engine="fast") == expected_line_marks
+    fast_line_marks = _fast_line_marks(lexer, text)
+    if text.endswith("\n"):
+        assert fast_line_marks == expected_line_marks
+    else:
+        assert fast_line_marks is None
+
+
+def test_can_mark_lines_of_own_source_code_like_pygments():
+    lexer = _lexer_for("Python")
+    source_paths = glob.glob(os.path.join(PYGOUNT_SOURCE_FOLDER, "*.py")) + glob.glob(
+        os.path.join(PYGOUNT_PROJECT_FOLDER, "tests", "*.py")
+    )
+    assert len(source_paths) >= 2
+    for source_path in source_paths:
+        with open(source_path, encoding="utf-8") as source_file:
+            text = source_file.read()
+        assert _fast_line_marks(lexer, text) == _line_marks(lexer, text), source_path
+
+
+def test_can_bail_out_on_ambiguous_code():
+    lexer = _lexer_for("C")
+    text = "int some(int a // comment)\n) {\n}\n"
+    assert _fast_line_marks(lexer, text) is None
+    assert _line_marks(lexer, text, engine="fast") == _line_marks(lexer, text)
+
+
+def test_can_detect_scanners():
+    assert scanners.has_scanner("Python")
+    assert scanners.has_scanner("TypeScript")
+    assert not scanners.has_scanner("Rust")
+    assert _fast_line_marks(_lexer_for("Rust"), "fn main() {}\n") is None
@@ -0,0 +1,90 @@
+"""
+Tests for timing the phases of an analysis.
+"""
+
+# Copyright (c) 2016-2024, Thomas Aglassinger.
+# All rights reserved. Distributed under the BSD License.
+import time
+
+from pygount.timing import Phase, PhaseStatistics, PhaseTimer, phase_statistics, timed, timed_items
+
+
+def test_can_time_phases():
+    phase_statistics_before = phase_statistics().copy()
+    with PhaseTimer(Phase.tokenizing) as tokenizing_timer:
+        time.sleep(0.01)
+    time_spent = phase_statistics().difference(phase_statistics_before)
+    assert time_spent.duration(Phase.tokenizing) == tokenizing_timer.duration
+    assert tokenizing_timer.duration >= 0.01
+    assert time_spent.duration(Phase.scanning) == 0.0
+
+
+def test_can_time_nested_phases():
+    phase_statistics_before = phase_statistics().copy()
+    with PhaseTimer(Phase.tokenizing) as tokenizing_timer:
+        with PhaseTimer(Phase.encoding_detection) as encoding_detection_timer:
+            time.sleep(0.02)
+        time.sleep(0.01)
+    time_spent = phase_statistics().difference(phase_statistics_before)
+    assert encoding_detection_timer.duration >= 0.02
+    assert 0.01 <= tokenizing_timer.duration < encoding_detection_timer.duration
+    assert time_spent.duration(Phase.encoding_detection) == encoding_detection_timer.duration
+    assert time_spent.duration(Phase.tokenizing) == tokenizing_timer.duration
+
+
+def test_can_time_functions():
+    @timed(Phase.lexer_guessing)
+    def some_function(some):
+        """Some docstring."""
+        return some + 1
+
+    phase_statistics_before = phase_statistics().copy()
+    assert some_function(1) == 2
+    assert some_function.__doc__ == "Some docstring."
+    assert phase_statistics().difference(phase_statistics_before).duration(Phase.lexer_guessing) > 0
+
+
+def test_can_time_items():
+    def some_items():
+        yield 1
+        yield 2
+
+    phase_statistics_before = phase_statistics().copy()
+    assert list(timed_items(Phase.scanning, some_items())) == [1, 2]
+    assert phase_statistics().difference(phase_statistics_before).duration(Phase.scanning) > 0
+
+
+def test_can_close_timed_items():
+    is_closed = False
+
+    def some_items():
+        nonlocal is_closed
+        try:
+            yield 1
+            yield 2
+        finally:
+            is_closed = True
+
+    items = timed_items(Phase.scanning, some_items())
+    assert next(items) == 1
+    items.close()
+    assert is_closed
+
+
+def test_can_add_and_subtract_phase_statistics():
+    phase_statistics = PhaseStatistics()
+    phase_statistics.add_duration(Phase.writing, 1.0)
+    phase_statistics.add_tokenizing("Python", 2.0, 1000, 100)
+    phase_statistics_before = phase_statistics.copy()
+    other_phase_statistics = PhaseStatistics()
+    other_phase_statistics.add_duration(Phase.scanning, 0.5)
+    other_phase_statistics.add_tokenizing("Python", 2.0, 3000, 300)
+    other_phase_statistics.add_tokenizing("SQL", 1.0, 500, 20)
+    phase_statistics.add(other_phase_statistics)
+    assert phase_statistics.duration(Phase.writing) == 1.0
+    assert phase_statistics.duration(Phase.scanning) == 0.5
+    python_statistics = phase_statistics.language_to_tokenizing_statistics_map["Python"]
+    assert python_statistics.bytes_per_second == 1000.0
+    assert python_statistics.lines_per_second == 100.0
+    assert phase_statistics.difference(phase_statistics_before) == other_phase_statistics
+    assert phase_statistics_before.duration(Phase.scanning) == 0.0
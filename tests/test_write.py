@@ -12,7 +12,7 @@ from xml.etree import ElementTree
 
 import pytest
 
-from pygount import analysis, write
+from pygount import analysis, parallel, write
 
 from ._common import TempFolderTest
 
@@ -110,6 +110,15 @@ class SummaryWriterTest(TempFolderTest):
         assert sum_total_data.comment_count == 100
         assert sum_total_data.comment_percentage == pytest.approx(8.9)
 
+    def test_can_write_slow_files(self):
+        summary_path = Path(self.tests_temp_folder, "summary.tmp")
+        with summary_path.open("w", encoding="utf-8") as summary_file, write.SummaryWriter(summary_file) as writer:
+            writer.add(analysis.SourceAnalysis.from_state("slow.py", "some", analysis.SourceState.error, "too slow"))
+            writer.slow_files = [parallel.SlowFile("slow.py", "Python", "too slow")]
+        summary_text = summary_path.read_text(encoding="utf-8")
+        assert "Slow files" in summary_text
+        assert re.search(r"slow\.py\s+.\s+Python\s+.\s+too slow", summary_text) is not None
+
     def _summary_lines_for(self, source_analyses):
         # NOTE: We need to write to a file because the lines containing the
         # actual data are only available during close() at which point they